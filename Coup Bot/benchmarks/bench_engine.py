@@ -0,0 +1,322 @@
+'''
+File: bench_engine.py
+Author: Gavin Vogt
+This program times the game engine's hot paths (the methods every command
+and every summary goes through) and saves the results as JSON named after
+the commit they were measured at, so they can be compared with
+benchmarks/compare.py. Run from the `Coup Bot` folder with
+`python -m benchmarks.bench_engine [--filter NAME] [--repeat N] [--no-save]`
+'''
+
+# dependencies
+from datetime import datetime
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+
+# my code
+from classes.coup_game import CoupGame
+from testing.fake_discord import FakeDiscord, FakeContext
+
+
+PLAYERS_PER_GAME = 6
+REPEAT_DEFAULT = 5
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+RESULTS_VERSION = 1     # increases when the format of the results file changes
+
+
+def make_game(hub, num_players=PLAYERS_PER_GAME):
+    '''
+    Creates a started game in its action stage, with a player's turn set
+    hub: FakeDiscord to create the players' users in
+    num_players: int, representing the number of players
+    Return: CoupGame
+    '''
+    users = [hub.add_user(f"player{i}") for i in range(num_players)]
+    game = CoupGame(users[0].id)
+    for user in users:
+        game.sign_up_player(user)
+    game.initialize_game()
+    game.set_turn_to(users[0].id)
+    return game
+
+def make_games(hub, num_games):
+    '''
+    Creates started games, for benchmarks that change the game they run on
+    hub: FakeDiscord to create the players' users in
+    num_games: int, representing the number of games
+    Return: list of CoupGame
+    '''
+    return [make_game(hub) for _ in range(num_games)]
+
+
+########################## BENCHMARKS #####################
+# Each benchmark takes the FakeDiscord and the number of times to run
+# the operation, sets up what it needs, and returns the seconds it took
+# to run the operation that many times (not counting the set up)
+
+def bench_swap_cards(hub, number):
+    '''
+    Swaps one of a player's cards with the draw pile, like an exchange
+    or a lost challenge does
+    '''
+    game = make_game(hub)
+    player = game.get_turn()
+    start = time.perf_counter()
+    for _ in range(number):
+        game.swap_cards(player, {player[0].type: 1})
+    return time.perf_counter() - start
+
+def bench_get_pending_players(hub, number):
+    '''
+    Finds the players the game is waiting on, with one of them pending
+    '''
+    game = make_game(hub)
+    game.get_next_turn().must_kill = 1
+    start = time.perf_counter()
+    for _ in range(number):
+        game.get_pending_players()
+    return time.perf_counter() - start
+
+def bench_turn_can_complete(hub, number):
+    '''
+    Checks whether the turn can end, which is_turn() does for every action
+    '''
+    game = make_game(hub)
+    start = time.perf_counter()
+    for _ in range(number):
+        game.turn_can_complete()
+    return time.perf_counter() - start
+
+def bench_summary_embed(hub, number):
+    '''
+    Builds the game summary shown after every turn
+    '''
+    game = make_game(hub)
+    start = time.perf_counter()
+    for _ in range(number):
+        game.summary_embed()
+    return time.perf_counter() - start
+
+def bench_life_count(hub, number):
+    '''
+    Counts a player's live cards
+    '''
+    player = make_game(hub).get_turn()
+    start = time.perf_counter()
+    for _ in range(number):
+        player.life_count()
+    return time.perf_counter() - start
+
+def bench_has(hub, number):
+    '''
+    Checks whether a player has a card, like every challenge does
+    '''
+    player = make_game(hub).get_turn()
+    start = time.perf_counter()
+    for _ in range(number):
+        player.has('duke')
+    return time.perf_counter() - start
+
+def bench_next_turn(hub, number):
+    '''
+    Moves the game on to the next player's turn
+    '''
+    game = make_game(hub)
+    start = time.perf_counter()
+    for _ in range(number):
+        game.next_turn()
+    return time.perf_counter() - start
+
+def bench_remove_player(hub, number):
+    '''
+    Removes the player whose turn it is from a game (each game is used once)
+    '''
+    games = make_games(hub, number)
+    user_ids = [game.get_turn().get_id() for game in games]
+    start = time.perf_counter()
+    for game, user_id in zip(games, user_ids):
+        game.remove_player(user_id)
+    return time.perf_counter() - start
+
+def bench_draw_card(hub, number):
+    '''
+    Draws a card from the pile and puts it back on top
+    '''
+    game = make_game(hub)
+    start = time.perf_counter()
+    for _ in range(number):
+        game.add_card(game.draw_card())
+    return time.perf_counter() - start
+
+def bench_shuffle(hub, number):
+    '''
+    Shuffles the draw pile, which every swap does
+    '''
+    game = make_game(hub)
+    start = time.perf_counter()
+    for _ in range(number):
+        game.shuffle()
+    return time.perf_counter() - start
+
+def bench_checks_pass(hub, number):
+    '''
+    Runs the checks on `income` for the player whose turn it is
+    '''
+    return _time_checks(hub, number, 'income', its_turn=True)
+
+def bench_checks_reject(hub, number):
+    '''
+    Runs the checks on `income` for a player whose turn it is not, which
+    fails on is_turn()
+    '''
+    return _time_checks(hub, number, 'income', its_turn=False)
+
+def _time_checks(hub, number, command_name, its_turn):
+    '''
+    Times running a command's checks the way the bot does before every
+    command (the global checks, the cog's checks, then the command's)
+    command_name: str, representing the command whose checks to run
+    its_turn: bool, representing whether the author is the player whose turn it is
+    '''
+    # imported here so the engine benchmarks can run without the cogs
+    from discord.ext import commands
+    from coup_bot import CoupBot
+
+    bot = CoupBot(command_prefix="c!", metrics_port=0)
+    hub.attach(bot)
+    channel = hub.add_channel(hub.add_guild())
+    game = make_game(hub)
+    bot.set_game(channel.id, game)
+    author = (game.get_turn() if its_turn else game.get_next_turn()).get_user()
+    command = bot.get_command(command_name)
+
+    async def run():
+        ctx = await bot.get_context(hub.make_message(author, channel, f"c!{command_name}"),
+                                    cls=FakeContext)
+        start = time.perf_counter()
+        for _ in range(number):
+            try:
+                await command.can_run(ctx)
+            except commands.CheckFailure:
+                pass
+        return time.perf_counter() - start
+
+    try:
+        return bot.loop.run_until_complete(run())
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            # closing the bot prints each cog it unloads
+            bot.loop.run_until_complete(bot.close())
+
+
+# (name, function, number of operations per repeat)
+BENCHMARKS = [
+    ('swap_cards', bench_swap_cards, 20000),
+    ('get_pending_players', bench_get_pending_players, 200000),
+    ('turn_can_complete', bench_turn_can_complete, 500000),
+    ('summary_embed', bench_summary_embed, 20000),
+    ('life_count', bench_life_count, 500000),
+    ('has', bench_has, 500000),
+    ('next_turn', bench_next_turn, 100000),
+    ('remove_player', bench_remove_player, 5000),
+    ('draw_card', bench_draw_card, 500000),
+    ('shuffle', bench_shuffle, 50000),
+    ('checks_pass', bench_checks_pass, 20000),
+    ('checks_reject', bench_checks_reject, 20000),
+]
+
+
+def run_benchmarks(names=None, repeat=REPEAT_DEFAULT, scale=1.0):
+    '''
+    Runs the benchmarks, printing each one's time as it finishes
+    names: list of str, representing the benchmarks to run (None for all)
+    repeat: int, representing how many times to time each benchmark
+    scale: float, representing how much to scale the number of operations by
+    Return: dict of benchmark name to its results
+    '''
+    results = {}
+    for name, function, number in BENCHMARKS:
+        if names and not any(wanted in name for wanted in names):
+            continue
+        number = max(1, int(number * scale))
+        times = []
+        for _ in range(repeat):
+            hub = FakeDiscord(keep_log=False)
+            times.append(function(hub, number) / number * 1e9)
+        results[name] = {
+            'number': number,
+            'ns_per_op': statistics.median(times),
+            'best_ns': min(times),
+            'repeats_ns': times,
+        }
+        print(f"    {name:<22} {results[name]['ns_per_op']:10.1f} ns/op "
+              f"(best {results[name]['best_ns']:.1f}, {repeat} x {number})")
+    return results
+
+def git_commit():
+    '''
+    Gets the commit the code is checked out at
+    Return: tuple of (str, bool), representing the commit hash (None if
+    not in a git repository) and whether there are uncommitted changes
+    '''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'diff', '--quiet', 'HEAD']).returncode != 0
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    return commit, dirty
+
+def save_results(results, path=None):
+    '''
+    Saves benchmark results with the commit and machine they were measured on
+    results: dict, representing the results from run_benchmarks()
+    path: str, representing the file to save to (by default, a file in
+    benchmarks/results named after the commit)
+    Return: str, representing the path the results were saved to
+    '''
+    commit, dirty = git_commit()
+    if path is None:
+        name = (commit[:12] if commit else 'unknown') + ('-dirty' if dirty else '')
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, name + '.json')
+    data = {
+        'version': RESULTS_VERSION,
+        'commit': commit,
+        'dirty': dirty,
+        'date': datetime.utcnow().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': f"{platform.system()} {platform.machine()}",
+        'benchmarks': results,
+    }
+    with open(path, 'w') as file:
+        json.dump(data, file, indent=2)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the game engine's hot paths")
+    parser.add_argument('--filter', action='append', help="only run benchmarks with this in their name")
+    parser.add_argument('--repeat', type=int, default=REPEAT_DEFAULT, help="times to time each benchmark")
+    parser.add_argument('--scale', type=float, default=1.0, help="scales the operations per repeat")
+    parser.add_argument('--output', help="file to save the results to")
+    parser.add_argument('--no-save', action='store_true', help="only print the results")
+    args = parser.parse_args()
+
+    # the check benchmarks need an event loop for the bot
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    print(f"Engine benchmarks ({PLAYERS_PER_GAME} players per game)")
+    results = run_benchmarks(args.filter, args.repeat, args.scale)
+    if not args.no_save:
+        print(f"Saved to {save_results(results, args.output)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+'''
+File: bench_handoff.py
+Author: Gavin Vogt
+This program times handing games off to a new process on restart: saving
+every game to a snapshot and loading them back. Run from the `Coup Bot`
+folder with `python -m benchmarks.bench_handoff [games]`
+'''
+
+# dependencies
+import discord
+import os
+import sys
+import tempfile
+import time
+
+# my code
+from classes.coup_game import CoupGame
+from helpers.game_snapshot import GameEntry, write_snapshot, read_snapshot
+
+
+GAMES_DEFAULT = 10000
+PLAYERS_PER_GAME = 4
+
+
+def make_games(state, num_games):
+    '''
+    Creates started games with a timer running, like a busy bot would have
+    state: discord ConnectionState to create the players' users in
+    num_games: int, representing the number of games
+    Return: list of GameEntry
+    '''
+    entries = []
+    for game_num in range(num_games):
+        users = [state.store_user({
+            'id': game_num * PLAYERS_PER_GAME + i + 1,
+            'username': f"player{i}",
+            'discriminator': f"{i:04}",
+            'avatar': None,
+        }) for i in range(PLAYERS_PER_GAME)]
+        game = CoupGame(users[0].id)
+        for user in users:
+            game.sign_up_player(user)
+        game.initialize_game()
+        game.set_turn_to(game.random_player().id)
+        game.set_timer(None, game.get_timeout())
+        entries.append(GameEntry(game_num, 0, game, game.get_timer_remaining()))
+    return entries
+
+def main():
+    num_games = int(sys.argv[1]) if len(sys.argv) > 1 else GAMES_DEFAULT
+    old_client = discord.Client()
+    entries = make_games(old_client._connection, num_games)
+    path = os.path.join(tempfile.mkdtemp(), 'games_snapshot.pickle')
+
+    start = time.perf_counter()
+    size = write_snapshot(entries, path)
+    saved = time.perf_counter() - start
+
+    # load into a different connection, like the new process would
+    new_client = discord.Client()
+    start = time.perf_counter()
+    _, loaded = read_snapshot(new_client._connection, path)
+    loaded_time = time.perf_counter() - start
+    os.remove(path)
+
+    assert len(loaded) == num_games
+    print(f"{num_games} games ({PLAYERS_PER_GAME} players each), snapshot {size / 1e6:.1f} MB")
+    print(f"    save: {saved * 1000:8.1f} ms")
+    print(f"    load: {loaded_time * 1000:8.1f} ms")
+    print(f"    total: {(saved + loaded_time) * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+'''
+File: compare.py
+Author: Gavin Vogt
+This program compares two sets of results saved by bench_engine.py and
+flags the benchmarks that got slower by more than a threshold. Run from
+the `Coup Bot` folder with `python -m benchmarks.compare [OLD] [NEW]`
+(the two most recent results in benchmarks/results by default); it exits
+with status 1 if anything regressed, so it can gate a merge
+'''
+
+# dependencies
+import argparse
+import glob
+import json
+import os
+import sys
+
+# my code
+from benchmarks.bench_engine import RESULTS_DIR, RESULTS_VERSION
+
+
+THRESHOLD_DEFAULT = 10.0    # percent slower before a benchmark counts as a regression
+
+
+def load_results(path):
+    '''
+    Loads results saved by bench_engine.py
+    path: str, representing the path of the results file
+    Return: dict, representing the results
+    '''
+    with open(path) as file:
+        results = json.load(file)
+    if results.get('version') != RESULTS_VERSION:
+        raise ValueError(f"{path} has results version {results.get('version')}, "
+                         f"expected {RESULTS_VERSION}")
+    return results
+
+def latest_results(count=2):
+    '''
+    Finds the most recently measured results in benchmarks/results
+    count: int, representing how many to find
+    Return: list of str, representing the paths, oldest first
+    '''
+    paths = glob.glob(os.path.join(RESULTS_DIR, '*.json'))
+    paths.sort(key=lambda path: load_results(path)['date'])
+    return paths[-count:]
+
+def compare(old, new, threshold=THRESHOLD_DEFAULT, stat='best_ns'):
+    '''
+    Compares each benchmark in two sets of results
+    old: dict, representing the results to compare against
+    new: dict, representing the results being checked
+    threshold: float, representing the percent slower that counts as a regression
+    stat: str, representing which time to compare ('best_ns' or 'ns_per_op')
+    Return: list of (name, old ns, new ns, percent change, verdict), where
+    verdict is 'regression', 'faster', 'same', 'new', or 'removed'
+    '''
+    rows = []
+    old_benchmarks = old['benchmarks']
+    new_benchmarks = new['benchmarks']
+    for name in list(old_benchmarks) + [name for name in new_benchmarks if name not in old_benchmarks]:
+        if name not in new_benchmarks:
+            rows.append((name, old_benchmarks[name][stat], None, None, 'removed'))
+            continue
+        if name not in old_benchmarks:
+            rows.append((name, None, new_benchmarks[name][stat], None, 'new'))
+            continue
+        old_ns = old_benchmarks[name][stat]
+        new_ns = new_benchmarks[name][stat]
+        change = (new_ns - old_ns) / old_ns * 100
+        if change > threshold:
+            verdict = 'regression'
+        elif change < -threshold:
+            verdict = 'faster'
+        else:
+            verdict = 'same'
+        rows.append((name, old_ns, new_ns, change, verdict))
+    return rows
+
+def _describe(results, path):
+    '''
+    Describes where a set of results came from
+    '''
+    commit = (results['commit'] or 'unknown')[:12] + (' (dirty)' if results['dirty'] else '')
+    return f"{commit}, {results['date']}, Python {results['python']} ({os.path.basename(path)})"
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two sets of engine benchmark results")
+    parser.add_argument('old', nargs='?', help="results to compare against")
+    parser.add_argument('new', nargs='?', help="results to check for regressions")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD_DEFAULT,
+                        help="percent slower that counts as a regression")
+    parser.add_argument('--median', action='store_true',
+                        help="compare the median time instead of the best time")
+    args = parser.parse_args()
+
+    if args.new is None:
+        paths = ([args.old] if args.old else []) + latest_results(1 if args.old else 2)
+        if len(paths) < 2:
+            sys.exit("Need two results to compare; run `python -m benchmarks.bench_engine` first")
+        args.old, args.new = paths
+    old = load_results(args.old)
+    new = load_results(args.new)
+    if old['machine'] != new['machine'] or old['python'] != new['python']:
+        print("Warning: the results were measured on different machines or Pythons")
+
+    print(f"old: {_describe(old, args.old)}")
+    print(f"new: {_describe(new, args.new)}")
+    rows = compare(old, new, args.threshold, 'ns_per_op' if args.median else 'best_ns')
+    for name, old_ns, new_ns, change, verdict in rows:
+        old_text = '-' if old_ns is None else f"{old_ns:.1f}"
+        new_text = '-' if new_ns is None else f"{new_ns:.1f}"
+        change_text = '' if change is None else f"{change:+.1f}%"
+        flag = '  <-- REGRESSION' if verdict == 'regression' else ''
+        print(f"    {name:<22} {old_text:>10} -> {new_text:>10} ns/op {change_text:>8}{flag}")
+
+    regressions = [row[0] for row in rows if row[4] == 'regression']
+    if regressions:
+        print(f"{len(regressions)} regression(s) over {args.threshold:g}%: {', '.join(regressions)}")
+        sys.exit(1)
+    print(f"No regressions over {args.threshold:g}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,12 +8,15 @@ to represent a game of Coup
 # dependencies
 from discord import Embed, Color
 from datetime import datetime
+import copy
 import random
+import time
 
 # my code
 from classes.player import Player
 from classes.card_swap import CardSwap
 from helpers.display_utils import ordered_list
+from helpers.flight_recorder import FlightRecorder
 
 class CoupGame:
     '''
@@ -25,6 +28,8 @@ class CoupGame:
         - challenge1
         - response
         - challenge2
+        - version (read-only)
+        - flight_recorder (read-only)
 
     The game is set up in two major phases:
         Signup phase (self.is_active() = False):
@@ -51,8 +56,23 @@ class CoupGame:
     CHALLENGE2_STAGE = 3
     COMPLETE_STAGE = 4    # when the turn completes, and any cleanup needs to be done
 
+    # seconds to wait on each kind of move before a default move is made for the player
+    ACTION_TIMEOUT_DEFAULT = 120    # defaults to `income`
+    RESPONSE_TIMEOUT_DEFAULT = 60   # defaults to `pass`
+    DIE_TIMEOUT_DEFAULT = 60        # defaults to killing the leftmost live card(s)
+    SWAP_TIMEOUT_DEFAULT = 60       # defaults to `noswap`
+    MAX_TIMEOUTS = 3                # timeouts in a row before a player is removed
+
+    FLIGHT_RECORDER_SIZE = 64       # recent commands and state changes kept for crash dumps
+
+    # Increases when the attributes of a game change in a way that needs a
+    # step in _migrate_state() (attributes that were only added do not)
+    STATE_VERSION = 1
+
     def __init__(self, master_id, *, min_players=None, max_players=None,
-            start_coins=None, start_influences=None, card_count=None):
+            start_coins=None, start_influences=None, card_count=None,
+            action_timeout=None, response_timeout=None, die_timeout=None,
+            swap_timeout=None):
         '''
         Constructs a new game
         master_id: user ID of the game master (person who started game)
@@ -61,17 +81,24 @@ class CoupGame:
         start_coins: int, representing the number of coins players start with
         start_influences: int, representing the number of influence cards to start with
         card_count: int, representing the total number of cards in the game
+        action_timeout: int, representing seconds to wait for an Action
+        response_timeout: int, representing seconds to wait for optional responses
+        die_timeout: int, representing seconds to wait for a player to choose cards to die
+        swap_timeout: int, representing seconds to wait for a player to finish an Exchange
+        (NOTE: a timeout of 0 disables that timer)
         '''
         # Used during game setup
         self._signup_ids = {}      # maps signed up player IDs to discord.User
         self._master = master_id   # who is running the game
         self._active = False       # whether the game is active
         self._created_at = datetime.utcnow()
+        self._last_active = self._created_at   # last time a player made a command
 
         # Game settings
         self._set_player_constraints(min_players, max_players)
         self._set_start_settings(start_coins, start_influences)
         self._set_preferred_cards(card_count)
+        self._set_timeouts(action_timeout, response_timeout, die_timeout, swap_timeout)
 
         # Used during game play
         self._players = {}         # dict of user_id : Player
@@ -82,11 +109,59 @@ class CoupGame:
         # Information about the turn rotation
         self._order = []           # game rotation order as list of user IDs
         self._turn = 0             # index of player whose turn it is
+        self._timer = None         # asyncio.Task waiting on the current move
+        self._timer_deadline = None   # time.time() the timer runs out at
+
+        # Increases every time the game state changes, so commands decided
+        # against an older state can be told apart
+        self._version = 0
+
+        # Remembers the last commands and state changes, for crash dumps
+        self._flight_recorder = FlightRecorder(self.FLIGHT_RECORDER_SIZE)
 
         # Turn stage: 0 (action), 1 (challenge), 2 (response), 3 (challenge)
         # Creates variables: _stage, _action, _challenge1, _response, _challenge2, _pending
         self.clean_turn_vars()
 
+    def __getstate__(self):
+        '''
+        Gets the state to pickle (for handing the game off to a new
+        process or a new version of this class), leaving out the timer task
+        '''
+        state = self.__dict__.copy()
+        state['_timer'] = None
+        state['_state_version'] = self.STATE_VERSION
+        return state
+
+    def __setstate__(self, state):
+        '''
+        Restores a pickled game, migrating it if it was pickled by an older
+        version of this class
+        '''
+        version = state.pop('_state_version', 1)
+        self.__dict__.update(self._migrate_state(state, version))
+
+    @classmethod
+    def _migrate_state(cls, state, version):
+        '''
+        Brings the state of a game pickled by an older version of this class
+        up to date. Attributes added to __init__ since then start with their
+        default value; anything else needs a step here for the version it
+        changed in, such as:
+            if version < 2:
+                state['_timeouts']['swap'] = state['_timeouts'].pop('exchange')
+        state: dict of attribute name to value
+        version: int, representing the STATE_VERSION the game was pickled with
+        Return: dict of attribute name to value, for this version
+        '''
+        defaults = cls.__dict__.get('_default_state')
+        if defaults is None:
+            # attributes of a new game (only worked out once per version of the class)
+            defaults = cls._default_state = cls(0).__dict__
+        for name in defaults.keys() - state.keys():
+            state[name] = copy.deepcopy(defaults[name])
+        return state
+
     def __repr__(self):
         '''
         String representing the game settings
@@ -110,6 +185,30 @@ class CoupGame:
             f"Pending: {self.pending}",
         ))
 
+    @property
+    def version(self):
+        '''
+        Gives access to the `version` property, which increases every
+        time the game state changes
+        '''
+        return self._version
+
+    @property
+    def flight_recorder(self):
+        '''
+        Gives access to the FlightRecorder with the game's recent events
+        '''
+        return self._flight_recorder
+
+    def record(self, kind, subject=None, info=None):
+        '''
+        Records an event in the flight recorder
+        kind: str, representing what happened (such as "command")
+        subject: what it happened to
+        info: anything else about the event
+        '''
+        self._flight_recorder.record(self._version, kind, subject, info)
+
     @property
     def soft_pending(self):
         '''
@@ -142,6 +241,8 @@ class CoupGame:
         game is waiting for some kind of action before it can continue
         '''
         self._pending = pending_val
+        self._version += 1
+        self._flight_recorder.record(self._version, 'pending', pending_val)
 
     @property
     def action(self):
@@ -159,6 +260,7 @@ class CoupGame:
         '''
         # Set to the action
         self._action = new_action
+        self._version += 1
 
         # Set the turn stage
         if new_action.is_influence_power():
@@ -173,6 +275,7 @@ class CoupGame:
             # the action can go through immediately (no challenges or blocks)
             self._stage = self.COMPLETE_STAGE
             self._pending = False
+        self._flight_recorder.record(self._version, 'action', new_action, self._stage)
 
     @property
     def challenge1(self):
@@ -190,6 +293,7 @@ class CoupGame:
         '''
         # Set the stage
         self._challenge1 = new_challenge
+        self._version += 1
         if self._action.wins_challenge():
             # player who did Action would win challenge
             if self._action.done_to is not None and \
@@ -210,6 +314,7 @@ class CoupGame:
 
         # Either way, game is now pending one player to kill one of their cards
         self._pending = True
+        self._flight_recorder.record(self._version, 'challenge1', new_challenge, self._stage)
 
     @property
     def response(self):
@@ -226,6 +331,7 @@ class CoupGame:
         and sets whether the game is `pending` any actions
         '''
         self._response = new_response
+        self._version += 1
         if new_response.is_influence_power():
             # can be challenged; advance stage to `challenge2`
             self._stage = self.CHALLENGE2_STAGE
@@ -234,6 +340,7 @@ class CoupGame:
             # response cannot be challenged
             self._stage = self.COMPLETE_STAGE
             self._pending = False
+        self._flight_recorder.record(self._version, 'response', new_response, self._stage)
 
     @property
     def challenge2(self):
@@ -250,10 +357,12 @@ class CoupGame:
         and sets whether the game is `pending` any actions
         '''
         self._challenge2 = new_challenge
+        self._version += 1
         self._stage = self.COMPLETE_STAGE  # challenge2 automatically ends turn
 
         # Either way, game is now pending one player to kill one of their cards
         self._pending = True
+        self._flight_recorder.record(self._version, 'challenge2', new_challenge, self._stage)
 
     def initialize_game(self):
         '''
@@ -271,6 +380,8 @@ class CoupGame:
 
         # Set game to `active` state
         self._active = True
+        self._version += 1
+        self._flight_recorder.record(self._version, 'start', list(self._signup_ids))
 
         # Initialize all the players
         for user_id, user in self._signup_ids.items():
@@ -321,6 +432,24 @@ class CoupGame:
         '''
         return self._start_influences
 
+    def get_created_at(self):
+        '''
+        Gets the datetime (UTC) when the game was created
+        '''
+        return self._created_at
+
+    def get_last_active(self):
+        '''
+        Gets the datetime (UTC) when a player last made a command in the game
+        '''
+        return self._last_active
+
+    def touch(self):
+        '''
+        Marks the game as active right now, since a player made a command
+        '''
+        self._last_active = datetime.utcnow()
+
     def get_master(self):
         '''
         Getter for the user ID of the game master
@@ -410,6 +539,8 @@ class CoupGame:
         '''
         if user_id in self._players.keys():
             del self._players[user_id]
+            self._version += 1
+            self._flight_recorder.record(self._version, 'remove_player', user_id)
 
             # Remove the player from the turn order, and possibly change turn
             i = self._order.index(user_id)
@@ -419,7 +550,10 @@ class CoupGame:
                 self._turn -= 1  # subtract so next_turn() increments it to the correct player
                 self.next_turn()
                 return True      # let caller know it was that player's turn
-        return False             # let caller know it was not that player's turn
+            elif i < self._turn:
+                # Player was earlier in the turn order; keep turn on the same player
+                self._turn -= 1
+        return False            # let caller know it was not that player's turn
 
     def get_stage(self):
         '''
@@ -454,6 +588,8 @@ class CoupGame:
         for the next turn
         '''
         # keep track of the stage and previous actions
+        self._version += 1
+        self._flight_recorder.record(self._version, 'new_turn', self._turn)
         self._stage = self.ACTION_STAGE
         self._action = None
         self._challenge1 = None
@@ -537,6 +673,68 @@ class CoupGame:
         '''
         self._turn = self._order.index(player_id)
 
+    def get_timeout(self):
+        '''
+        Gets the number of seconds to wait on whatever the game is currently
+        waiting for, before a default move is made for the player(s)
+        Return: int, representing the seconds to wait, or None if there is
+        nothing to wait on (or that timer is disabled)
+        '''
+        if not self.is_active() or self.is_over():
+            return None
+
+        pending_players = self.get_pending_players()
+        if any(player.must_kill > 0 for player in pending_players):
+            # waiting for player(s) to choose cards to die
+            return self._timeouts['die']
+        elif len(pending_players) > 0:
+            # waiting for a player to finish their Exchange
+            return self._timeouts['swap']
+        elif self._action is None:
+            # waiting for the player to make their Action
+            return self._timeouts['action']
+        else:
+            # waiting for optional responses
+            return self._timeouts['response']
+
+    def set_timer(self, timer, timeout=None):
+        '''
+        Sets the timer waiting on the current move, cancelling any old one
+        timer: asyncio.Task that makes the default move when it completes
+        timeout: float, representing the seconds until the timer runs out
+        '''
+        self.cancel_timer()
+        self._timer = timer
+        if timeout is not None:
+            self._timer_deadline = time.time() + timeout
+
+    def get_timer_remaining(self):
+        '''
+        Gets the seconds left on the timer waiting on the current move
+        Return: float, representing the seconds left (0 if it ran out), or
+        None if there is no timer
+        '''
+        if self._timer_deadline is None:
+            return None
+        return max(self._timer_deadline - time.time(), 0.0)
+
+    def has_timer(self, timer):
+        '''
+        Checks if a timer is the one waiting on the current move (not one
+        that was since cancelled or replaced)
+        timer: asyncio.Task of the timer
+        '''
+        return (timer is not None and timer is self._timer)
+
+    def cancel_timer(self):
+        '''
+        Cancels the timer waiting on the current move, if there is one
+        '''
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self._timer_deadline = None
+
     def turn_summary(self):
         '''
         Generates an embed summarizing the turn
@@ -563,23 +761,38 @@ class CoupGame:
         turn_embed.set_footer(text="Turn completed at")
         return turn_embed
 
-    def print_summary(self):
-        '''
-        Prints out the game summary
-        '''
-        print(repr(self))
-        print("Action:", self._action)
-        print("Challenge 1:", self._challenge1)
-        print("Response:", self._response)
-        print("Challenge 2:", self._challenge2)
-        print("-"*45)
-        print("CURRENT TURN:", self.get_turn())
-        print("DRAW PILE:", self._draw_pile)
-        print("-"*45)
-        for player in self._players.values():
-            print(repr(player), ":")
-            for i in range(self._start_influences):
-                print("    -", player[i])
+    def debug_snapshot(self):
+        '''
+        Gets a summary of the full game state (including hidden cards and
+        the draw pile) for debugging
+        Return: dict of plain values that can be written to the log
+        '''
+        last_event = self.last_event()
+        snapshot = {
+            'settings': repr(self),
+            'version': self._version,
+            'active': self._active,
+            'player_count': self.player_count(),
+            'stage': self._stage,
+            'can_complete': self.turn_can_complete(),
+            'soft_pending': self.soft_pending,
+            'hard_pending': self.hard_pending,
+            'pending': self.pending,
+            'action': str(self._action),
+            'challenge1': str(self._challenge1),
+            'response': str(self._response),
+            'challenge2': str(self._challenge2),
+            'last_event': str(last_event),
+            'wins_challenge': None if last_event is None else last_event.wins_challenge(),
+        }
+        if self._active:
+            snapshot['turn'] = repr(self.get_turn())
+            snapshot['draw_pile'] = [repr(card) for card in self._draw_pile]
+            snapshot['players'] = {
+                repr(player): [repr(player[i]) for i in range(self._start_influences)]
+                for player in self._players.values()
+            }
+        return snapshot
 
     def add_card(self, card):
         '''
@@ -712,6 +925,11 @@ class CoupGame:
         setup_embed.add_field(name="Min players", value=self._min_players)
         setup_embed.add_field(name="Max players", value=self._max_players)
 
+        # Time limits on each kind of move
+        timeouts = [f"{name.capitalize()}: {'off' if seconds is None else f'{seconds}s'}"
+                    for name, seconds in self._timeouts.items()]
+        setup_embed.add_field(name="Timeouts ⏱", value="\n".join(timeouts))
+
         setup_embed.set_footer(text="Created at")
         return setup_embed
 
@@ -784,6 +1002,8 @@ class CoupGame:
         game will no longer be hard pending, automatically sets `pending`
         to false and updates the game stage.
         '''
+        self._version += 1
+        self._flight_recorder.record(self._version, 'death', die_response)
         if self.response is None:
             # player used Die as their response
             self.response = die_response
@@ -944,6 +1164,26 @@ class CoupGame:
         else:
             self._start_influences = start_influences
 
+    def _set_timeouts(self, action_timeout, response_timeout, die_timeout, swap_timeout):
+        '''
+        Helper method for setting up the number of seconds to wait on each
+        kind of move. Timeouts that are not given use the defaults, and
+        timeouts of 0 or less disable that timer
+        '''
+        self._timeouts = {}
+        for name, timeout, default in (
+                ('action', action_timeout, self.ACTION_TIMEOUT_DEFAULT),
+                ('response', response_timeout, self.RESPONSE_TIMEOUT_DEFAULT),
+                ('die', die_timeout, self.DIE_TIMEOUT_DEFAULT),
+                ('swap', swap_timeout, self.SWAP_TIMEOUT_DEFAULT)):
+            if timeout is None:
+                self._timeouts[name] = default
+            elif timeout <= 0:
+                # timer is disabled
+                self._timeouts[name] = None
+            else:
+                self._timeouts[name] = timeout
+
     def _set_preferred_cards(self, card_count):
         '''
         Sets up the preferred card count for the game.
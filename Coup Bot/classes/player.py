@@ -30,6 +30,8 @@ class Player:
         - must_coup()
         - get_embed(ctx)
         - is_eliminated()
+        - add_timeout()
+        - reset_timeouts()
     '''
 
     MUST_COUP_COINS = 10
@@ -50,6 +52,9 @@ class Player:
         self._must_kill = 0
         self._must_swap = False
 
+        # Number of times in a row the player let the timer run out on their move
+        self._timeouts = 0
+
     def __repr__(self):
         '''
         String representation of the Player
@@ -214,6 +219,20 @@ class Player:
         '''
         return not (self.life_count() > 0)
 
+    def add_timeout(self):
+        '''
+        Records that the player let the timer run out on their move
+        Return: int, representing how many times in a row the player has timed out
+        '''
+        self._timeouts += 1
+        return self._timeouts
+
+    def reset_timeouts(self):
+        '''
+        Resets the player's timeouts once they make a move themselves
+        '''
+        self._timeouts = 0
+
     def _get_basic_embed(self, show_influences):
         # Set up the embed
         player_embed = Embed(
@@ -12,9 +12,14 @@ class Challenge(Response):
     '''
     This class represents a Challenge in the game of Coup,
     where a player challenges another player's Action
+
+    Useful methods:
+        - set_result(challenger_won)
+        - challenger_won()
     '''
 
     REQUIRED_CARDS = {}
+    _challenger_won = None      # for challenges pickled before the result was kept
 
     def __init__(self, player1, player2):
         '''
@@ -23,6 +28,22 @@ class Challenge(Response):
         player2: Player representing the player who made the original action
         '''
         super().__init__(player1, player2)
+        self._challenger_won = None   # decided once, before any cards move
+
+    def set_result(self, challenger_won):
+        '''
+        Records who won the challenge, since revealing and swapping the
+        challenged card can change what wins_challenge() says afterwards
+        challenger_won: bool, representing whether the challenger won
+        '''
+        self._challenger_won = challenger_won
+
+    def challenger_won(self):
+        '''
+        Checks if the challenger won the challenge
+        Return: bool, or None if the challenge has not been handled yet
+        '''
+        return self._challenger_won
 
     @staticmethod
     def is_influence_power():
@@ -0,0 +1,268 @@
+'''
+File: cluster.py
+Author: Gavin Vogt
+This program launches the Coup Bot as a cluster of worker processes, each
+running some of the shards, so the bot can use more than one core
+'''
+
+# dependencies
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+import discord
+from dotenv import load_dotenv
+
+# my code
+from helpers.logging_utils import start_logging, stop_logging
+
+
+logger = logging.getLogger('coup.cluster')
+
+BOT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+SOCKET_PATH_DEFAULT = os.path.join(BOT_DIRECTORY, 'coup_cluster.sock')
+METRICS_PORT_DEFAULT = 9108   # metrics port of the first worker
+
+
+class ClusterSupervisor:
+    '''
+    This class runs the cluster. It splits the shards between the workers,
+    runs each worker as a `launcher.py` process, and restarts workers that
+    exit (waiting longer after each crash in a row). It also serves a Unix
+    socket the workers use for anything that spans every worker: which
+    users are in a game, so a user can only be in one game on any worker
+    (see ClusterUserLocks). Users are held as leases the workers renew,
+    so a worker that hangs without exiting does not keep its users forever.
+
+    Useful methods:
+        - run()
+        - stop()
+    '''
+
+    BACKOFF_MIN = 1.0          # seconds before restarting a crashed worker ...
+    BACKOFF_MAX = 60.0         # ... doubling after each crash, up to this
+    STABLE_AFTER = 60.0        # seconds a worker must run for its backoff to reset
+    STOP_TIMEOUT = 30.0        # seconds workers get to exit before they are killed
+    IDENTIFY_DELAY = 5.0       # seconds between shards connecting (Discord allows 1 per 5s)
+
+    def __init__(self, shard_count, workers, *, socket_path=SOCKET_PATH_DEFAULT,
+                 metrics_port=METRICS_PORT_DEFAULT):
+        '''
+        Constructs the supervisor
+        shard_count: int, representing the total number of shards
+        workers: int, representing the number of worker processes
+        socket_path: str, representing the path of the socket workers connect to
+        metrics_port: int, representing the metrics port of the first worker
+        (the others count up from it; 0 to disable metrics)
+        '''
+        self.shard_count = shard_count
+        self.socket_path = socket_path
+        self.metrics_port = metrics_port
+        workers = max(1, min(workers, shard_count))
+        self.shard_ids = [list(range(shard_count))[i * shard_count // workers:(i + 1) * shard_count // workers]
+                          for i in range(workers)]
+        self._users = {}           # maps user ID to (worker ID, lease expiry time) of the worker that has them in a game
+        self._processes = {}       # maps worker ID to its running asyncio.subprocess.Process
+        self._server = None
+        self._connections = set()  # asyncio.StreamWriter of each connected worker
+        self._stopping = None      # asyncio.Event set when the cluster should shut down
+
+    async def run(self):
+        '''
+        Runs the cluster until stop() is called
+        '''
+        self._stopping = asyncio.Event()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        self._server = await asyncio.start_unix_server(self._serve, path=self.socket_path)
+        print(f"Cluster of {len(self.shard_ids)} workers for {self.shard_count} shards")
+        try:
+            await asyncio.gather(*(self._supervise(worker_id) for worker_id in range(len(self.shard_ids))))
+        finally:
+            self._server.close()
+            for writer in self._connections:
+                writer.close()
+            await self._server.wait_closed()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def stop(self):
+        '''
+        Stops the workers and the cluster
+        '''
+        if self._stopping is None or self._stopping.is_set():
+            return
+        print("Stopping the cluster")
+        self._stopping.set()
+        for process in self._processes.values():
+            if process.returncode is None:
+                process.terminate()
+        asyncio.get_event_loop().call_later(self.STOP_TIMEOUT, self._kill_workers)
+
+    def _kill_workers(self):
+        '''
+        Kills any workers that did not exit in time after being stopped
+        '''
+        for worker_id, process in self._processes.items():
+            if process.returncode is None:
+                print(f"Killing worker {worker_id} (pid {process.pid})")
+                process.kill()
+
+    async def _supervise(self, worker_id):
+        '''
+        Keeps a worker running, restarting it whenever it exits
+        worker_id: int, representing which worker to run
+        '''
+        # Let the shards of the workers before this one connect first
+        earlier_shards = sum(len(shard_ids) for shard_ids in self.shard_ids[:worker_id])
+        if await self._wait_stopping(earlier_shards * self.IDENTIFY_DELAY):
+            return
+
+        backoff = self.BACKOFF_MIN
+        while not self._stopping.is_set():
+            started = time.monotonic()
+            process = self._processes[worker_id] = await asyncio.create_subprocess_exec(
+                sys.executable, os.path.join(BOT_DIRECTORY, 'launcher.py'),
+                cwd=BOT_DIRECTORY, env=self._worker_env(worker_id))
+            print(f"Started worker {worker_id} (pid {process.pid}) with shards {self.shard_ids[worker_id]}")
+            try:
+                returncode = await process.wait()
+            except asyncio.CancelledError:
+                process.kill()
+                raise
+            finally:
+                self._release_worker(worker_id)
+            if self._stopping.is_set():
+                break
+
+            if time.monotonic() - started > self.STABLE_AFTER:
+                backoff = self.BACKOFF_MIN
+            print(f"Worker {worker_id} exited with code {returncode}; restarting in {backoff:.0f}s")
+            logger.warning("Worker %s exited with code %s", worker_id, returncode)
+            if await self._wait_stopping(backoff):
+                break
+            backoff = min(backoff * 2, self.BACKOFF_MAX)
+
+    async def _wait_stopping(self, seconds):
+        '''
+        Waits for some time, or until the cluster is stopping
+        Return: bool, representing whether the cluster is stopping
+        '''
+        try:
+            await asyncio.wait_for(self._stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+        return self._stopping.is_set()
+
+    def _worker_env(self, worker_id):
+        '''
+        Gets the environment variables to run a worker with
+        '''
+        env = dict(os.environ)
+        env['SHARD_COUNT'] = str(self.shard_count)
+        env['SHARD_IDS'] = ",".join(str(shard_id) for shard_id in self.shard_ids[worker_id])
+        env['CLUSTER_SOCKET'] = self.socket_path
+        env['CLUSTER_WORKER'] = str(worker_id)
+        env['METRICS_PORT'] = str(self.metrics_port + worker_id if self.metrics_port else 0)
+        return env
+
+    def _release_worker(self, worker_id):
+        '''
+        Releases every user a worker had in a game, since its games are gone
+        '''
+        for user_id in [user_id for user_id, owner in self._users.items() if owner[0] == worker_id]:
+            del self._users[user_id]
+
+    def _renew(self, worker_id, users, lease):
+        '''
+        Extends the leases of the users a worker has in games (taking any
+        that are free, such as after the worker reconnects)
+        '''
+        expires = time.monotonic() + (lease or 0)
+        for user_id in users:
+            owner = self._users.get(user_id)
+            if owner is None or owner[0] == worker_id or owner[1] < time.monotonic():
+                self._users[user_id] = (worker_id, expires)
+            else:
+                logger.warning("Worker %s lost user %s to worker %s", worker_id, user_id, owner[0])
+
+    async def _serve(self, reader, writer):
+        '''
+        Handles requests from one worker, in the order they were sent
+        '''
+        worker_id = None
+        self._connections.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = json.loads(line)
+                op = request.get('op')
+                if op == 'hello':
+                    # worker (re)connected; its users are whatever it says they are
+                    worker_id = request['worker']
+                    self._release_worker(worker_id)
+                    self._renew(worker_id, request.get('users', ()), request.get('lease'))
+                elif op == 'claim':
+                    user_id = request['user']
+                    owner = self._users.get(user_id)
+                    ok = (owner is None or owner[1] < time.monotonic())
+                    if ok:
+                        self._users[user_id] = (worker_id, time.monotonic() + request['lease'])
+                    writer.write(json.dumps({'id': request['id'], 'ok': ok}).encode() + b'\n')
+                elif op == 'release':
+                    owner = self._users.get(request['user'])
+                    if owner is not None and owner[0] == worker_id:
+                        del self._users[request['user']]
+                elif op == 'renew':
+                    self._renew(worker_id, request['users'], request['lease'])
+                else:
+                    logger.warning("Unknown request from worker %s: %s", worker_id, line)
+        except (ConnectionError, ValueError) as e:
+            logger.warning("Connection to worker %s failed: %r", worker_id, e)
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+
+async def get_shard_count(token):
+    '''
+    Gets the number of shards Discord recommends for the bot
+    token: str, representing the bot token
+    Return: int, representing the number of shards
+    '''
+    http = discord.http.HTTPClient()
+    try:
+        await http.static_login(token, bot=True)
+        shard_count, _ = await http.get_bot_gateway()
+    finally:
+        await http.close()
+    return shard_count
+
+async def main():
+    '''
+    Runs the cluster, configured by environment variables: SHARD_COUNT
+    (Discord's recommended count if not set), WORKERS (the number of
+    cores if not set), and METRICS_PORT (of the first worker)
+    '''
+    load_dotenv()
+    shard_count = os.getenv("SHARD_COUNT")
+    shard_count = int(shard_count) if shard_count else await get_shard_count(os.getenv("DISCORD_TOKEN"))
+    workers = int(os.getenv("WORKERS") or os.cpu_count() or 1)
+    metrics_port = int(os.getenv("METRICS_PORT", METRICS_PORT_DEFAULT))
+
+    supervisor = ClusterSupervisor(shard_count, workers, metrics_port=metrics_port)
+    loop = asyncio.get_event_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, supervisor.stop)
+    await supervisor.run()
+
+
+if __name__ == "__main__":
+    start_logging('cluster_log.log')
+    asyncio.run(main())
+    stop_logging()
@@ -6,23 +6,76 @@ This program defines the Admin cog for the Coup Bot
 
 # dependencies
 from discord.ext import commands
+from discord import Embed, Color
+from functools import partial
+import asyncio
+import tracemalloc
 
 # my code
 from cogs.base_cog import BaseCog
+from helpers.logging_utils import set_level, get_levels
+from helpers.profiler import DeterministicProfiler, SamplingProfiler
+from helpers.memory_utils import deep_sizeof, rss_bytes, count_objects, top_allocations
+from classes.coup_game import CoupGame
+from classes.player import Player
+from classes.influence_card import InfluenceCard
+from classes.card_swap import CardSwap
+from classes.actions import Action
+from classes.responses import Response
 
 
 # Define help strings
 LOAD_HELP = "Loads a cog"
 RELOAD_HELP = "Reloads a cog"
-QUIT_HELP = "Shuts down the bot"
+QUIT_HELP = """Shuts down the bot
+Running commands and queued messages are finished first (games in progress end)"""
+UPDATE_HELP = """Reloads the game code and every cog from disk without restarting
+Games carry on where they were, and commands sent meanwhile run on the new code"""
+RESTART_HELP = """Restarts the bot (such as to deploy a new version) without losing any games
+Games are saved, and the new process resumes them where they left off"""
+REAP_HELP = "Removes abandoned games now"
+DEBUG_HELP = "Writes the full game state to the log"
+TRACE_HELP = """Turns game state tracing on or off
+Examples:
+  - trace
+  - trace on
+  - trace off all"""
+LOGLEVEL_HELP = """Shows or changes the log level of a logger
+Examples:
+  - loglevel
+  - loglevel discord DEBUG
+  - loglevel root WARNING"""
+PROFILE_HELP = """Profiles the bot for a number of seconds or commands, then DMs a report
+Modes: sampling (default, low overhead) or deterministic (exact, slower)
+Examples:
+  - profile 30
+  - profile 50 commands
+  - profile 10 seconds deterministic"""
+STATS_HELP = """Shows memory use, object counts, and cache sizes
+Tracing allocations (for the top allocation sites) slows the bot down,
+so it is off until turned on
+Examples:
+  - stats
+  - stats allocations on
+  - stats allocations off"""
 
 
 class AdminCog(BaseCog, name="admin"):
     '''
     Owner-only admin commands for the Coup Bot
     '''
+    PROFILE_DIRECTORY = 'profiles'   # where raw profiles are written
+    MAX_PROFILE_SECONDS = 10 * 60    # longest a profile can run
+    PROFILERS = {
+        'sampling': SamplingProfiler,
+        'deterministic': DeterministicProfiler,
+    }
+
     def __init__(self, bot):
         super().__init__(bot)
+        self._profiling = False        # whether a profile is running
+        self._profile_commands = None  # commands left to profile, if profiling by commands
+        self._profile_done = None      # asyncio.Event set once enough commands are profiled
 
     async def cog_check(self, ctx):
         '''
@@ -30,15 +83,38 @@ class AdminCog(BaseCog, name="admin"):
         '''
         return await self.bot.is_owner(ctx.author)
 
-    @commands.command(name="debug", help="Print out the debug game summary")
+    @commands.command(name="debug", help=DEBUG_HELP)
     @commands.guild_only()
     async def debug_current_game(self, ctx):
+        '''
+        Writes the full state of the game in this channel to the log
+        '''
         game = self.bot.get_game(ctx.channel.id)
         if game is None:
-            print(f"No game in channel {ctx.channel}")
+            await self.send(ctx.channel, f"No game in channel {ctx.channel.mention}")
         else:
-            print()
-            game.print_summary()
+            self.bot.tracer.event(ctx.channel.id, 'debug', game.debug_snapshot, force=True)
+            await self.send(ctx.channel, "Game summary written to the log")
+
+    @commands.command(name="trace", help=TRACE_HELP)
+    @commands.guild_only()
+    async def trace(self, ctx, setting=None, scope=None):
+        '''
+        Allows bot owner to turn game state tracing on or off for this
+        channel (or every channel)
+        '''
+        tracer = self.bot.tracer
+        channel_id = None if scope == "all" else ctx.channel.id
+        where = "every channel" if scope == "all" else ctx.channel.mention
+        if setting == "on":
+            tracer.enable(channel_id)
+            await self.send(ctx.channel, f"Tracing on for {where}")
+        elif setting == "off":
+            tracer.disable(channel_id)
+            await self.send(ctx.channel, f"Tracing off for {where}")
+        else:
+            state = "on" if tracer.is_enabled(ctx.channel.id) else "off"
+            await self.send(ctx.channel, f"Tracing is {state} for {ctx.channel.mention}")
 
     @commands.command(name="load", help=LOAD_HELP)
     async def load_extension(self, ctx, extension_name):
@@ -48,7 +124,7 @@ class AdminCog(BaseCog, name="admin"):
         '''
         # Load the extension
         self.bot.load_extension('cogs.' + extension_name + '_cog')
-        await ctx.send(f"Extension `{extension_name}` loaded")
+        await self.send(ctx.channel, f"Extension `{extension_name}` loaded")
 
     @commands.command(name="reload", help=RELOAD_HELP)
     async def reload_extension(self, ctx, extension_name):
@@ -58,17 +134,218 @@ class AdminCog(BaseCog, name="admin"):
         '''
         # Reload the extension
         self.bot.reload_extension('cogs.' + extension_name + '_cog')
-        await ctx.send(f"Extension `{extension_name}` reloaded")
+        await self.send(ctx.channel, f"Extension `{extension_name}` reloaded")
+
+    @commands.command(name="update", help=UPDATE_HELP)
+    async def hot_reload(self, ctx):
+        '''
+        Reloads the game classes and cogs, moving the games into the new classes
+        '''
+        print(f"Update requested by {ctx.author} (id={ctx.author.id})")
+        num_games, seconds = await self.bot.hot_reload(channel_id=ctx.channel.id)
+        print(f"Reloaded the code and moved {num_games} games in {seconds:.3f}s")
+        await self.send(ctx.channel, f"Reloaded the code and moved `{num_games}` games "
+                                     f"in `{seconds * 1000:.0f}` ms")
+
+    @commands.command(name="reap", help=REAP_HELP)
+    async def reap_games(self, ctx):
+        '''
+        Allows bot owner to remove abandoned games without waiting
+        for the next reap, and see how much was reclaimed
+        '''
+        num_games, num_bytes = await self.bot.reap_abandoned_games(channel_id=ctx.channel.id)
+        await self.send(ctx.channel, f"Reaped `{num_games}` abandoned games (~`{num_bytes / 1024:.1f}` KB)")
+
+    @commands.command(name="loglevel", help=LOGLEVEL_HELP)
+    async def log_level(self, ctx, logger_name=None, level=None):
+        '''
+        Allows bot owner to see the log levels, or change the level
+        of a logger without restarting the bot
+        '''
+        if logger_name is not None and level is not None:
+            try:
+                new_level = set_level(logger_name, level)
+            except ValueError as e:
+                await self.send(ctx.channel, str(e))
+                return
+            await self.send(ctx.channel, f"Logger `{logger_name}` set to `{new_level}`")
+        else:
+            levels = get_levels()
+            if logger_name is not None:
+                levels = {name: lvl for name, lvl in levels.items() if name == logger_name}
+            await self.send(ctx.channel, "\n".join(f"`{name}`: `{lvl}`" for name, lvl in levels.items())
+                                         or f"Logger `{logger_name}` has no level set")
+
+    @commands.command(name="profile", help=PROFILE_HELP)
+    async def profile(self, ctx, amount: int, unit="seconds", mode="sampling"):
+        '''
+        Allows bot owner to profile the bot under real traffic. The profile
+        runs in the background, then the owner is sent the functions that
+        took the most time, and the raw profile is written to disk
+        '''
+        if self._profiling:
+            await self.send(ctx.channel, "A profile is already running")
+            return
+        if unit not in ("seconds", "commands"):
+            await self.send(ctx.channel, "Unit must be `seconds` or `commands`")
+            return
+        if mode not in self.PROFILERS:
+            await self.send(ctx.channel, "Mode must be `sampling` or `deterministic`")
+            return
+        if amount <= 0 or (unit == "seconds" and amount > self.MAX_PROFILE_SECONDS):
+            await self.send(ctx.channel, f"Can profile from 1 to {self.MAX_PROFILE_SECONDS} seconds")
+            return
+
+        self._profiling = True
+        task = self.bot.loop.create_task(self._run_profile(ctx.author, self.PROFILERS[mode](), amount, unit))
+        task.add_done_callback(partial(self._profile_finished, ctx.channel))
+        await self.send(ctx.channel, f"Started {mode} profile for {amount} {unit}")
+
+    async def _run_profile(self, owner, profiler, amount, unit):
+        '''
+        Runs a profile, then sends the report to the owner
+        owner: discord.User to send the report to
+        profiler: Profiler to run
+        amount: int, representing how many seconds or commands to profile
+        unit: str, representing "seconds" or "commands"
+        '''
+        try:
+            profiler.start()
+            try:
+                if unit == "seconds":
+                    await asyncio.sleep(amount)
+                else:
+                    self._profile_commands = amount
+                    self._profile_done = asyncio.Event()
+                    try:
+                        await asyncio.wait_for(self._profile_done.wait(), self.MAX_PROFILE_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                profiler.stop()
+                self._profile_commands = None
+                self._profile_done = None
+
+            # Writing and ranking the profile is slow, so keep it off the event loop
+            path = await self.bot.loop.run_in_executor(None, profiler.save, self.PROFILE_DIRECTORY)
+            report = await self.bot.loop.run_in_executor(None, profiler.report)
+            await self.send(owner, f"{profiler.KIND.capitalize()} profile of {profiler.duration():.1f} "
+                                   f"seconds, saved to `{path}`\n```\n{report[:1800]}\n```")
+        finally:
+            self._profiling = False
+
+    def _profile_finished(self, channel, task):
+        '''
+        Replies with the error if a profile failed, since it ran in the background
+        channel: discord.Channel the profile was started from
+        task: asyncio.Task that ran the profile
+        '''
+        if task.cancelled() or task.exception() is None:
+            return
+        error = task.exception()
+        self.bot.report_error(error, "profile")
+        self.bot.loop.create_task(self.send(channel, f"Profile failed: `{error!r}`"[:2000]))
+
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx):
+        '''
+        Counts commands towards a profile that runs for a number of commands
+        '''
+        if self._profile_commands is not None and ctx.command.cog is not self:
+            self._profile_commands -= 1
+            if self._profile_commands <= 0:
+                self._profile_done.set()
+
+    @commands.command(name="stats", help=STATS_HELP)
+    async def stats(self, ctx, option=None, setting=None):
+        '''
+        Allows bot owner to see how much memory the bot is using and what
+        is using it, to find leaks
+        '''
+        if option == "allocations":
+            if setting == "on":
+                tracemalloc.start()
+                await self.send(ctx.channel, "Tracing allocations")
+            elif setting == "off":
+                tracemalloc.stop()
+                await self.send(ctx.channel, "Stopped tracing allocations")
+            else:
+                await self.send(ctx.channel, "Use `stats allocations on` or `stats allocations off`")
+            return
+        await self.send(ctx.channel, embed=self._stats_embed())
+
+    def _stats_embed(self):
+        '''
+        Generates an embed with the bot's memory use, object counts,
+        and cache sizes
+        '''
+        stats_embed = Embed(
+            title = "Bot Stats",
+            color = Color.dark_grey(),
+        )
+        stats_embed.add_field(name="Memory", value=f"RSS: `{rss_bytes() / 2**20:.1f}` MB", inline=False)
+
+        # Approximate size of every game, largest first
+        games = self.bot.get_games()
+        sizes = sorted(((deep_sizeof(game), channel_id) for channel_id, game in games.items()), reverse=True)
+        games_text = [f"Total: `{sum(size for size, _ in sizes) / 1024:.1f}` KB in `{len(sizes)}` games"]
+        games_text.extend(f"<#{channel_id}>: `{size / 1024:.1f}` KB" for size, channel_id in sizes[:5])
+        stats_embed.add_field(name="Games", value="\n".join(games_text), inline=False)
+
+        # Live game objects, to spot objects outliving their game or turn
+        counts = count_objects((CoupGame, Player, InfluenceCard, CardSwap, Action, Response, Embed))
+        stats_embed.add_field(name="Objects",
+            value="\n".join(f"{name}: `{count}`" for name, count in counts.most_common(15)) or "None")
+
+        # Games and gateway latency of each shard
+        latencies = dict(self.bot.latencies)
+        stats_embed.add_field(name="Shards", value="\n".join(
+            f"Shard {shard_id}: `{self.bot.game_count(shard_id)}` games, `{latency * 1000:.0f}` ms"
+            for shard_id, latency in sorted(latencies.items())[:10]) or "None connected", inline=False)
+
+        connection = self.bot._connection
+        stats_embed.add_field(name="Caches", value="\n".join((
+            f"Games: `{len(games)}`",
+            f"Users in games: `{self.bot.user_count()}`",
+            f"Guilds: `{len(self.bot.guilds)}`",
+            f"Users: `{len(self.bot.users)}`",
+            f"Messages: `{len(self.bot.cached_messages)}`",
+            f"DM channels: `{len(connection._private_channels)}`",
+        )))
+
+        allocations = top_allocations(5)
+        if allocations is None:
+            allocations_text = "Not tracing (`stats allocations on`)"
+        else:
+            allocations_text = "\n".join(f"`{site}`: `{size / 1024:.1f}` KB in `{count}` blocks"
+                                          for site, size, count in allocations) or "None"
+        stats_embed.add_field(name="Top allocations", value=allocations_text, inline=False)
+        return stats_embed
+
+    @commands.command(name="restart", help=RESTART_HELP)
+    async def restart(self, ctx):
+        '''
+        Hands the games off to a new process, then shuts down so the
+        launcher can start it
+        '''
+        print(f"Restart requested by {ctx.author} (id={ctx.author.id})")
+        await self.send(ctx.channel, "Saving games and restarting ...")
+        num_games, num_bytes, seconds = await self.bot.hand_off(channel_id=ctx.channel.id)
+        print(f"Handed off {num_games} games ({num_bytes / 1024:.1f} KB) in {seconds:.3f}s")
+        await self.send(ctx.channel, f"Saved `{num_games}` games (`{num_bytes / 1024:.1f}` KB) "
+                                     f"in `{seconds * 1000:.0f}` ms; restarting")
+        self.bot.restart_requested = True
+        await self.bot.close()
 
     @commands.command(name="quit", help=QUIT_HELP)
     async def quit(self, ctx):
         '''
-        Shuts down the bot
+        Shuts down the bot, once the running commands and game tasks finish
         '''
         print(f"Shut down by {ctx.author} (id={ctx.author.id})")
-        await ctx.send("Shutting down")
-        await self.bot.close()
-        input("Press enter to close ")
+        await self.send(ctx.channel, "Shutting down")
+        # started separately so shutting down does not wait on this command
+        self.bot.loop.create_task(self.bot.shut_down())
 
 
 def setup(bot):
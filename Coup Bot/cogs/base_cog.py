@@ -7,7 +7,9 @@ and will be used by other cogs to inherit default functionality
 
 # dependencies
 from discord.ext import commands
-import traceback
+
+# my code
+from helpers.outbound import OutboundScheduler
 
 
 class BaseCog(commands.Cog):
@@ -16,6 +18,7 @@ class BaseCog(commands.Cog):
     so they have access to the following default functionality:
         - cog_unload
         - cog_command_error
+        - send(destination, content, *, embed, priority, merge_key)
     '''
     def __init__(self, bot):
         '''
@@ -23,6 +26,20 @@ class BaseCog(commands.Cog):
         '''
         self.bot = bot
 
+    async def send(self, destination, content=None, *, embed=None,
+            priority=OutboundScheduler.NORMAL, merge_key=None):
+        '''
+        Sends a message through the bot's outbound scheduler
+        destination: channel or user to send the message to
+        content: str, representing the message text
+        embed: discord.Embed to send
+        priority: int, representing the OutboundScheduler priority
+        merge_key: hashable key; a queued message with the same key is replaced
+        Return: discord.Message that was sent (None for INFO messages)
+        '''
+        return await self.bot.outbound.send(destination, content, embed=embed,
+            priority=priority, merge_key=merge_key)
+
     def cog_unload(self):
         '''
         Displays default cog unload message
@@ -31,8 +48,15 @@ class BaseCog(commands.Cog):
 
     async def cog_command_error(self, ctx, error):
         '''
-        Handles errors by printing the error traceback
+        Handles errors by reporting them through the bot (see
+        CoupBot.report_error()), which logs the traceback unless the same
+        error was logged recently, and writes a crash dump with the game's
+        recent events and state for a command run in a game
         '''
-        print(f"ERROR in cog `{self.qualified_name}`:")
-        traceback.print_exc()
-        print("-----------" * 10 + "\n")
+        if isinstance(error, self.bot.USER_ERRORS):
+            # not a bug; the player is told by the bot's on_command_error
+            return
+
+        original = getattr(error, 'original', error)
+        context = f"cog `{self.qualified_name}`, command `{ctx.message.content}` by {ctx.author.id}"
+        self.bot.report_error(original, context, ctx.channel.id)
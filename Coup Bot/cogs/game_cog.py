@@ -8,15 +8,18 @@ This program creates the Game cog for the Coup Bot
 from discord import User, Embed, Color
 from discord.ext import commands
 import asyncio
+import random
 
 # my code
 from cogs.base_cog import BaseCog
+from helpers.spans import root, span, traced
+from helpers.outbound import OutboundScheduler
 from classes.coup_game import CoupGame
 from classes import actions, responses
 from helpers.command_checks import (channel_has_game, game_is_started, is_stage,
             game_not_started, is_player, is_turn,others_in_game, has_enough_coins,
             under_ten_coins, is_game_master, must_swap, must_kill, is_exchange,
-            exchange_time_up, not_swapped_yet)
+            exchange_time_up, not_swapped_yet, rejects_stale)
 
 
 # Removing a player during the game
@@ -56,10 +59,14 @@ class GameCog(BaseCog, name="game"):
         super().__init__(bot)
 
     async def cog_before_invoke(self, ctx):
+        '''
+        Traces the game state before every command in this Cog
+        '''
         game = self.bot.get_game(ctx.channel.id)
         if game is not None:
-            print("\nBefore:", "-"*45, game, sep='\n')
-            print("-"*45)
+            self.bot.tracer.event(ctx.channel.id, 'before_command', game.debug_snapshot,
+                                  command=ctx.command.qualified_name, author=ctx.author.id)
+            ctx.game_progress = self._game_progress(game)
 
     async def cog_after_invoke(self, ctx):
         '''
@@ -68,17 +75,181 @@ class GameCog(BaseCog, name="game"):
         '''
         game = self.bot.get_game(ctx.channel.id)
         if game is not None:
-            print("\nAfter:", "-"*45, game, sep='\n')
+            self.bot.tracer.event(ctx.channel.id, 'after_command', game.debug_snapshot,
+                                  command=ctx.command.qualified_name, author=ctx.author.id)
+
+            with span('after_invoke'):
+                # Commands that were only replied to (such as a bystander's
+                # `pass`) must not push back the timer of whoever the game is waiting on
+                moved = getattr(ctx, 'game_progress', None) != self._game_progress(game)
+
+                # Check if game / turn is over
+                await self._check_turn_over(ctx.channel, game, advance_if_possible=False)
+                await self._check_game_over(ctx.channel, game)
+
+                if moved and self.bot.get_game(ctx.channel.id) is game:
+                    # Player made a move, so restart the timer for the next one
+                    player = game.get_player(ctx.author.id)
+                    if player is not None:
+                        player.reset_timeouts()
+                    self.bot.reset_timer(ctx.channel, game)
+
+    @staticmethod
+    def _game_progress(game):
+        '''
+        Gets a marker of how far the game has got, which changes whenever a
+        move is made (the game's version does not change on a swap, so what
+        each player must do is included)
+        game: CoupGame to get the marker of
+        '''
+        return (game.version, tuple((player.must_kill, player.must_swap) for player in game.get_players()))
 
-            # Check if game / turn is over
-            await self._check_turn_over(ctx.channel, game, advance_if_possible=False)
-            await self._check_game_over(ctx.channel, game)
+    @commands.Cog.listener()
+    async def on_game_timeout(self, channel, game, timer):
+        '''
+        When the timer runs out on a game, makes the default move for
+        whatever the game was waiting on:
+            - `die` with the leftmost live card(s) for players that must kill
+            - `noswap` for a player that must finish their Exchange
+            - `income` for a player that has not made their Action (or a
+              `coup` on a random player, if they have to coup)
+            - `pass` on any optional responses
+        Players that time out too many times in a row are removed from the game
+        channel: discord.Channel where game is being played
+        game: CoupGame whose timer ran out
+        timer: asyncio.Task of the timer that ran out
+        '''
+        with root('timeout', channel=channel.id), \
+                self.bot.loop_monitor.attributed('timeout', channel.id):
+            async with self.bot.serialized(channel.id):
+                # a command may have moved the game on (and restarted the
+                # timer) while this waited for the channel
+                if self.bot.get_game(channel.id) is game and game.has_timer(timer):
+                    game.record('timeout')
+                    await self._make_default_moves(channel, game)
+
+    @commands.Cog.listener()
+    async def on_game_resumed(self, channel, game, tasks_interrupted):
+        '''
+        When a game is resumed by a new process after the bot restarted,
+        lets the channel know what the game is waiting on, and restarts the
+        countdown of an Exchange that was waiting for challenges
+        channel: discord.Channel where game is being played
+        game: CoupGame that was resumed
+        tasks_interrupted: bool, representing whether the game's background
+        tasks were stopped by the restart
+        '''
+        with root('resumed', channel=channel.id):
+            async with self.bot.serialized(channel.id):
+                if self.bot.get_game(channel.id) is not game:
+                    return
+                game.record('resumed')
+                await self.send(channel, "♻ Back online; the game continues where it left off")
+                if not game.is_active():
+                    return
+                await self.send(channel, embed=game.pending_players_embed(), priority=OutboundScheduler.INFO)
+                if tasks_interrupted:
+                    await self._restart_exchange_countdown(channel, game)
 
-            le = game.last_event()
-            if le is not None:
-                print("\nLast event:", le)
-                print("Wins challenge:", le.wins_challenge())
-            print("-"*45)
+    @commands.Cog.listener()
+    async def on_game_reloaded(self, channel, game, tasks_interrupted):
+        '''
+        When a game is moved into new versions of the game classes by a hot
+        reload, restarts the countdown of an Exchange that was waiting for
+        challenges (nothing else changes for the players)
+        channel: discord.Channel where game is being played
+        game: CoupGame that was reloaded
+        tasks_interrupted: bool, representing whether the game's background
+        tasks were stopped by the reload
+        '''
+        async with self.bot.serialized(channel.id):
+            if tasks_interrupted and self.bot.get_game(channel.id) is game and game.is_active():
+                await self._restart_exchange_countdown(channel, game)
+
+    async def _restart_exchange_countdown(self, channel, game):
+        '''
+        Starts the countdown again for an Exchange that was waiting for
+        challenges when its countdown was stopped (such as by a restart).
+        If it was already challenged, the new countdown settles the
+        challenge after its first second
+        channel: discord.Channel where game is being played
+        game: CoupGame to check for an Exchange
+        '''
+        exchange = game.action
+        if isinstance(exchange, actions.Exchange) and not exchange.time_is_up():
+            await self._start_exchange_countdown(channel, game, exchange)
+
+    async def _make_default_moves(self, channel, game):
+        '''
+        Makes the default moves for a game whose timer ran out
+        (see on_game_timeout)
+        channel: discord.Channel where game is being played
+        game: CoupGame whose timer ran out
+        '''
+        # Make the default moves, keeping track of who was being waited on
+        timed_out = []
+        pending_players = game.get_pending_players()
+        if len(pending_players) > 0:
+            for player in pending_players:
+                if player.must_kill > 0:
+                    timed_out.append(player)
+                    await self.send(channel, f"{player.get_mention()} ran out of time to choose a card to die")
+                    alive_indexes = [i for i in range(game.influences_per_player()) if player[i].alive]
+                    await self._perform_death(channel, game, player, alive_indexes[:player.must_kill])
+                elif player.must_swap:
+                    exchange = game.action
+                    if isinstance(exchange, actions.Exchange) and exchange.time_is_up() \
+                            and not exchange.has_swapped() and exchange.get_card(0) is not None:
+                        # only once the top two cards have been drawn
+                        timed_out.append(player)
+                        exchange.perform_swap(None, 0, game)
+                        player.must_swap = False
+                        await self.send(channel, f"{player.get_mention()} ran out of time to swap; skipped swap and shuffled draw pile")
+        elif game.action is None:
+            # Player did not make their Action
+            player = game.get_turn()
+            timed_out.append(player)
+            await self.send(channel, f"{player.get_mention()} ran out of time to make an action")
+            if player.must_coup():
+                # Income is not allowed with 10+ coins, so coup someone at random
+                others = [other for other in game.get_players() if other is not player and other.life_count() > 0]
+                target = random.choice(others)
+                game.action = actions.LaunchCoup(player, target)
+                game.action.perform_action()
+                await self.send(channel, game.action.attempt_message())
+                await self.send(target.get_user(), embed=game.action.available_responses(channel.mention),
+                                priority=OutboundScheduler.CRITICAL)
+            else:
+                game.action = actions.Income(player)
+                game.action.perform_action()
+                await self.send(channel, game.action.attempt_message())
+        else:
+            # Nobody made any optional responses
+            action = game.action
+            if game.get_stage() == CoupGame.CHALLENGE2_STAGE:
+                response = game.response
+                timed_out.append(response.response_to)
+                game.challenge2 = responses.Pass(response.response_to, response.response_by)
+                await self.send(channel, game.challenge2.attempt_message())
+            elif action.done_to is not None and game.response is None:
+                timed_out.append(action.done_to)
+                game.response = responses.Pass(action.done_to, action.done_by)
+                await self.send(channel, game.response.attempt_message())
+            game.pending = False
+
+        # Finish the turn if possible
+        await self._check_turn_over(channel, game, advance_if_possible=True)
+
+        # Remove any players that keep timing out
+        for player in timed_out:
+            if game.get_player(player.get_id()) is player and \
+                    player.add_timeout() >= CoupGame.MAX_TIMEOUTS and not game.is_over():
+                await self.send(channel, f"{player.get_mention()} timed out too many times and was removed from the game")
+                await self._kill_remaining_cards(channel, game, player)
+                await self.bot.process_player_remove(channel, game, player)
+
+        if not await self._check_game_over(channel, game):
+            self.bot.reset_timer(channel, game)
 
 
     ################################### ACTION COMMANDS ################################
@@ -105,8 +276,8 @@ class GameCog(BaseCog, name="game"):
         # Create and perform the Action
         game.action = actions.Steal(player, other_player)
         game.action.perform_action()
-        await ctx.send(game.action.attempt_message())
-        await user.send(embed=game.action.available_responses(ctx.channel.mention))
+        await self.send(ctx.channel, game.action.attempt_message())
+        await self.send(user, embed=game.action.available_responses(ctx.channel.mention), priority=OutboundScheduler.CRITICAL)
 
     @steal_from_player.before_invoke
     async def before_steal_from_player(self, ctx):
@@ -119,7 +290,7 @@ class GameCog(BaseCog, name="game"):
         stealing_from = game.get_player(user.id)
         if stealing_from.get_coins() < 1:
             # user doesn't have enough coins to steal from
-            await ctx.send(f"{user.mention} is too broke to steal from")
+            await self.send(ctx.channel, f"{user.mention} is too broke to steal from")
             raise commands.CheckFailure(f"{user.mention} is too broke to steal from")
         await self.pre_action_check(ctx)
 
@@ -143,8 +314,17 @@ class GameCog(BaseCog, name="game"):
         exchange = actions.Exchange(player)
         game.action = exchange
         exchange.perform_action()
-        await ctx.send(exchange.attempt_message())
+        await self.send(ctx.channel, exchange.attempt_message())
+        await self._start_exchange_countdown(ctx.channel, game, exchange)
 
+    async def _start_exchange_countdown(self, channel, game, exchange):
+        '''
+        Shows the time left to challenge an Exchange, and counts it down
+        in the background
+        channel: discord.Channel where game is being played
+        game: CoupGame the Exchange was made in
+        exchange: Exchange waiting for challenges
+        '''
         # Wait for someone to challenge before continuing
         wait_time = actions.Exchange.get_wait_time()
         wait_embed = Embed(
@@ -152,46 +332,69 @@ class GameCog(BaseCog, name="game"):
             description = f"{wait_time} seconds remaining",
             color = Color.orange(),
         )
-        msg = await ctx.send(embed=wait_embed)
+        msg = await self.send(channel, embed=wait_embed)
         exchange.set_time_up(False)
+
+        # Count down in the background so the channel is free for challenges
+        self.bot.start_game_task(
+            self._wait_for_exchange_challenges(channel, game, exchange, msg, wait_embed), channel.id)
+
+    async def _wait_for_exchange_challenges(self, channel, game, exchange, msg, wait_embed):
+        '''
+        Counts down the time to challenge an Exchange, then either cancels
+        it or shows the player the top two cards
+        channel: discord.Channel where game is being played
+        game: CoupGame the Exchange was made in
+        exchange: Exchange waiting for challenges
+        msg: discord.Message showing the time remaining
+        wait_embed: Embed shown in `msg`
+        '''
         await asyncio.sleep(1)
-        for i in range(wait_time - 1, 0, -1):
+        for i in range(exchange.get_wait_time() - 1, 0, -1):
             if game.challenge1 is not None:
                 # challenge occurred; continue and see if won
-                exchange.set_time_up(True)
                 break
             wait_embed.description = f"{i} seconds remaining"
-            await msg.edit(embed=wait_embed)
+            await self.bot.outbound.edit(msg, embed=wait_embed)
             await asyncio.sleep(1)
 
         # Wait is over
-        exchange.set_time_up(True)
-        if game.challenge1 is not None and not exchange.wins_challenge():
-            # Exchange failed
-            wait_embed.description = "CANCELLED"
-            wait_embed.color = Color.red()
-            await msg.edit(embed=wait_embed)
-            await ctx.send("Exchange cancelled")
-        else:
-            # Carry out the exchange
-            wait_embed.description = "SUCCESS"
-            wait_embed.color = Color.green()
-            await msg.edit(embed=wait_embed)
-            await ctx.send(f"Showing {exchange.done_by.get_mention()} top 2 cards")
-
-            # Draw the top two cards
-            exchange.set_card(0, game.draw_card())
-            exchange.set_card(1, game.draw_card())
-            card_embed = Embed(
-                title = "Top Two Cards",
-                description = "Use `c!hand` if you need to see your hand.\nSelect a card to swap with:",
-                color = Color.green(),
-            )
-            card_embed.set_footer(text="c!swap <yourCardIndex> <otherCardIndex>\nc!noswap")
-            card_embed.add_field(name="Card 1", value=exchange.get_card(0).capitalize())
-            card_embed.add_field(name="Card 2", value=exchange.get_card(1).capitalize())
-
-            await exchange.done_by.get_user().send(embed=card_embed)
+        async with self.bot.serialized(channel.id):
+            exchange.set_time_up(True)
+            if self.bot.get_game(channel.id) is not game or game.action is not exchange:
+                # game or turn ended during the wait
+                return
+
+            if game.challenge1 is not None and game.challenge1.challenger_won():
+                # Exchange failed; there is nothing left to swap
+                exchange.done_by.must_swap = False
+                wait_embed.description = "CANCELLED"
+                wait_embed.color = Color.red()
+                await self.bot.outbound.edit(msg, embed=wait_embed, priority=OutboundScheduler.NORMAL)
+                await self.send(channel, "Exchange cancelled")
+            else:
+                # Carry out the exchange
+                wait_embed.description = "SUCCESS"
+                wait_embed.color = Color.green()
+                await self.bot.outbound.edit(msg, embed=wait_embed, priority=OutboundScheduler.NORMAL)
+                await self.send(channel, f"Showing {exchange.done_by.get_mention()} top 2 cards")
+
+                # Draw the top two cards
+                exchange.set_card(0, game.draw_card())
+                exchange.set_card(1, game.draw_card())
+                card_embed = Embed(
+                    title = "Top Two Cards",
+                    description = "Use `c!hand` if you need to see your hand.\nSelect a card to swap with:",
+                    color = Color.green(),
+                )
+                card_embed.set_footer(text="c!swap <yourCardIndex> <otherCardIndex>\nc!noswap")
+                card_embed.add_field(name="Card 1", value=exchange.get_card(0).capitalize())
+                card_embed.add_field(name="Card 2", value=exchange.get_card(1).capitalize())
+
+                await self.send(exchange.done_by.get_user(), embed=card_embed, priority=OutboundScheduler.CRITICAL)
+
+            # Player now has until the swap timeout to swap
+            self.bot.reset_timer(channel, game)
 
     @commands.command(name="swap", help=SWAP_HELP)
     @exchange_time_up(True)
@@ -215,20 +418,20 @@ class GameCog(BaseCog, name="game"):
         your_card -= 1
         swap_with -= 1
         if not (0 <= your_card < game.influences_per_player()):
-            await ctx.send(f"Invalid index: `your_card={your_card + 1}`")
+            await self.send(ctx.channel, f"Invalid index: `your_card={your_card + 1}`")
             return
         if not player[your_card].alive:
-            await ctx.send(f"Your card `{your_card + 1}` is not alive")
+            await self.send(ctx.channel, f"Your card `{your_card + 1}` is not alive")
             return
         if not (0 <= swap_with <= 1):
-            await ctx.send(f"Invalid index: `swap_with={swap_with + 1}`")
+            await self.send(ctx.channel, f"Invalid index: `swap_with={swap_with + 1}`")
             return
 
         # Perform the swap
-        await player.get_user().send(f"Swapped your `{player[your_card].type.capitalize()}`, for `{game.action.get_card(swap_with).capitalize()}`")
+        await self.send(player.get_user(), f"Swapped your `{player[your_card].type.capitalize()}`, for `{game.action.get_card(swap_with).capitalize()}`", priority=OutboundScheduler.CRITICAL)
         game.action.perform_swap(your_card, swap_with, game)
         player.must_swap = False
-        await ctx.send("Performed swap and shuffled draw pile")
+        await self.send(ctx.channel, "Performed swap and shuffled draw pile")
 
         await self._check_turn_over(ctx.channel, game, advance_if_possible=True)
 
@@ -250,7 +453,7 @@ class GameCog(BaseCog, name="game"):
 
         game.action.perform_swap(None, 0, game)
         player.must_swap = False
-        await ctx.send("Skipped swap and shuffled draw pile")
+        await self.send(ctx.channel, "Skipped swap and shuffled draw pile")
 
         await self._check_turn_over(ctx.channel, game, advance_if_possible=True)
 
@@ -276,8 +479,8 @@ class GameCog(BaseCog, name="game"):
         # Create and perform the Action
         game.action = actions.Assassinate(player, other_player)
         game.action.perform_action()
-        await ctx.send(game.action.attempt_message())
-        await user.send(embed=game.action.available_responses(ctx.channel.mention))
+        await self.send(ctx.channel, game.action.attempt_message())
+        await self.send(user, embed=game.action.available_responses(ctx.channel.mention), priority=OutboundScheduler.CRITICAL)
 
     @commands.command(name="tax", help=TAX_HELP, aliases=['duke'])
     @under_ten_coins()
@@ -297,7 +500,7 @@ class GameCog(BaseCog, name="game"):
         # Create and perform the Action
         game.action = actions.Tax(player)
         game.action.perform_action()
-        await ctx.send(game.action.attempt_message())
+        await self.send(ctx.channel, game.action.attempt_message())
 
     @commands.command(name="income", help=INCOME_HELP)
     @under_ten_coins()
@@ -317,7 +520,7 @@ class GameCog(BaseCog, name="game"):
         # Create and perform the Action
         game.action = actions.Income(player)
         game.action.perform_action()
-        await ctx.send(game.action.attempt_message())
+        await self.send(ctx.channel, game.action.attempt_message())
 
     @commands.command(name="foreignaid", help=FOREIGNAID_HELP)
     @under_ten_coins()
@@ -337,8 +540,8 @@ class GameCog(BaseCog, name="game"):
         # Create and perform the Action
         game.action = actions.ForeignAid(player)
         game.action.perform_action()
-        await ctx.send(game.action.attempt_message())
-        await ctx.send(embed=game.action.available_responses(ctx.channel.mention))
+        await self.send(ctx.channel, game.action.attempt_message())
+        await self.send(ctx.channel, embed=game.action.available_responses(ctx.channel.mention), priority=OutboundScheduler.CRITICAL)
 
     @commands.command(name="coup", help=COUP_HELP)
     @others_in_game(1, "coup")
@@ -361,8 +564,8 @@ class GameCog(BaseCog, name="game"):
         # Create and perform the Action
         game.action = actions.LaunchCoup(player, other_player)
         game.action.perform_action()
-        await ctx.send(game.action.attempt_message())
-        await user.send(embed=game.action.available_responses(ctx.channel.mention))
+        await self.send(ctx.channel, game.action.attempt_message())
+        await self.send(user, embed=game.action.available_responses(ctx.channel.mention), priority=OutboundScheduler.CRITICAL)
 
     # CHECK BEFORE EACH ACTION IF THE TURN / GAME IS OVER
     # (steal not included because it has a more specific check above)
@@ -403,6 +606,7 @@ class GameCog(BaseCog, name="game"):
     @is_player()
     @channel_has_game()
     @commands.guild_only()
+    @rejects_stale()
     async def block_action(self, ctx, influence="auto-determine"):
         '''
         Blocks another player's action from this turn
@@ -416,16 +620,16 @@ class GameCog(BaseCog, name="game"):
         # Check if player is allowed to block player_to_block
         if not game.action.is_blockable():
             # action itself cannot be blocked
-            await ctx.send(f"{game.action.done_by.get_mention()}'s action is not blockable")
+            await self.send(ctx.channel, f"{game.action.done_by.get_mention()}'s action is not blockable")
             return
         elif not isinstance(game.action, actions.ForeignAid) and \
                 game.action.done_to is not player:
             # not foreign aid, so block must be by `done_to` player
-            await ctx.send(f"Only {game.action.done_to.get_mention()} is allowed to block")
+            await self.send(ctx.channel, f"Only {game.action.done_to.get_mention()} is allowed to block")
             return
         elif player is player_to_block:
             # tried to block self
-            await ctx.send("You can't block yourself")
+            await self.send(ctx.channel, "You can't block yourself")
             return
 
         # Auto determine the influence if necessary
@@ -443,12 +647,12 @@ class GameCog(BaseCog, name="game"):
                 influence = "doublecontessa"
             elif isinstance(game.action, actions.Steal):
                 # blocking a steal with either Captain or Ambassador, but didn't specify
-                await ctx.send("Please specify whether you are blocking with Captain or Ambassador")
+                await self.send(ctx.channel, "Please specify whether you are blocking with Captain or Ambassador")
                 return
 
         # Make sure the block is possible with the given card
         if not game.action.can_block_with(influence):
-            await ctx.send(f"`{influence.capitalize()}` is unable to block {player_to_block.get_mention()}'s action")
+            await self.send(ctx.channel, f"`{influence.capitalize()}` is unable to block {player_to_block.get_mention()}'s action")
             return
 
         # Convert the influence type into the correct Reponse class
@@ -463,7 +667,7 @@ class GameCog(BaseCog, name="game"):
         elif influence == "doublecontessa":
             response = responses.DoubleContessaBlock(player, player_to_block)
         else:
-            await ctx.send("""```Please name a valid influence to block with:
+            await self.send(ctx.channel, """```Please name a valid influence to block with:
   - contessa
   - captain
   - ambassador
@@ -476,7 +680,7 @@ class GameCog(BaseCog, name="game"):
 
         # set the game's Response stage to the newly created response
         game.response = response
-        await ctx.send(response.attempt_message())
+        await self.send(ctx.channel, response.attempt_message())
 
     @commands.command(name="pass", help=PASS_HELP)
     @commands.check_any(
@@ -487,6 +691,7 @@ class GameCog(BaseCog, name="game"):
     @is_player()
     @channel_has_game()
     @commands.guild_only()
+    @rejects_stale()
     async def pass_response(self, ctx):
         '''
         Lets a player pass on responding, allowing the other
@@ -503,7 +708,7 @@ class GameCog(BaseCog, name="game"):
         action = game.action
         if (action is None) or (not action.is_blockable()):
             # there was no choice between blocking / challenging and passing
-            await ctx.send("Nothing to pass on")
+            await self.send(ctx.channel, "Nothing to pass on")
             return
         game_stage = game.get_stage()
 
@@ -513,7 +718,7 @@ class GameCog(BaseCog, name="game"):
             if game_stage == CoupGame.CHALLENGE1_STAGE or game_stage == CoupGame.RESPONSE_STAGE:
                 # Allows the Action to complete unchecked (turn ends)
                 game.response = responses.Pass(action.done_to, action.done_by)
-                await ctx.send(game.response.attempt_message())
+                await self.send(ctx.channel, game.response.attempt_message())
             else:
                 return
 
@@ -524,13 +729,13 @@ class GameCog(BaseCog, name="game"):
                 # Allows the (Block) Response to go through
                 response = game.response
                 game.challenge2 = responses.Pass(response.response_to, response.response_by)
-                await ctx.send(game.challenge2.attempt_message())
+                await self.send(ctx.channel, game.challenge2.attempt_message())
             else:
                 return
 
         # done by a general user
         else:
-            await ctx.send("You are unable to pass")
+            await self.send(ctx.channel, "You are unable to pass")
             return
 
         # Pass means the game is no longer pending
@@ -543,6 +748,7 @@ class GameCog(BaseCog, name="game"):
     @is_player()
     @channel_has_game()
     @commands.guild_only()
+    @rejects_stale()
     async def challenge_player(self, ctx):
         '''
         Challenges the last user who did an action
@@ -558,13 +764,13 @@ class GameCog(BaseCog, name="game"):
                 player_to_challenge = game.action.done_by
                 if ctx.author.id == player_to_challenge.get_id():
                     # trying to challenge themself
-                    await ctx.send("You can't challenge yourself")
+                    await self.send(ctx.channel, "You can't challenge yourself")
                     return
 
                 # Create and carry out the challenge (automatically undoes the action)
                 challenge = responses.Challenge(player, player_to_challenge)
                 game.action.undo_action()
-                await ctx.send(challenge.attempt_message())
+                await self.send(ctx.channel, challenge.attempt_message())
                 if game.action.done_to is not None and ctx.author.id == game.action.done_to.get_id():
                     # user is responding with Challenge -> store as response
                     game.response = challenge
@@ -573,7 +779,7 @@ class GameCog(BaseCog, name="game"):
                     game.challenge1 = challenge
                 await self.handle_challenge(ctx, game, game.action, challenge)
             else:
-                await ctx.send(f"Can't challenge {game.action.done_by.get_mention()}'s action")
+                await self.send(ctx.channel, f"Can't challenge {game.action.done_by.get_mention()}'s action")
                 return
 
         elif game_stage == CoupGame.CHALLENGE2_STAGE:
@@ -582,17 +788,18 @@ class GameCog(BaseCog, name="game"):
                 player_to_challenge = game.response.response_by
                 if ctx.author.id == player_to_challenge.get_id():
                     # trying to challenge themself
-                    await ctx.send("You can't challenge yourself")
+                    await self.send(ctx.channel, "You can't challenge yourself")
                     return
                 else:
                     # create and carry out the Challenge
                     game.challenge2 = responses.Challenge(player, player_to_challenge)
-                    await ctx.send(game.challenge2.attempt_message())
+                    await self.send(ctx.channel, game.challenge2.attempt_message())
                     await self.handle_challenge(ctx, game, game.response, game.challenge2)
             else:
-                await ctx.send(f"Can't challenge {game.response.response_by.get_mention()}'s action")
+                await self.send(ctx.channel, f"Can't challenge {game.response.response_by.get_mention()}'s action")
                 return
 
+    @traced('handle_challenge')
     async def handle_challenge(self, ctx, game, action, challenge):
         '''
         Handles the given challenge by checking the result
@@ -603,9 +810,10 @@ class GameCog(BaseCog, name="game"):
         '''
         challenged = challenge.response_to
         challenger = challenge.response_by
-        if action.wins_challenge():
+        challenge.set_result(not action.wins_challenge())
+        if not challenge.challenger_won():
             # Action was valid (challenged player wins)
-            await ctx.send(f"{challenged.get_mention()} won the challenge!")
+            await self.send(ctx.channel, f"{challenged.get_mention()} won the challenge!")
             if isinstance(action, actions.Action):
                 # person who made Action won; redo the action
                 action.perform_action()
@@ -617,7 +825,7 @@ class GameCog(BaseCog, name="game"):
             action.swapped = True
         else:
             # Action was a bluff (challenger wins)
-            await ctx.send(f"{challenger.get_mention()} won the challenge!")
+            await self.send(ctx.channel, f"{challenger.get_mention()} won the challenge!")
             if isinstance(action, actions.Action):
                 pass
                 # challenger won against person who made Action; undo the action
@@ -648,27 +856,19 @@ class GameCog(BaseCog, name="game"):
             card_indexes = {int(num) - 1 for num in card_nums}
             if len(card_indexes) != player.must_kill:
                 # they aren't killing the correct number
-                await ctx.send(f"Need to kill `{player.must_kill}` cards, try again")
+                await self.send(ctx.channel, f"Need to kill `{player.must_kill}` cards, try again")
                 return
             for i in card_indexes:
                 if not player[i].alive:
                     # tried to kill a card that wasn't alive
-                    await ctx.send(f"Card `{i + 1}` is not alive, try again")
+                    await self.send(ctx.channel, f"Card `{i + 1}` is not alive, try again")
                     return
         except:
-            await ctx.send(f"Card `{i + 1}` is not valid, try again")
+            await self.send(ctx.channel, f"Card `{i + 1}` is not valid, try again")
             return
 
         # Create and perform the action
-        response = responses.Die(player, *card_indexes)
-        response.perform_action()
-        game.add_death(response)
-        await ctx.send(response.complete_message())
-
-        # Check if the player is eliminated
-        if player.is_eliminated():
-            await self.bot.process_player_remove(ctx.channel, game, player)
-            await ctx.send(f"{ctx.author.mention} was eliminated")
+        await self._perform_death(ctx.channel, game, player, card_indexes)
 
 
     ############################## REMOVING PLAYERS FROM GAME ##############################
@@ -687,23 +887,13 @@ class GameCog(BaseCog, name="game"):
         game = self.bot.get_game(ctx.channel.id)
         if game.is_active():
             player = game.get_player(user.id)
-
-            # Kill their cards
-            cards_killed = []
-            for i in range(game.influences_per_player()):
-                card = player[i]
-                if card.alive:
-                    game.add_to_dead_pile(card.type)
-                    cards_killed.append(card.type.capitalize())
-            if len(cards_killed) > 0:
-                await ctx.send(f"{user.mention}'s {', '.join(cards_killed)} was killed")
-
+            await self._kill_remaining_cards(ctx.channel, game, player)
             await self.bot.process_player_remove(ctx.channel, game, player)
         else:
             # game hasn't started yet
             game.unsign_up_player(user.id)
             self.bot.set_user_status(user.id, False)
-        await ctx.send(f"Removed {user.mention} from game")
+        await self.send(ctx.channel, f"Removed {user.mention} from game")
 
     @commands.command(name="forfeit", help=FORFEIT_HELP)
     @is_player()
@@ -715,31 +905,58 @@ class GameCog(BaseCog, name="game"):
         '''
         game = self.bot.get_game(ctx.channel.id)
         if not game.is_active():
-            await ctx.send(f"Please use `{self.bot.command_prefix}leave` to leave the game")
+            await self.send(ctx.channel, f"Please use `{self.bot.command_prefix}leave` to leave the game")
         elif game.player_count() == 1:
             # Last player is leaving game; delete game
             self.bot.set_user_status(user.id, False)
             self.bot.remove_game(channel_id)
-            await ctx.send("No players remain - game cancelled")
+            await self.send(ctx.channel, "No players remain - game cancelled")
         else:
             player = game.get_player(ctx.author.id)
-            await ctx.send(ctx.author.mention + " left the game")
-
-            # Kill their cards
-            cards_killed = []
-            for i in range(game.influences_per_player()):
-                card = player[i]
-                if card.alive:
-                    game.add_to_dead_pile(card.type)
-                    cards_killed.append(card.type.capitalize())
-            if len(cards_killed) > 0:
-                await ctx.send(f"{ctx.author.mention}'s {', '.join(cards_killed)} was killed")
-
+            await self.send(ctx.channel, ctx.author.mention + " left the game")
+            await self._kill_remaining_cards(ctx.channel, game, player)
             await self.bot.process_player_remove(ctx.channel, game, player)
 
 
     ################################# HELPER METHODS ###############################
 
+    async def _perform_death(self, channel, game, player, card_indexes):
+        '''
+        Kills the given cards of the player, and removes the player
+        from the game if they are eliminated
+        channel: discord.Channel where game is being played
+        game: CoupGame the player is in
+        player: Player whose cards are dying
+        card_indexes: collection of ints, representing the indexes of the
+        cards to kill (indexed from 0)
+        '''
+        response = responses.Die(player, *card_indexes)
+        response.perform_action()
+        game.add_death(response)
+        await self.send(channel, response.complete_message())
+
+        # Check if the player is eliminated
+        if player.is_eliminated():
+            await self.bot.process_player_remove(channel, game, player)
+            await self.send(channel, f"{player.get_mention()} was eliminated")
+
+    async def _kill_remaining_cards(self, channel, game, player):
+        '''
+        Adds all of a player's live cards to the dead pile, for when
+        they are being removed from the game
+        channel: discord.Channel where game is being played
+        game: CoupGame the player is in
+        player: Player being removed
+        '''
+        cards_killed = []
+        for i in range(game.influences_per_player()):
+            card = player[i]
+            if card.alive:
+                game.add_to_dead_pile(card.type)
+                cards_killed.append(card.type.capitalize())
+        if len(cards_killed) > 0:
+            await self.send(channel, f"{player.get_mention()}'s {', '.join(cards_killed)} was killed")
+
     async def _prompt_response(self, channel, game):
         '''
         Helper method that prompts the player for their response to
@@ -750,16 +967,17 @@ class GameCog(BaseCog, name="game"):
         # Find what is being responded to
         if game.challenge2 is not None:
             responding_to = game.challenge2
-            if game.response.wins_challenge():
-                player = game.challenge2.response_by  # player who challenged must respond
-            else:
+            if isinstance(game.challenge2, responses.Challenge) and game.challenge2.challenger_won():
                 player = game.challenge2.response_to  # player who was challenged must respond
+            else:
+                # challenged player won (or the Response was let through with a Pass)
+                player = game.challenge2.response_by  # player who challenged must respond
         elif game.response is not None:
             responding_to = game.response
             player = responding_to.response_to
         elif game.challenge1 is not None:
             responding_to = game.challenge1
-            if game.action.wins_challenge():
+            if not game.challenge1.challenger_won():
                 player = game.challenge1.response_by  # player who challenged must respond
             else:
                 player = game.challenge1.response_to  # player who was challenged must respond
@@ -773,13 +991,14 @@ class GameCog(BaseCog, name="game"):
 
         if player is None:
             # asking for general responses
-            await channel.send(
+            await self.send(channel,
                 "Waiting for general response ...",
-                embed=responding_to.available_responses(channel.mention))
+                embed=responding_to.available_responses(channel.mention),
+                priority=OutboundScheduler.CRITICAL)
         else:
             # asking user sepecifically
-            await channel.send(f"Waiting for {player.get_mention()}'s response ...")
-            await player.get_user().send(embed=responding_to.available_responses(channel.mention))
+            await self.send(channel, f"Waiting for {player.get_mention()}'s response ...", priority=OutboundScheduler.CRITICAL)
+            await self.send(player.get_user(), embed=responding_to.available_responses(channel.mention), priority=OutboundScheduler.CRITICAL)
 
     async def _check_turn_rotation(self, channel, game, player):
         '''
@@ -798,6 +1017,7 @@ class GameCog(BaseCog, name="game"):
         # was not their turn
         return False
 
+    @traced('check_turn_over')
     async def _check_turn_over(self, channel, game, *, advance_if_possible=True, send_prompt=True):
         '''
         Checks if the current turn is over for the given game. If the turn
@@ -813,29 +1033,31 @@ class GameCog(BaseCog, name="game"):
         if game.soft_pending and not advance_if_possible:
             # game is soft pending and don't need to advance if necessary
             if not game.hard_pending and game.action is not None:
-                await channel.send(f"Respond, or {game.get_next_turn().get_mention()} is next up")
+                await self.send(channel, f"Respond, or {game.get_next_turn().get_mention()} is next up", priority=OutboundScheduler.CRITICAL)
             return
         elif game.is_over():
             # Send the last turn summary
-            await channel.send(embed=game.turn_summary())
+            await self.send(channel, embed=game.turn_summary())
             return
         elif game.hard_pending:
             # Send which specific players have pending moves
-            await channel.send(embed=game.pending_players_embed())
+            await self.send(channel, embed=game.pending_players_embed(),
+                priority=OutboundScheduler.INFO, merge_key=('pending', channel.id))
             return False
         elif game.turn_can_complete():
             # Swap cards for any supers used
             await self._check_super_swaps(channel, game)
 
             # Send turn summary and advance to next turn
-            await channel.send(embed=game.turn_summary())
+            await self.send(channel, embed=game.turn_summary())
             game.next_turn()
             if send_prompt:
                 # Prompt user for their action
-                await channel.send(f"It is now {game.get_turn().get_mention()}'s turn")
+                await self.send(channel, f"It is now {game.get_turn().get_mention()}'s turn", priority=OutboundScheduler.CRITICAL)
                 await self.bot.prompt_action(channel)
             return True
 
+    @traced('check_game_over')
     async def _check_game_over(self, channel, game):
         '''
         Checks if the given game is over. If it is over, sends the
@@ -848,7 +1070,7 @@ class GameCog(BaseCog, name="game"):
         if game.is_over():
             # game has a winner
             winner = game.get_winner()
-            await channel.send(f"Game over - {winner.get_mention()} was victorious 🎉")
+            await self.send(channel, f"Game over - {winner.get_mention()} was victorious 🎉")
             self.bot.remove_game(channel.id)
             return True
         else:
@@ -873,6 +1095,7 @@ class GameCog(BaseCog, name="game"):
             # Response was a super and has not been swapped yet
             await self._handle_swap(channel, game, response.response_by, response, revealed=False)
 
+    @traced('handle_swap')
     async def _handle_swap(self, channel, game, player, action, *, revealed):
         '''
         Handles a card swap for the player in the given game, for the given action. The
@@ -892,8 +1115,8 @@ class GameCog(BaseCog, name="game"):
                 for _ in range(num):
                     maybe_swapped.append(influence_type.capitalize())
             card_text = f"(maybe) `{'`, `'.join(maybe_swapped)}`"
-        await channel.send(f"Swapped {player.get_mention()}'s revealed {card_text} for new cards")
-        await player.get_user().send(swapped_cards.summary_text())
+        await self.send(channel, f"Swapped {player.get_mention()}'s revealed {card_text} for new cards")
+        await self.send(player.get_user(), swapped_cards.summary_text(), priority=OutboundScheduler.CRITICAL)
         action.swapped = True
 
 
@@ -10,6 +10,7 @@ from discord import User, Embed, Color
 
 # my code
 from cogs.base_cog import BaseCog
+from helpers.outbound import OutboundScheduler
 from classes.coup_game import CoupGame
 from helpers.command_checks import channel_has_game, is_player, game_is_started
 
@@ -42,14 +43,16 @@ class InfoCog(BaseCog, name="info"):
         Sends the embed representing the game settings
         '''
         game = self.bot.get_game(ctx.channel.id)
-        await ctx.send(embed=game.setup_embed(ctx.channel.mention))
+        await self.send(ctx.channel, embed=game.setup_embed(ctx.channel.mention),
+            priority=OutboundScheduler.INFO, merge_key=('settings', ctx.channel.id))
 
     @commands.command(name="rules", help=RULES_HELP)
     async def send_rules(self, ctx):
         '''
         Sends the embed representing the game rules
         '''
-        await ctx.send(embed=CoupGame.rules_embed(self.bot.command_prefix))
+        await self.send(ctx.channel, embed=CoupGame.rules_embed(self.bot.command_prefix),
+            priority=OutboundScheduler.INFO, merge_key=('rules', ctx.channel.id))
 
     @commands.command(name="guide", help=GUIDE_HELP)
     async def send_guide(self, ctx):
@@ -92,7 +95,8 @@ class InfoCog(BaseCog, name="info"):
         guide_embed.add_field(name="Descriptions", value="\n".join(info[2] for info in responses))
 
         guide_embed.set_footer(text=f"See {prefix}rules for game rules")
-        await ctx.send(embed=guide_embed)
+        await self.send(ctx.channel, embed=guide_embed,
+            priority=OutboundScheduler.INFO, merge_key=('guide', ctx.channel.id))
 
     @commands.command(name="coins", help=COINS_HELP)
     @game_is_started()
@@ -107,13 +111,13 @@ class InfoCog(BaseCog, name="info"):
         game = self.bot.get_game(ctx.channel.id)
         if user is None:
             player = game.get_player(ctx.author.id)
-            await ctx.send(f"You have `{player.get_coins()}` coins")
+            await self.send(ctx.channel, f"You have `{player.get_coins()}` coins")
         else:
             player = game.get_player(user.id)
             if player is None:
-                await ctx.send(f"{user.mention} is not part of this game")
+                await self.send(ctx.channel, f"{user.mention} is not part of this game")
             else:
-                await ctx.send(f"{user.mention} has `{player.get_coins()}` coins")
+                await self.send(ctx.channel, f"{user.mention} has `{player.get_coins()}` coins")
 
     @commands.command(name="hand", help=HAND_HELP)
     @game_is_started()
@@ -130,13 +134,13 @@ class InfoCog(BaseCog, name="info"):
 
         if user is None:
             player = game.get_player(ctx.author.id)
-            await ctx.author.send(embed=player.get_embed(ctx))
+            await self.send(ctx.author, embed=player.get_embed(ctx), priority=OutboundScheduler.CRITICAL)
         else:
             player = game.get_player(user.id)
             if player is None:
-                await ctx.send(f"{user.mention} is not part of this game")
+                await self.send(ctx.channel, f"{user.mention} is not part of this game")
             else:
-                await ctx.send(embed=player.get_visible_embed())
+                await self.send(ctx.channel, embed=player.get_visible_embed())
 
     @commands.command(name="turn", help=TURN_HELP)
     @game_is_started()
@@ -147,7 +151,7 @@ class InfoCog(BaseCog, name="info"):
         Show whos turn it is
         '''
         game = self.bot.get_game(ctx.channel.id)
-        await ctx.send(f"It is {game.get_turn().get_mention()}'s turn")
+        await self.send(ctx.channel, f"It is {game.get_turn().get_mention()}'s turn")
 
     @commands.command(name="dead", help=DEAD_HELP)
     @game_is_started()
@@ -158,7 +162,8 @@ class InfoCog(BaseCog, name="info"):
         Shows the pile of dead cards
         '''
         game = self.bot.get_game(ctx.channel.id)
-        await ctx.send(embed=game.dead_embed())
+        await self.send(ctx.channel, embed=game.dead_embed(),
+            priority=OutboundScheduler.INFO, merge_key=('dead', ctx.channel.id))
 
     @commands.command(name="pending", help=PENDING_HELP, aliases=['pend'])
     @game_is_started()
@@ -169,7 +174,8 @@ class InfoCog(BaseCog, name="info"):
         Sends the summary of pending players
         '''
         game = self.bot.get_game(ctx.channel.id)
-        await ctx.send(embed=game.pending_players_embed())
+        await self.send(ctx.channel, embed=game.pending_players_embed(),
+            priority=OutboundScheduler.INFO, merge_key=('pending', ctx.channel.id))
 
     @commands.command(name="summary", help=SUMMARY_HELP, aliases=['sum'])
     @game_is_started()
@@ -180,7 +186,8 @@ class InfoCog(BaseCog, name="info"):
         Sends the game summary
         '''
         game = self.bot.get_game(ctx.channel.id)
-        await ctx.send(embed=game.summary_embed())
+        await self.send(ctx.channel, embed=game.summary_embed(),
+            priority=OutboundScheduler.INFO, merge_key=('summary', ctx.channel.id))
 
     @commands.command(name="count", help=COUNT_HELP)
     @channel_has_game()
@@ -190,18 +197,18 @@ class InfoCog(BaseCog, name="info"):
         Sends the player count for the game in this channel
         '''
         game = self.bot.get_game(ctx.channel.id)
-        await ctx.send(f"Current player count: `{game.player_count()}`")
+        await self.send(ctx.channel, f"Current player count: `{game.player_count()}`")
 
     @commands.command(name="dn", help=DN_HELP, hidden=True)
     async def deez_nuts(self, ctx, user: User):
         if ctx.author.id == user.id:
             # tried to use command on self
-            await ctx.send("You can't use this command on yourself")
+            await self.send(ctx.channel, "You can't use this command on yourself")
         elif await self.bot.is_owner(user):
             # tried to use command on owner
-            await ctx.send(f"Nice try; {user.mention} makes {ctx.author.mention} gargle deez nuts in retribution")
+            await self.send(ctx.channel, f"Nice try; {user.mention} makes {ctx.author.mention} gargle deez nuts in retribution")
         else:
-            await ctx.send(f"{user.mention} gargles deez nuts")
+            await self.send(ctx.channel, f"{user.mention} gargles deez nuts")
 
 
 def setup(bot):
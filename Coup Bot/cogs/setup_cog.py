@@ -11,6 +11,8 @@ from discord import User
 
 # my code
 from cogs.base_cog import BaseCog
+from helpers.outbound import OutboundScheduler
+from helpers.user_locks import UserLocksUnavailable
 from classes.coup_game import CoupGame
 from helpers.command_checks import (channel_has_game, game_is_started,
                             game_not_started, is_player, is_game_master)
@@ -27,6 +29,12 @@ Optional settings:
     - total_influences | total  sets the ideal total number of influence cards
       (NOTE: must be a multiple of 5, and if there are not enough cards
       for 2+ in the pile, the total will be increased)
+    - timeout                   sets the seconds to wait on every kind of move
+    - action_timeout            sets the seconds to wait for an action (then `income`)
+    - response_timeout          sets the seconds to wait for responses (then `pass`)
+    - die_timeout               sets the seconds to wait for a `die` (then leftmost card)
+    - swap_timeout              sets the seconds to wait for a `swap` (then `noswap`)
+      (NOTE: a timeout of 0 turns that timer off)
 """
 
 # Master only setup commands
@@ -54,32 +62,39 @@ class SetupCog(BaseCog, name="setup"):
                   min_players, max_players, start_coins, and start_influences
         '''
         if self.bot.get_game(ctx.channel.id) is not None:
-            await ctx.send("There is already an active game in this channel")
-        elif self.bot.is_in_game(ctx.author.id):
-            await ctx.send("You are already in a game in a different channel")
+            await self.send(ctx.channel, "There is already an active game in this channel")
+            return
+
+        # Create the game with any custom settings (before claiming the author,
+        # since bad settings raise an error and the claim would never be released)
+        if settings is None:
+            game = CoupGame(ctx.author.id)
         else:
-            # Create the game with any custom settings
-            if settings is None:
-                game = CoupGame(ctx.author.id)
-            else:
-                # User wants custom game settings
-                game_settings = self._get_settings(settings)
-                game = CoupGame(ctx.author.id,
-                    min_players = game_settings.get("min_players"),
-                    max_players = game_settings.get("max_players"),
-                    start_coins = game_settings.get("start_coins"),
-                    start_influences = game_settings.get("start_influences"),
-                    card_count = game_settings.get("total_influences"),
-                )
-
-            # Store the game to the bot and join the author in automatically
-            self.bot.set_game(ctx.channel.id, game)
-            await self._attempt_join(ctx.channel, game, ctx.author)
-
-            # Send game settings information
-            setup_embed = game.setup_embed(ctx.channel.mention)
-            setup_embed.description = f"Use `{self.bot.command_prefix}join` to join game"
-            await ctx.send(embed=setup_embed)
+            # User wants custom game settings
+            game_settings = self._get_settings(settings)
+            game = CoupGame(ctx.author.id,
+                min_players = game_settings.get("min_players"),
+                max_players = game_settings.get("max_players"),
+                start_coins = game_settings.get("start_coins"),
+                start_influences = game_settings.get("start_influences"),
+                card_count = game_settings.get("total_influences"),
+                action_timeout = game_settings.get("action_timeout"),
+                response_timeout = game_settings.get("response_timeout"),
+                die_timeout = game_settings.get("die_timeout"),
+                swap_timeout = game_settings.get("swap_timeout"),
+            )
+
+        if not await self._claim(ctx.channel, ctx.author):
+            return
+
+        # Store the game to the bot and join the author in automatically
+        self.bot.set_game(ctx.channel.id, game, shard_id=ctx.guild.shard_id)
+        await self._sign_up(ctx.channel, game, ctx.author)
+
+        # Send game settings information
+        setup_embed = game.setup_embed(ctx.channel.mention)
+        setup_embed.description = f"Use `{self.bot.command_prefix}join` to join game"
+        await self.send(ctx.channel, embed=setup_embed)
 
     @commands.command(name="join", help=JOIN_HELP)
     @game_not_started()
@@ -104,15 +119,15 @@ class SetupCog(BaseCog, name="setup"):
         game = self.bot.get_game(ctx.channel.id)
         if game.is_active():
             # game already started - ask them to use forfeit command
-            await ctx.send(f"Please use `{self.bot.command_prefix}forfeit` to forfeit the game")
+            await self.send(ctx.channel, f"Please use `{self.bot.command_prefix}forfeit` to forfeit the game")
         elif game.player_count() == 1:
             # Last player is leaving game; delete game
             self.bot.set_user_status(ctx.author.id, False)
             self.bot.remove_game(ctx.channel.id)
-            await ctx.send("No players remain - game cancelled")
+            await self.send(ctx.channel, "No players remain - game cancelled")
         else:
             player = game.get_player(ctx.author.id)
-            await ctx.send(ctx.author.mention + " left the game")
+            await self.send(ctx.channel, ctx.author.mention + " left the game")
             await self.bot.process_player_remove(ctx.channel, game, player)
 
 
@@ -129,9 +144,9 @@ class SetupCog(BaseCog, name="setup"):
         '''
         game = self.bot.get_game(ctx.channel.id)
         if not game.is_valid():
-            await ctx.send(f"Player count must be between {game.get_min()} and {game.get_max()}")
+            await self.send(ctx.channel, f"Player count must be between {game.get_min()} and {game.get_max()}")
         elif start_player is not None and not game.is_signed_up(start_player.id):
-            await ctx.send(f"{start_player.mention} is not part of this game")
+            await self.send(ctx.channel, f"{start_player.mention} is not part of this game")
         else:
             # Start the game
             game.initialize_game()
@@ -143,15 +158,16 @@ class SetupCog(BaseCog, name="setup"):
                 game.set_turn_to(start_player.id)
 
             # Send the rules summary and hands for reference
-            await ctx.send(embed=CoupGame.rules_embed(self.bot.command_prefix))
+            await self.send(ctx.channel, embed=CoupGame.rules_embed(self.bot.command_prefix),
+                priority=OutboundScheduler.INFO)
             for player in game.get_players():
-                await player.get_user().send(embed=player.get_embed(ctx))
+                await self.send(player.get_user(), embed=player.get_embed(ctx), priority=OutboundScheduler.CRITICAL)
 
             # Prompt first user for their action
             await self.bot.prompt_action(ctx.channel)
+            self.bot.reset_timer(ctx.channel, game)
 
-        print()
-        game.print_summary()
+        self.bot.tracer.event(ctx.channel.id, 'game_started', game.debug_snapshot)
 
     @commands.command(name="end", help=END_HELP, aliases=['cancel'])
     @is_game_master()
@@ -165,7 +181,7 @@ class SetupCog(BaseCog, name="setup"):
         # Remove the game from the bot to cancel it
         game = self.bot.get_game(ctx.channel.id)
         bot.remove_game(ctx.channel.id)
-        await ctx.send("Game cancelled")
+        await self.send(ctx.channel, "Game cancelled")
 
     @commands.command(name="master", help=MASTER_HELP)
     @is_game_master()
@@ -178,13 +194,13 @@ class SetupCog(BaseCog, name="setup"):
         '''
         game = self.bot.get_game(ctx.channel.id)
         if game.is_master(new_master.id):
-            await ctx.send("You are already the game master")
+            await self.send(ctx.channel, "You are already the game master")
         elif game.set_master(new_master.id):
             # Set new master successfully
-            await ctx.send(f"{new_master.mention} is the new game master")
+            await self.send(ctx.channel, f"{new_master.mention} is the new game master")
         else:
             # Other user is not part of the game
-            await ctx.send(f"{new_master.mention} is not part of this game")
+            await self.send(ctx.channel, f"{new_master.mention} is not part of this game")
 
 
     ################################# HELPER METHODS ###############################
@@ -212,6 +228,9 @@ class SetupCog(BaseCog, name="setup"):
             settings_dict["start_influences"] = settings_dict["cards"]
         if "total" in settings_dict:
             settings_dict["total_influences"] = settings_dict["total"]
+        if "timeout" in settings_dict:
+            for timeout_name in ("action_timeout", "response_timeout", "die_timeout", "swap_timeout"):
+                settings_dict.setdefault(timeout_name, settings_dict["timeout"])
 
         return settings_dict
 
@@ -224,16 +243,37 @@ class SetupCog(BaseCog, name="setup"):
         '''
         if game.is_signed_up(user.id):
             # user is already signed up for the game
-            await channel.send("You are already signed up for the game")
-        elif self.bot.is_in_game(user.id):
-            await channel.send("You are already in a game in a different channel")
-        elif game.player_count() < game.get_max():
+            await self.send(channel, "You are already signed up for the game")
+        elif game.player_count() >= game.get_max():
+            await self.send(channel, f"Maximum player count of `{game.get_max()}` exceeded; cannot join game")
+        elif await self._claim(channel, user):
             # can join properly
-            game.sign_up_player(user)
-            self.bot.set_user_status(user.id, True)
-            await channel.send(f"{user.mention} joined the game - player count {game.player_count()}")
-        else:
-            await channel.send(f"Maximum player count of `{game.get_max()}` exceeded; cannot join game")
+            await self._sign_up(channel, game, user)
+
+    async def _claim(self, channel, user):
+        '''
+        Claims a user for a game, letting them know if they cannot be
+        channel: Channel to send the reason to
+        user: User joining a game
+        Return: bool, representing whether the user was claimed
+        '''
+        try:
+            if await self.bot.claim_user(user.id):
+                return True
+            await self.send(channel, "You are already in a game in a different channel")
+        except UserLocksUnavailable:
+            await self.send(channel, "Could not check whether you are in another game; try again in a few seconds")
+        return False
+
+    async def _sign_up(self, channel, game, user):
+        '''
+        Signs up a user for the given game, once they have been claimed
+        channel: Channel to send join message to
+        game: game to add player to
+        user: User to add to the game
+        '''
+        game.sign_up_player(user)
+        await self.send(channel, f"{user.mention} joined the game - player count {game.player_count()}")
 
 
 
@@ -6,12 +6,32 @@ This program creates the Coup Bot for Discord
 
 # dependencies
 from discord.ext import commands, tasks
-from discord import Game
+from datetime import datetime, timedelta
 import traceback
+import asyncio
+import importlib.util
+import os
+import signal
+import sys
+import time
 
 # my code
 from classes.coup_game import CoupGame
 from helpers.command_checks import CustomCheckFailure
+from helpers.memory_utils import deep_sizeof
+from helpers.mailbox import ChannelMailbox
+from helpers.outbound import OutboundScheduler
+from helpers.tracing import Tracer
+from helpers.metrics import MetricsRegistry, MetricsServer
+from helpers import spans
+from helpers.loop_monitor import LoopMonitor
+from helpers.error_reporter import ErrorReporter
+from helpers.flight_recorder import crash_report, write_crash_dump
+from helpers.presence import PresenceManager
+from helpers.user_locks import LocalUserLocks, UserLocksUnavailable
+from helpers.game_snapshot import (GameEntry, SnapshotError, write_snapshot, read_snapshot,
+                                   dump_games, load_games, SNAPSHOT_FILE_DEFAULT)
+from cogs.base_cog import BaseCog
 
 
 BOT_VERSION = '0.0.0'
@@ -21,29 +41,120 @@ initial_extensions = (
     'cogs.game_cog',
     'cogs.info_cog',
 )
+# Modules with the game rules, reloaded along with the cogs by hot_reload()
+engine_modules = (
+    'classes',
+    'helpers.command_checks',
+)
 
-class CoupBot(commands.Bot):
+class CoupBot(commands.AutoShardedBot):
     '''
-    This class represents the Coup Discord Bot
+    This class represents the Coup Discord Bot. The bot is sharded, so
+    each shard (gateway connection) receives the events for its own guilds.
+    Games are kept per shard, while the users in games are tracked across
+    all shards so a user can only be in one game anywhere
 
     Useful methods:
         - get_game(channel_id)
-        - set_game(channel_id, game)
+        - get_games(shard_id)
+        - set_game(channel_id, game, shard_id)
+        - shard_for(channel_id)
+        - game_count(shard_id)
         - remove_game(channel_id)
         - is_in_game(user_id)
+        - claim_user(user_id)
         - set_user_status(user_id, in_game_status)
+        - reset_timer(channel, game)
+        - reap_abandoned_games()
+        - serialized(channel_id)
+        - report_error(error, context, channel_id)
+        - start_game_task(coro, channel_id)
+        - hand_off()
+        - hot_reload()
+        - shut_down()
+
+    Events dispatched:
+        - on_game_timeout(channel, game, timer)
+        - on_game_resumed(channel, game, tasks_interrupted)
+        - on_game_reloaded(channel, game, tasks_interrupted)
     '''
 
     VERSION = BOT_VERSION
 
-    def __init__(self, **kwargs):
+    # seconds before abandoned games are removed
+    LOBBY_TTL_DEFAULT = 30 * 60    # games that were never started
+    IDLE_TTL_DEFAULT = 60 * 60     # started games with no player commands
+
+    METRICS_PORT_DEFAULT = 9108    # local port serving /metrics
+    HANDOFF_TIMEOUT = 10           # seconds to wait for running commands before a hand off
+    SHUTDOWN_TIMEOUT = 20          # seconds to wait for running commands and messages on shut down
+                                   # (under the 30 the cluster gives a worker before killing it)
+
+    # errors caused by how a command was typed, rather than by a bug
+    USER_ERRORS = (commands.CommandNotFound, commands.UserInputError, commands.CheckFailure)
+
+    def __init__(self, *, lobby_ttl=None, idle_ttl=None, metrics_port=None, user_locks=None,
+                 snapshot_path=None, resume=False, **kwargs):
+        '''
+        Constructs the bot
+        lobby_ttl: int, representing seconds before an unstarted game is removed
+        idle_ttl: int, representing seconds before a started game with no
+        player commands is removed
+        metrics_port: int, representing the local port to serve metrics on (0 to disable)
+        user_locks: UserLocks backend keeping users to one game at a time
+        (LocalUserLocks if None, for a bot running as a single process)
+        snapshot_path: str, representing the path of the snapshot games are handed
+        off to a new process in (see hand_off())
+        resume: bool, representing whether to resume the games in the snapshot, if it exists
+        '''
         super().__init__(**kwargs)
+        self.snapshot_path = snapshot_path or SNAPSHOT_FILE_DEFAULT
+        self._resume = resume
+        self._resumed = {}          # maps shard ID to GameEntry list whose timers are not restarted yet
+        self.accepting_commands = True   # False while handing games off or shutting down
+        self._intake_reply = None        # reply to commands sent while not accepting them
+        self._intake_paused = None       # asyncio.Event commands wait on during a hot reload
+        self._shutting_down = False
+        self.restart_requested = False   # whether the launcher should start a new process on exit
+        self._game_tasks = {}            # asyncio.Task running part of a game in the background, to its channel ID
+        self._lobby_ttl = timedelta(seconds=lobby_ttl or self.LOBBY_TTL_DEFAULT)
+        self._idle_ttl = timedelta(seconds=idle_ttl or self.IDLE_TTL_DEFAULT)
+
+        # Keep track of games (max 1 per channel_id), per shard
+        self._games = {}        # maps shard ID to dict of channel ID to CoupGame
+        self._game_shards = {}  # maps channel ID to the shard ID its game is on
+
+        # Keep track of users in games (only 1 game at a time per user, on any shard or process)
+        self.user_locks = user_locks or LocalUserLocks()
+
+        # Commands in the same channel run one at a time
+        self._mailbox = ChannelMailbox()
+
+        # Every message the bot sends goes through the outbound queue
+        self.outbound = OutboundScheduler(
+            on_error=lambda error: self.errors.report(error, "sending a message"))
 
-        # Keep track of games (max 1 per channel_id)
-        self._games = {}
+        # Debug tracing of game state, off unless turned on for a channel
+        self.tracer = Tracer()
 
-        # Keep track of users in games (only 1 game at a time per user)
-        self._users = set()
+        # Metrics about the bot's load, served locally for scraping
+        self.metrics = MetricsRegistry()
+        self._register_metrics()
+
+        # Groups repeated errors so they are counted instead of flooding the output
+        self.errors = ErrorReporter(self.metrics)
+        port = self.METRICS_PORT_DEFAULT if metrics_port is None else metrics_port
+        self._metrics_server = MetricsServer(self.metrics, port=port) if port else None
+
+        # Measures event loop lag, and reports whatever blocks the loop
+        self.loop_monitor = LoopMonitor(self.metrics)
+
+        # Shows the number of games on each shard as its status, only updating it when it changes
+        self.presence = PresenceManager(self, lambda shard_id: f"{self.game_count(shard_id)} games")
+
+        # Time the handler of every command as its own span
+        self.before_invoke(self._start_handler_span)
+        self.after_invoke(self._finish_handler_span)
 
         # Load all extensions
         for extension in initial_extensions:
@@ -54,35 +165,335 @@ class CoupBot(commands.Bot):
                 print('Error:', e)
                 traceback.print_exc()
 
+    def _register_metrics(self):
+        '''
+        Creates the bot's metrics. Values the bot already keeps track of
+        (games, players, outgoing messages) are read when the metrics are scraped
+        '''
+        m = self.metrics
+        self._commands_total = m.counter('coup_commands_total',
+            "Commands invoked", ('command',))
+        self._command_seconds = m.histogram('coup_command_seconds',
+            "Seconds from a command being invoked to it finishing, including waiting for the channel",
+            ('command',))
+        self._check_failures_total = m.counter('coup_check_failures_total',
+            "Commands rejected by a check", ('command', 'check'))
+        self._command_errors_total = m.counter('coup_command_errors_total',
+            "Commands that raised an error other than a failed check", ('command', 'error'))
+        self._stale_total = m.counter('coup_stale_commands_total',
+            "Commands dropped because the game changed before they ran", ('command',))
+
+        m.gauge('coup_games', "Games in progress", ('shard', 'state'), function=self._count_games)
+        m.gauge('coup_shard_latency_seconds', "Gateway heartbeat latency of each shard", ('shard',),
+            function=lambda: {(str(shard_id),): latency for shard_id, latency in self.latencies})
+        m.gauge('coup_players', "Users signed up for or playing a game",
+            function=self.user_count)
+        m.gauge('coup_messages_queued', "Outgoing messages waiting to be sent",
+            function=self.outbound.queued_count)
+        m.counter('coup_messages_total', "Outgoing messages by what happened to them",
+            ('result',), function=lambda: {
+                (kind,): count for kind, count in self.outbound.counts.items() if kind != 'rate_limit_waits'})
+        m.counter('coup_rate_limit_waits_total', "Times outgoing messages had to wait on a rate limit",
+            function=lambda: self.outbound.counts['rate_limit_waits'])
+        m.counter('coup_rate_limit_wait_seconds_total', "Seconds outgoing messages spent waiting on rate limits",
+            function=lambda: self.outbound.rate_limit_wait_time)
+        m.counter('coup_presence_updates_total', "Presence updates by what happened to them",
+            ('result',), function=lambda: {(kind,): count for kind, count in self.presence.counts.items()})
+
+    def _count_games(self):
+        '''
+        Counts the games on each shard that are in the lobby or active
+        Return: dict of (shard ID, state) to number of games
+        '''
+        counts = {}
+        for shard_id, shard_games in self._games.items():
+            active = sum(1 for game in shard_games.values() if game.is_active())
+            counts[(str(shard_id), 'lobby')] = len(shard_games) - active
+            counts[(str(shard_id), 'active')] = active
+        return counts
+
+    async def start(self, *args, **kwargs):
+        '''
+        Overrides the start() method to start serving metrics, connect
+        to the user locks, and monitor the event loop before connecting
+        '''
+        # Shut down gracefully on Ctrl+C, or when told to stop (such as by the cluster)
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.loop.add_signal_handler(signum, self._on_stop_signal)
+            except NotImplementedError:
+                # event loop does not support signals (Windows)
+                pass
+        if self._metrics_server is not None:
+            await self._metrics_server.start()
+        await self.user_locks.start()
+        if self._resume:
+            await self._resume_games(self.snapshot_path)
+        self.loop_monitor.start(self.loop)
+        await super().start(*args, **kwargs)
+
+    async def close(self):
+        '''
+        Overrides the close() method to stop serving metrics, disconnect
+        from the user locks, and stop monitoring the event loop
+        '''
+        self.loop_monitor.stop()
+        self.presence.stop()
+        if self._metrics_server is not None:
+            await self._metrics_server.stop()
+        await self.user_locks.close()
+        await super().close()
+
+    async def invoke(self, ctx):
+        '''
+        Overrides the invoke() method so commands in the same channel are
+        checked and run one at a time, in the order they were sent. Commands
+        in different channels still run in parallel.
+
+        Commands marked with `rejects_stale()` are silently dropped if the game
+        changed between the command being sent and it getting to run
+        '''
+        if ctx.command is None:
+            # nothing will run
+            await super().invoke(ctx)
+            return
+        paused = self._intake_paused
+        if paused is not None:
+            # hot reload running; run the new version of the command once it is done
+            await paused.wait()
+            ctx.command = self.get_command(ctx.command.qualified_name)
+            if ctx.command is None:
+                return
+        if not self.accepting_commands:
+            # handing games off to a new process, or shutting down
+            await self.outbound.send(ctx.channel, self._intake_reply,
+                                     priority=OutboundScheduler.INFO, merge_key=('intake_closed', ctx.channel.id))
+            return
+
+        # Remember the game state the command was sent against
+        game = self.get_game(ctx.channel.id)
+        ctx.game_version = None if game is None else game.version
+
+        command_name = ctx.command.qualified_name
+        self._commands_total.inc(command_name)
+        with spans.root('command', command=command_name, channel=ctx.channel.id) as root_span, \
+                self.loop_monitor.attributed(command_name, ctx.channel.id):
+            try:
+                async with self._mailbox.serialized(ctx.channel.id):
+                    root_span.record('wait_channel', root_span.start, time.perf_counter())
+                    game = self.get_game(ctx.channel.id)
+                    if self._is_stale(ctx):
+                        # game changed while waiting; player was responding to an old state
+                        self._stale_total.inc(command_name)
+                        root_span.attrs['stale'] = True
+                        game.record('stale', ctx.message.content, ctx.author.id)
+                        return
+                    if game is not None:
+                        game.record('command', ctx.message.content, ctx.author.id)
+                    await super().invoke(ctx)
+            finally:
+                self._command_seconds.observe(root_span.duration, command_name)
+
+    async def _start_handler_span(self, ctx):
+        '''
+        Starts timing the command handler, once the checks have passed
+        '''
+        ctx.handler_span = spans.start_span('handler')
+
+    async def _finish_handler_span(self, ctx):
+        '''
+        Finishes timing the command handler (including the after-invoke hooks)
+        '''
+        handler_span = getattr(ctx, 'handler_span', None)
+        if handler_span is not None:
+            handler_span.finish()
+
+    def _is_stale(self, ctx):
+        '''
+        Checks if the command was decided against an older state of the
+        game than the current one, and should not be run
+        ctx: commands.Context of the command about to run
+        '''
+        if not getattr(ctx.command.callback, '__rejects_stale__', False):
+            # command does not depend on what state the player saw
+            return False
+        game = self.get_game(ctx.channel.id)
+        return (game is not None and game.version != ctx.game_version)
+
+    def serialized(self, channel_id):
+        '''
+        Holds the channel so nothing else runs in it, for changing a game
+        outside of a command. Use as `async with bot.serialized(channel_id):`
+        channel_id: int, representing the ID of the channel
+        '''
+        return self._mailbox.serialized(channel_id)
+
     async def on_command_error(self, ctx, exception):
         '''
         Overrides the on_command_error() method so when a CheckError
         occurs, the error message is sent to the user trying to call
         a command
         '''
+        if ctx.command is not None:
+            game = self.get_game(ctx.channel.id)
+            if isinstance(exception, commands.CheckFailure):
+                check_name = getattr(ctx, 'failed_check', type(exception).__name__)
+                self._check_failures_total.inc(ctx.command.qualified_name, check_name)
+                if game is not None:
+                    game.record('rejected', check_name, ctx.author.id)
+            else:
+                error = getattr(exception, 'original', exception)
+                self._command_errors_total.inc(ctx.command.qualified_name, type(error).__name__)
+                if game is not None:
+                    game.record('error', type(error).__name__, ctx.author.id)
+
         if isinstance(exception, CustomCheckFailure):
-            await ctx.send(exception)
-        else:
-            await super().on_command_error(ctx, exception)
+            await self.outbound.send(ctx.channel, str(exception))
+        elif not isinstance(exception, self.USER_ERRORS) and not isinstance(ctx.cog, BaseCog):
+            # cogs report their own errors
+            error = getattr(exception, 'original', exception)
+            self.report_error(error, f"command `{ctx.message.content}` by {ctx.author.id}", ctx.channel.id)
+
+    async def on_error(self, event_method, *args, **kwargs):
+        '''
+        Overrides the on_error() method so errors in events (such as a game
+        timing out) are reported instead of always printed
+        '''
+        # game events are passed the channel first, and message events the message
+        channel = getattr(args[0], 'channel', args[0]) if args else None
+        self.report_error(sys.exc_info()[1], f"event `{event_method}`", getattr(channel, 'id', None))
+
+    def report_error(self, error, context, channel_id=None):
+        '''
+        Reports an error to the ErrorReporter. If it happened in a channel
+        with a game, it is also recorded in the game's flight recorder and
+        a crash dump is written, even if the ErrorReporter did not log it
+        error: Exception that was raised
+        context: str, describing what was running (such as the command)
+        channel_id: int, representing the channel it happened in (None if unknown)
+        Return: bool, representing whether the ErrorReporter logged it
+        '''
+        sampled = self.errors.report(error, context)
+        game = None if channel_id is None else self.get_game(channel_id)
+        if game is not None:
+            game.record('crash', type(error).__name__, context)
+            report = crash_report(game, error, context)
+            dump = self.loop.run_in_executor(None, write_crash_dump, channel_id, report)
+            dump.add_done_callback(_print_crash_dump)
+        return sampled
 
     async def on_connect(self):
         '''
-        Start the update_status loop on connect
+        Start the reap_games and send_error_digest loops the first
+        time the bot connects
         '''
-        self.update_status.start()
+        if not self.reap_games.is_running():
+            self.reap_games.start()
+        if not self.send_error_digest.is_running():
+            self.send_error_digest.start()
 
-    async def on_disconnect(self):
+    async def on_command_completion(self, ctx):
         '''
-        Stops the update_status loop on disconnect
+        Marks the game in the channel as active whenever one of its
+        players completes a command
         '''
-        self.update_status.cancel()
+        game = self.get_game(ctx.channel.id)
+        if game is not None and game.is_player(ctx.author.id):
+            game.touch()
+
+    async def on_ready(self):
+        '''
+        Lets the console know once every shard is connected
+        '''
+        print(f"{self.user} has successfully connected to Discord with {self.shard_count} shards!")
+
+    async def on_shard_ready(self, shard_id):
+        '''
+        Shows the number of games as the shard's status whenever it gets
+        a new session, since connecting with a new session clears it
+        '''
+        self.presence.invalidate(shard_id)
+        self._continue_resumed_games(shard_id)
 
     @tasks.loop(minutes=1)
-    async def update_status(self):
+    async def reap_games(self):
+        '''
+        Removes abandoned games every minute
+        '''
+        num_games, num_bytes = await self.reap_abandoned_games()
+        if num_games > 0:
+            print(f"Reaped {num_games} abandoned games (~{num_bytes / 1024:.1f} KB)")
+
+    @tasks.loop(hours=1)
+    async def send_error_digest(self):
+        '''
+        Sends the owner a summary of the errors from the last hour, if there were any
+        '''
+        digest = self.errors.digest()
+        if digest is None:
+            return
+        app_info = await self.application_info()
+        await self.outbound.send(app_info.owner, f"Errors in the last hour:\n{digest}"[:2000])
+
+    @send_error_digest.before_loop
+    async def before_error_digest(self):
+        '''
+        Waits an hour before the first digest, so it covers a full hour
+        '''
+        await asyncio.sleep(self.send_error_digest.hours * 60 * 60)
+
+    async def reap_abandoned_games(self, *, channel_id=None):
         '''
-        Updates the game status every minute to what the number of games is
+        Removes games that were never started within the lobby TTL, and started
+        games where no player has made a command within the idle TTL. Clears
+        their user statuses and timers, and lets each channel know
+        channel_id: int, representing the channel of the command calling
+        this, which it already holds
+        Return: tuple of (int, int), representing the number of games removed
+        and the approximate number of bytes they were using
         '''
-        await self.change_presence(activity=Game(name=f"{self.game_count()} games"))
+        now = datetime.utcnow()
+        abandoned = []
+        for game_channel_id, game in self.get_games().items():
+            if not game.is_active():
+                expired = (now - game.get_created_at() > self._lobby_ttl)
+            else:
+                expired = (now - game.get_last_active() > self._idle_ttl)
+            if expired:
+                abandoned.append((game_channel_id, game))
+
+        num_games = 0
+        num_bytes = 0
+        for game_channel_id, game in abandoned:
+            if game_channel_id == channel_id:
+                # the calling command is holding this channel already
+                size = self._reap_game(game_channel_id, game)
+            else:
+                async with self.serialized(game_channel_id):
+                    size = self._reap_game(game_channel_id, game)
+            if size is None:
+                # game already ended while waiting for the channel
+                continue
+            num_games += 1
+            num_bytes += size
+            channel = self.get_channel(game_channel_id)
+            if channel is not None:
+                await self.outbound.send(channel, "Game cancelled due to inactivity")
+        return num_games, num_bytes
+
+    def _reap_game(self, channel_id, game):
+        '''
+        Removes an abandoned game, unless it has already ended
+        channel_id: int, representing the ID of the game's channel
+        game: CoupGame that was abandoned
+        Return: int, representing the approximate number of bytes the game
+        was using (None if the game already ended)
+        '''
+        if self.get_game(channel_id) is not game:
+            return None
+        size = deep_sizeof(game)
+        self.remove_game(channel_id)
+        return size
 
     def get_game(self, channel_id):
         '''
@@ -90,21 +501,63 @@ class CoupBot(commands.Bot):
         channel_id: int, representing the ID of the channel
         Return: CoupGame object if there is a game in that channel, else None
         '''
-        return self._games.get(channel_id)
+        shard_id = self._game_shards.get(channel_id)
+        if shard_id is None:
+            return None
+        return self._games[shard_id].get(channel_id)
 
-    def set_game(self, channel_id, game):
+    def set_game(self, channel_id, game, shard_id=None):
         '''
         Sets up a Coup game for the given channel
         channel_id: int, representing the ID of the channel
         game: CoupGame being played in that channel
+        shard_id: int, representing the shard the channel's guild is on
+        (looked up from the channel if None)
+        '''
+        if shard_id is None:
+            shard_id = self.shard_for(channel_id)
+        old_shard_id = self._game_shards.get(channel_id)
+        if old_shard_id is not None and old_shard_id != shard_id:
+            # channel's guild moved to a different shard
+            self._forget_game(channel_id)
+        self._games.setdefault(shard_id, {})[channel_id] = game
+        self._game_shards[channel_id] = shard_id
+        self.presence.changed(shard_id)
+
+    def shard_for(self, channel_id):
+        '''
+        Gets the shard that receives the events for a channel
+        channel_id: int, representing the ID of the channel
+        Return: int, representing the shard ID (0 for DMs and unknown channels,
+        which is the shard Discord sends DMs to)
         '''
-        self._games[channel_id] = game
+        shard_id = self._game_shards.get(channel_id)
+        if shard_id is not None:
+            return shard_id
+        guild = getattr(self.get_channel(channel_id), 'guild', None)
+        return 0 if guild is None else guild.shard_id
 
-    def game_count(self):
+    def game_count(self, shard_id=None):
         '''
         Check the number of games being played
+        shard_id: int, representing the shard to count the games of (None for all shards)
+        '''
+        if shard_id is None:
+            return len(self._game_shards)
+        return len(self._games.get(shard_id, ()))
+
+    def get_games(self, shard_id=None):
         '''
-        return len(self._games)
+        Gets every game being played
+        shard_id: int, representing the shard to get the games of (None for all shards)
+        Return: dict of channel ID to CoupGame (a copy)
+        '''
+        if shard_id is not None:
+            return dict(self._games.get(shard_id, {}))
+        games = {}
+        for shard_games in self._games.values():
+            games.update(shard_games)
+        return games
 
     def remove_game(self, channel_id):
         '''
@@ -112,19 +565,49 @@ class CoupBot(commands.Bot):
         sets user statuses to not in game
         channel_id: int, representing the ID of the channel
         '''
-        if channel_id in self._games:
-            game = self._games[channel_id]
+        game = self.get_game(channel_id)
+        if game is not None:
             for user_id in game.get_player_ids():
                 # mark each user as no longer in a game
                 self.set_user_status(user_id, False)
-            del self._games[channel_id]
+            game.cancel_timer()
+            self._forget_game(channel_id)
+
+    def _forget_game(self, channel_id):
+        '''
+        Removes a channel's game from its shard's registry
+        '''
+        shard_id = self._game_shards.pop(channel_id)
+        shard_games = self._games[shard_id]
+        del shard_games[channel_id]
+        if not shard_games:
+            del self._games[shard_id]
+        self.presence.changed(shard_id)
 
     def is_in_game(self, user_id):
         '''
-        Checks if the given user is already in a game
+        Checks if the given user is already in a game on this process
+        (use claim_user() to also check other processes)
         user_id: int, representing the user ID of the user to check
         '''
-        return (user_id in self._users)
+        return self.user_locks.is_held(user_id)
+
+    async def claim_user(self, user_id):
+        '''
+        Marks the given user as in a game, if they are not already in one.
+        With a shared user lock backend, this checks every process
+        user_id: int, representing the user ID of the user joining a game
+        Return: bool, representing whether the user was claimed (False if
+        they are already in a game)
+        Raises UserLocksUnavailable if the other processes cannot be checked
+        '''
+        return await self.user_locks.acquire(user_id)
+
+    def user_count(self):
+        '''
+        Check the number of users in games on this process
+        '''
+        return self.user_locks.held_count()
 
     async def process_player_remove(self, channel, game, player):
         '''
@@ -153,16 +636,17 @@ class CoupBot(commands.Bot):
 
     def set_user_status(self, user_id, in_game_status):
         '''
-        Sets the status for a user
+        Sets the status for a user. Use claim_user() to put a user in a
+        game, since this does not check other processes
         user_id: int, representing the user ID of the user to set status for
         in_game_status: bool, representing whether the user is in a game
         '''
         if in_game_status:
             # user is now in a game
-            self._users.add(user_id)
+            self.user_locks.hold(user_id)
         else:
             # user is not in a game
-            self._users.discard(user_id)
+            self.user_locks.release(user_id)
 
     async def transfer_master(self, channel, game, user_id):
         '''
@@ -174,7 +658,7 @@ class CoupBot(commands.Bot):
             # Player leaving game was game master; transfer master
             new_master = game.random_player()
             game.set_master(new_master.id)
-            await channel.send(f"Transferred game master to {new_master.mention}")
+            await self.outbound.send(channel, f"Transferred game master to {new_master.mention}")
 
     async def prompt_action(self, channel):
         '''
@@ -185,4 +669,402 @@ class CoupBot(commands.Bot):
         if game is not None and not game.is_over():
             # Ask the user for their action
             player = game.get_turn()
-            await channel.send(f"Waiting for {player.get_mention()}'s action ...")
\ No newline at end of file
+            await self.outbound.send(channel, f"Waiting for {player.get_mention()}'s action ...",
+                                     priority=OutboundScheduler.CRITICAL)
+
+    def reset_timer(self, channel, game, timeout=None):
+        '''
+        (Re)starts the timer for whatever move the game is currently waiting
+        on. If the timer runs out, a `game_timeout` event is dispatched so
+        the default move can be made
+        channel: discord.Channel where game is being played
+        game: CoupGame to start the timer for
+        timeout: float, representing the seconds to wait (the game's timeout
+        for the move if None)
+        '''
+        if timeout is None:
+            timeout = game.get_timeout()
+        if timeout is None:
+            # nothing to wait on
+            game.cancel_timer()
+        else:
+            game.set_timer(self.loop.create_task(self._run_timer(channel, game, timeout)), timeout)
+
+    def start_game_task(self, coro, channel_id=None):
+        '''
+        Runs part of a game in the background (such as an Exchange counting
+        down), so shutting down can wait for it to finish. If it raises, the
+        error is reported like an error in a command (see report_error())
+        coro: coroutine to run
+        channel_id: int, representing the channel of the game it is part of
+        Return: asyncio.Task running it
+        '''
+        context = f"game task `{getattr(coro, '__qualname__', coro)}`"
+        task = self.loop.create_task(coro)
+        self._game_tasks[task] = channel_id
+
+        def task_done(task):
+            self._game_tasks.pop(task, None)
+            if not task.cancelled() and task.exception() is not None:
+                self.report_error(task.exception(), context, channel_id)
+        task.add_done_callback(task_done)
+        return task
+
+    async def hand_off(self, *, timeout=None, channel_id=None):
+        '''
+        Saves every game to the snapshot so a new process can resume them
+        (see `resume`). Stops accepting commands, waits for the running
+        ones to finish, stops the game tasks and the timers (keeping the time
+        left on them), and lets each game's channel know the bot is
+        restarting. The bot should
+        be closed afterwards, since its games are no longer running
+        timeout: float, representing seconds to wait for running commands
+        channel_id: int, representing the channel of the command calling
+        this, which is not waited on
+        Return: tuple of (int, int, float), representing the number of games,
+        the size of the snapshot in bytes, and the seconds the snapshot took
+        '''
+        self._stop_intake("The bot is restarting; try again in a few seconds")
+        deadline = time.monotonic() + (timeout or self.HANDOFF_TIMEOUT)
+        await self._wait_in_flight(deadline, calling_channel_id=channel_id)
+        # an Exchange counting down would otherwise draw cards after its game was saved
+        interrupted = await self._cancel_game_tasks()
+
+        # Nothing can change the games between here and writing them
+        start = time.perf_counter()
+        entries = []
+        for shard_id, shard_games in self._games.items():
+            for game_channel_id, game in shard_games.items():
+                entries.append(GameEntry(game_channel_id, shard_id, game, game.get_timer_remaining(),
+                                         game_channel_id in interrupted))
+                game.cancel_timer()
+        size = write_snapshot(entries, self.snapshot_path)
+        seconds = time.perf_counter() - start
+
+        # NORMAL priority, so the notices are never merged or dropped as stale
+        deadline = time.monotonic() + self.HANDOFF_TIMEOUT
+        notices = []
+        for entry in entries:
+            channel = self.get_channel(entry.channel_id)
+            if channel is not None:
+                notices.append(self.outbound.send(channel, "♻ The bot is restarting for an update; "
+                                                  "this game will continue in a few seconds"))
+        try:
+            await asyncio.wait_for(asyncio.gather(*notices, return_exceptions=True), self.HANDOFF_TIMEOUT)
+        except asyncio.TimeoutError:
+            print("Timed out sending the restart notices")
+        await self.outbound.drain(timeout=max(deadline - time.monotonic(), 0))
+        return len(entries), size, seconds
+
+    async def hot_reload(self, *, timeout=None, channel_id=None):
+        '''
+        Reloads the game classes and every cog from disk without
+        restarting, so a fix can be deployed while games are being played.
+        Commands sent meanwhile wait, and run on the new code once it is
+        loaded. Once the running commands finish, every game is saved and
+        loaded back as an instance of the new classes (see
+        CoupGame._migrate_state()), and their timers carry on with the time
+        they had left. If the new code cannot be imported, nothing changes
+        timeout: float, representing seconds to wait for running commands
+        channel_id: int, representing the channel of the command calling
+        this, which is not waited on
+        Return: tuple of (int, float), representing the number of games and
+        the seconds the games were paused for
+        '''
+        if self._resumed:
+            raise RuntimeError("Games are still being resumed; try again once every shard is ready")
+        self._intake_paused = asyncio.Event()
+        try:
+            deadline = time.monotonic() + (timeout or self.HANDOFF_TIMEOUT)
+            commands_left, _ = await self._wait_in_flight(deadline, calling_channel_id=channel_id)
+            if commands_left > 0:
+                raise RuntimeError(f"{commands_left} commands are still running; try again")
+
+            # Nothing can change the games from here until they are loaded back
+            start = time.perf_counter()
+            self._check_extension_sources()
+            entries = []
+            for shard_id, shard_games in self._games.items():
+                for game_channel_id, game in shard_games.items():
+                    entries.append(GameEntry(game_channel_id, shard_id, game, game.get_timer_remaining()))
+            data = dump_games(entries)
+            old_modules = self._import_engine_modules()
+            try:
+                _, new_entries = load_games(self._connection, data)
+            except Exception:
+                self._restore_engine_modules(old_modules)
+                raise
+
+            for entry in entries:
+                entry.game.cancel_timer()
+            # tied to the old games; started again by the new cogs
+            interrupted = await self._cancel_game_tasks()
+            failure = None
+            for extension in list(self.extensions):
+                try:
+                    self.reload_extension(extension)
+                except commands.ExtensionError as e:
+                    # keeps running the old version; the games carry on either way
+                    failure = failure or e
+            for entry in new_entries:
+                self._games[entry.shard_id][entry.channel_id] = entry.game
+            seconds = time.perf_counter() - start
+
+            for entry in new_entries:
+                channel = self.get_channel(entry.channel_id)
+                if channel is None:
+                    continue
+                if entry.timer_remaining is not None:
+                    self.reset_timer(channel, entry.game, entry.timer_remaining)
+                self.dispatch('game_reloaded', channel, entry.game, entry.channel_id in interrupted)
+            if failure is not None:
+                raise failure
+            return len(new_entries), seconds
+        finally:
+            self._intake_paused.set()
+            self._intake_paused = None
+
+    def _check_extension_sources(self):
+        '''
+        Compiles the source of every extension, so one with a syntax error
+        is caught before anything is reloaded
+        '''
+        for extension in self.extensions:
+            spec = importlib.util.find_spec(extension)
+            if spec is None:
+                raise commands.ExtensionNotFound(extension)
+            compile(spec.loader.get_source(extension), spec.origin, 'exec')
+
+    def _import_engine_modules(self):
+        '''
+        Imports the engine modules again from disk, in place of the loaded
+        ones (which keep working for anything already using them)
+        Return: dict of module name to the old module
+        '''
+        old_modules = {name: module for name, module in sys.modules.items() if _is_engine_module(name)}
+        for name in old_modules:
+            del sys.modules[name]
+        try:
+            for name in old_modules:
+                importlib.import_module(name)
+        except Exception:
+            self._restore_engine_modules(old_modules)
+            raise
+        return old_modules
+
+    def _restore_engine_modules(self, old_modules):
+        '''
+        Puts the old engine modules back, such as when the new ones are broken
+        old_modules: dict of module name to the old module
+        '''
+        for name in [name for name in sys.modules if _is_engine_module(name)]:
+            del sys.modules[name]
+        sys.modules.update(old_modules)
+
+    async def shut_down(self, *, timeout=None):
+        '''
+        Shuts the bot down gracefully. Stops accepting commands, waits for
+        the running ones and any game tasks (such as an Exchange counting
+        down) to finish, lets each game's channel know the game is over,
+        waits for the queued messages to be sent, then closes the bot
+        (releasing the users held by its games)
+        timeout: float, representing the max seconds to wait in total
+        Return: dict of str to int, representing how many commands, game
+        tasks, and messages were finished, and how many were abandoned (None
+        if the bot was already shutting down)
+        '''
+        if self._shutting_down:
+            return None
+        self._shutting_down = True
+        self._stop_intake("The bot is shutting down")
+        deadline = time.monotonic() + (timeout or self.SHUTDOWN_TIMEOUT)
+        print("Shutting down: waiting for running commands and game tasks")
+        delivered_before = self._count_delivered()
+        commands_before, tasks_before = self._count_in_flight()
+        commands_left, tasks_left = await self._wait_in_flight(deadline, game_tasks=True)
+
+        # Nothing runs in the games after this
+        games = self.get_games()
+        channels = []
+        for channel_id, game in games.items():
+            game.cancel_timer()
+            channel = self.get_channel(channel_id)
+            if channel is not None:
+                channels.append(channel)
+        notices = asyncio.gather(*(
+            self.outbound.send(channel, "The bot is shutting down; this game has ended") for channel in channels
+        ), return_exceptions=True)
+        try:
+            await asyncio.wait_for(notices, max(deadline - time.monotonic(), 0.1))
+        except asyncio.TimeoutError:
+            # counted with the abandoned messages below
+            pass
+        await self.outbound.drain(timeout=max(deadline - time.monotonic(), 0))
+        messages_left = self.outbound.queued_count()
+
+        report = {
+            'commands': commands_before - commands_left,
+            'game_tasks': tasks_before - tasks_left,
+            'messages': self._count_delivered() - delivered_before,
+            'abandoned_commands': commands_left,
+            'abandoned_game_tasks': tasks_left,
+            'abandoned_messages': messages_left,
+        }
+        print(f"Finished {report['commands']} commands and {report['game_tasks']} game tasks, "
+              f"and sent {report['messages']} messages ({len(games)} games ended)")
+        if commands_left or tasks_left or messages_left:
+            print(f"Abandoned {commands_left} commands, {tasks_left} game tasks, "
+                  f"and {messages_left} messages that did not finish in time")
+        digest = self.errors.digest()
+        if digest is not None:
+            # would otherwise be lost with the next hourly digest
+            print(f"Errors since the last digest:\n{digest}")
+        await self.close()
+        return report
+
+    def _on_stop_signal(self):
+        '''
+        Shuts down gracefully when the process is told to stop, or right
+        away if it is told again while shutting down
+        '''
+        if self._shutting_down:
+            print("Stopping now")
+            self.loop.stop()
+        else:
+            self.loop.create_task(self.shut_down())
+
+    def _stop_intake(self, reply):
+        '''
+        Stops accepting commands
+        reply: str, representing the reply to commands sent from now on
+        '''
+        self.accepting_commands = False
+        self._intake_reply = reply
+
+    def _count_delivered(self):
+        '''
+        Counts the messages the outbound queue has sent or edited so far
+        '''
+        return sum(self.outbound.counts[kind] for kind in ('sent', 'dm', 'edited'))
+
+    def _count_in_flight(self, calling_channel_id=None):
+        '''
+        Counts the commands (and other work for a channel) that are running
+        or waiting to run, and the game tasks running in the background
+        calling_channel_id: int, representing the channel of the command
+        asking, whose work is not counted
+        Return: tuple of (int, int), representing the commands and game tasks
+        '''
+        commands_count = self._mailbox.total_count()
+        if calling_channel_id is not None and self._mailbox.is_busy(calling_channel_id):
+            commands_count -= self._mailbox.waiting_count(calling_channel_id) + 1
+        return commands_count, len(self._game_tasks)
+
+    async def _cancel_game_tasks(self):
+        '''
+        Cancels the game tasks running in the background, and waits for
+        them to stop
+        Return: set of int, representing the channels of the games whose
+        tasks were cancelled
+        '''
+        tasks = dict(self._game_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return set(tasks.values())
+
+    async def _wait_in_flight(self, deadline, *, calling_channel_id=None, game_tasks=False):
+        '''
+        Waits for the running commands (and optionally the game tasks) to
+        finish, or for the deadline to pass
+        deadline: float, representing the time.monotonic() to stop waiting at
+        calling_channel_id: int, representing the channel of the command
+        waiting, which is not waited on
+        game_tasks: bool, representing whether to wait for the game tasks
+        Return: tuple of (int, int), representing the commands and game
+        tasks still running
+        '''
+        while time.monotonic() < deadline:
+            commands_left, tasks_left = self._count_in_flight(calling_channel_id)
+            if commands_left == 0 and (tasks_left == 0 or not game_tasks):
+                break
+            await asyncio.sleep(0.05)
+        return self._count_in_flight(calling_channel_id)
+
+    async def _resume_games(self, path):
+        '''
+        Loads the games from a snapshot left by hand_off(), if there is one.
+        Their timers are restarted once their shards are ready
+        path: str, representing the path of the snapshot file
+        '''
+        if not os.path.exists(path):
+            return
+        start = time.perf_counter()
+        try:
+            taken_at, entries = read_snapshot(self._connection, path)
+        except SnapshotError as e:
+            print(f"Could not resume games: {e}")
+            return
+        finally:
+            # never resume the same games twice
+            os.replace(path, path + '.resumed')
+
+        for entry in entries:
+            self.set_game(entry.channel_id, entry.game, shard_id=entry.shard_id)
+            for user_id in entry.game.get_player_ids():
+                try:
+                    acquired = await self.user_locks.acquire(user_id)
+                except UserLocksUnavailable:
+                    # already playing this game, so keep them in it
+                    acquired = False
+                if not acquired:
+                    # still held by the old process until its lease runs out
+                    self.user_locks.hold(user_id)
+            self._resumed.setdefault(entry.shard_id, []).append(entry)
+        print(f"Resumed {len(entries)} games from {taken_at:%H:%M:%S} in {time.perf_counter() - start:.2f}s")
+
+    def _continue_resumed_games(self, shard_id):
+        '''
+        Restarts the timers of the games resumed on a shard, with the time
+        they had left, and lets their channels know the game is back
+        shard_id: int, representing the shard that is ready
+        '''
+        for entry in self._resumed.pop(shard_id, ()):
+            channel = self.get_channel(entry.channel_id)
+            if channel is None or self.get_game(entry.channel_id) is not entry.game:
+                # channel was deleted, or game ended before the shard was ready
+                continue
+            if entry.timer_remaining is not None:
+                self.reset_timer(channel, entry.game, entry.timer_remaining)
+            self.dispatch('game_resumed', channel, entry.game, entry.tasks_interrupted)
+
+    async def _run_timer(self, channel, game, timeout):
+        '''
+        Waits for the timeout to run out, then dispatches the `game_timeout` event
+        channel: discord.Channel where game is being played
+        game: CoupGame the timer is for
+        timeout: int, representing the number of seconds to wait
+        '''
+        await asyncio.sleep(timeout)
+        self.dispatch('game_timeout', channel, game, asyncio.current_task())
+
+
+def _print_crash_dump(dump):
+    '''
+    Prints where a crash dump was written, once it has been written
+    dump: asyncio.Future writing the crash dump
+    '''
+    if dump.cancelled():
+        return
+    error = dump.exception()
+    if error is not None:
+        print(f"Could not write crash dump: {error!r}")
+    else:
+        print(f"Crash dump written to {dump.result()}")
+
+def _is_engine_module(name):
+    '''
+    Checks if a module is one of the engine modules, or inside one
+    name: str, representing the name of the module
+    '''
+    return any(name == engine or name.startswith(engine + '.') for engine in engine_modules)
@@ -0,0 +1,152 @@
+'''
+File: cluster_client.py
+Author: Gavin Vogt
+This program defines the ClusterClient class, which a worker process of
+the cluster uses to talk to the supervisor (see cluster.py)
+'''
+
+# dependencies
+import asyncio
+import itertools
+import json
+import logging
+
+
+logger = logging.getLogger('coup.cluster')
+
+
+class ClusterClient:
+    '''
+    This class connects a worker to the cluster supervisor over a Unix
+    socket, for operations that span every worker (such as the user locks
+    in ClusterUserLocks). Messages are lines of JSON; requests carry an ID
+    the reply is matched to, and messages are handled in the order they
+    were sent. The client reconnects if the connection is lost.
+
+    Useful methods:
+        - connect(hello)
+        - request(op, **fields)
+        - send(op, **fields)
+        - close()
+    '''
+
+    TIMEOUT_DEFAULT = 5.0     # seconds to wait for a reply from the supervisor
+    RECONNECT_DELAY = 1.0     # seconds between attempts to reconnect
+
+    def __init__(self, path, worker_id, *, timeout=None):
+        '''
+        Constructs the client (call connect() to connect it)
+        path: str, representing the path of the supervisor's socket
+        worker_id: int, representing which worker this is
+        timeout: float, representing seconds to wait for a reply
+        '''
+        self.path = path
+        self.worker_id = worker_id
+        self._timeout = timeout or self.TIMEOUT_DEFAULT
+        self._ids = itertools.count(1)
+        self._pending = {}         # maps request ID to the asyncio.Future waiting on its reply
+        self._writer = None
+        self._reader_task = None
+        self._hello = None         # function returning extra fields for the hello message
+        self._closed = False
+
+    async def connect(self, hello=None):
+        '''
+        Connects to the supervisor, and keeps reconnecting if the
+        connection is lost
+        hello: function returning a dict of fields to send along with the
+        worker ID each time the worker (re)connects, such as its state
+        '''
+        self._hello = hello
+        self._closed = False
+        await self._open()
+
+    async def request(self, op, **fields):
+        '''
+        Sends a request and waits for the reply
+        op: str, representing the operation
+        Return: dict, representing the reply
+        '''
+        if self._writer is None:
+            raise ConnectionError("not connected to the supervisor")
+        request_id = next(self._ids)
+        future = asyncio.get_event_loop().create_future()
+        self._pending[request_id] = future
+        self._write({'id': request_id, 'op': op, **fields})
+        try:
+            return await asyncio.wait_for(future, self._timeout)
+        finally:
+            self._pending.pop(request_id, None)
+
+    def send(self, op, **fields):
+        '''
+        Sends a message without waiting for a reply (dropped if not connected)
+        op: str, representing the operation
+        '''
+        self._write({'op': op, **fields})
+
+    async def close(self):
+        '''
+        Disconnects from the supervisor
+        '''
+        self._closed = True
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._fail_pending(ConnectionError("cluster client closed"))
+
+    async def _open(self):
+        '''
+        Opens the connection, and tells the supervisor which worker this is
+        '''
+        reader, self._writer = await asyncio.open_unix_connection(self.path)
+        hello = self._hello() if self._hello is not None else {}
+        self.send('hello', worker=self.worker_id, **hello)
+        self._reader_task = asyncio.get_event_loop().create_task(self._read(reader))
+
+    def _write(self, message):
+        '''
+        Writes a message to the socket (dropped if not connected)
+        '''
+        if self._writer is not None:
+            self._writer.write(json.dumps(message).encode() + b'\n')
+
+    async def _read(self, reader):
+        '''
+        Reads replies and hands them to whoever is waiting on them,
+        reconnecting if the connection is lost
+        '''
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                reply = json.loads(line)
+                future = self._pending.get(reply.get('id'))
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        except (ConnectionError, ValueError) as e:
+            logger.warning("Lost connection to the supervisor: %r", e)
+        self._writer = None
+        self._fail_pending(ConnectionError("lost connection to the supervisor"))
+
+        while not self._closed:
+            await asyncio.sleep(self.RECONNECT_DELAY)
+            try:
+                await self._open()
+                logger.info("Reconnected to the supervisor")
+                return
+            except OSError as e:
+                logger.warning("Could not reconnect to the supervisor: %r", e)
+
+    def _fail_pending(self, error):
+        '''
+        Fails every request still waiting on a reply
+        '''
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
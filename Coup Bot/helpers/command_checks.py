@@ -10,6 +10,7 @@ from discord.ext import commands
 # my code
 from classes.coup_game import CoupGame
 from classes import actions
+from helpers.spans import span
 
 class CustomCheckFailure(commands.CheckFailure):
     '''
@@ -18,6 +19,38 @@ class CustomCheckFailure(commands.CheckFailure):
     '''
     pass
 
+def custom_check(predicate):
+    '''
+    Makes a command check out of the predicate, like commands.check(), but
+    remembers the name of the check (the function that made the predicate)
+    in `ctx.failed_check` when it fails, so rejections can be counted by check
+    predicate: async function taking the Context, returning whether the check passed
+    '''
+    check_name = predicate.__qualname__.split('.')[0]
+
+    async def named_predicate(ctx):
+        try:
+            with span('check', check=check_name):
+                passed = await predicate(ctx)
+        except commands.CheckFailure:
+            ctx.failed_check = check_name
+            raise
+        if not passed:
+            ctx.failed_check = check_name
+        return passed
+    return commands.check(named_predicate)
+
+def rejects_stale():
+    '''
+    Marks a command as being decided against the game state the player
+    saw when they sent it. If the game changes while the command waits
+    for its turn to run, the command is dropped without running any checks
+    '''
+    def decorator(func):
+        func.__rejects_stale__ = True
+        return func
+    return decorator
+
 def channel_has_game():
     '''
     Checks that the channel has a game
@@ -28,7 +61,7 @@ def channel_has_game():
             return True
         else:
             raise CustomCheckFailure("No active game in this channel")
-    return commands.check(predicate)
+    return custom_check(predicate)
 
 def game_is_started():
     '''
@@ -41,7 +74,7 @@ def game_is_started():
             return True
         else:
             raise CustomCheckFailure("Game has not started yet")
-    return commands.check(predicate)
+    return custom_check(predicate)
 
 def game_not_started():
     '''
@@ -54,7 +87,7 @@ def game_not_started():
             return True
         else:
             raise CustomCheckFailure("Game has already started")
-    return commands.check(predicate)
+    return custom_check(predicate)
 
 def is_player():
     '''
@@ -67,7 +100,7 @@ def is_player():
             return True
         else:
             raise CustomCheckFailure("You are not a player in this game")
-    return commands.check(predicate)
+    return custom_check(predicate)
 
 def is_turn():
     '''
@@ -95,7 +128,7 @@ def is_turn():
             return True
         else:
             raise CustomCheckFailure("It is not your turn")
-    return commands.check(predicate)
+    return custom_check(predicate)
 
 def others_in_game(num_to_check, action_str):
     '''
@@ -116,7 +149,7 @@ def others_in_game(num_to_check, action_str):
                 raise CustomCheckFailure(f"{member.mention} is not part of this game")
             i += 1
         return True
-    return commands.check(predicate)
+    return custom_check(predicate)
 
 def is_stage(game_stage):
     '''
@@ -125,7 +158,7 @@ def is_stage(game_stage):
     async def predicate(ctx):
         game = ctx.bot.get_game(ctx.channel.id)
         return (game_stage == game.get_stage())
-    return commands.check(predicate)
+    return custom_check(predicate)
 
 def is_game_master():
     '''
@@ -138,7 +171,7 @@ def is_game_master():
             return True
         else:
             raise CustomCheckFailure("Must be game master to complete this action")
-    return commands.check(predicate)
+    return custom_check(predicate)
 
 def has_enough_coins(min_coins):
     '''
@@ -151,7 +184,7 @@ def has_enough_coins(min_coins):
             return True
         else:
             raise CustomCheckFailure("Not enough coins")
-    return commands.check(predicate)
+    return custom_check(predicate)
 
 def under_ten_coins():
     '''
@@ -165,7 +198,7 @@ def under_ten_coins():
             return True
         else:
             raise CustomCheckFailure("Over 10 coins; must coup another player")
-    return commands.check(predicate)
+    return custom_check(predicate)
 
 def must_swap():
     '''
@@ -179,7 +212,7 @@ def must_swap():
             return True
         else:
             raise CustomCheckFailure("You do not have to swap a card")
-    return commands.check(predicate)
+    return custom_check(predicate)
 
 def must_kill():
     '''
@@ -193,7 +226,7 @@ def must_kill():
             return True
         else:
             raise CustomCheckFailure("You do not have to kill a card")
-    return commands.check(predicate)
+    return custom_check(predicate)
 
 def is_exchange():
     '''
@@ -208,7 +241,7 @@ def is_exchange():
             raise CustomCheckFailure("You are not swapperman")
         else:
             return True
-    return commands.check(predicate)
+    return custom_check(predicate)
 
 def exchange_time_up(time_up):
     '''
@@ -230,7 +263,7 @@ def exchange_time_up(time_up):
                 raise CustomCheckFailure("Time to challenge `Exchange` is not up")
             else:
                 raise CustomCheckFailure("Time to challenge `Exchange` is already up")
-    return commands.check(predicate)
+    return custom_check(predicate)
 
 def not_swapped_yet():
     '''
@@ -242,7 +275,7 @@ def not_swapped_yet():
             raise CustomCheckFailure("Already swapped")
         else:
             return True
-    return commands.check(predicate)
+    return custom_check(predicate)
 
 
 
@@ -0,0 +1,176 @@
+'''
+File: error_reporter.py
+Author: Gavin Vogt
+This program defines the ErrorReporter class, which groups errors that
+come from the same bug so a recurring error does not flood the output
+'''
+
+# dependencies
+from datetime import datetime
+import hashlib
+import logging
+import os
+import time
+import traceback
+
+
+logger = logging.getLogger('coup.errors')
+
+
+class ErrorReporter:
+    '''
+    This class fingerprints errors by their type and where they were raised,
+    so every occurrence of the same bug is counted together. The traceback
+    of an error is only logged the first time it is seen, and after that
+    at most once per interval (with how many were skipped), and no more than
+    a fixed number of tracebacks are logged per minute overall. Counts are
+    exposed as metrics and summarized in a digest for the owner.
+
+    Useful methods:
+        - report(error, context)
+        - digest()
+        - get_errors()
+    '''
+
+    LOG_INTERVAL_DEFAULT = 60       # seconds between tracebacks for the same error
+    TRACEBACKS_PER_MINUTE = 10      # most tracebacks logged per minute for all errors
+    MAX_FINGERPRINTS = 200          # distinct errors tracked (the rest are grouped as "other")
+
+    def __init__(self, metrics=None, *, log_interval=None):
+        '''
+        Constructs the reporter
+        metrics: MetricsRegistry to count errors in (None for no metrics)
+        log_interval: float, representing seconds between tracebacks for the same error
+        '''
+        self._log_interval = log_interval or self.LOG_INTERVAL_DEFAULT
+        self._errors = {}          # maps fingerprint to _ErrorEntry
+        self._budget = self.TRACEBACKS_PER_MINUTE   # tracebacks that can be logged right now
+        self._budget_updated = time.monotonic()
+        self._errors_total = None
+        if metrics is not None:
+            self._errors_total = metrics.counter('coup_errors_total',
+                "Errors by fingerprint (type and stack)", ('fingerprint', 'type'))
+
+    def report(self, error, context=None):
+        '''
+        Records an error, logging it if it has not been logged recently
+        error: Exception that was raised
+        context: str, describing what was running (such as the command)
+        Return: bool, representing whether the error was sampled (logged in
+        full), which callers can use to decide whether to do costly reporting
+        '''
+        fingerprint, location = self.fingerprint(error)
+        entry = self._errors.get(fingerprint)
+        if entry is None:
+            if len(self._errors) >= self.MAX_FINGERPRINTS:
+                fingerprint = 'other'
+                entry = self._errors.get(fingerprint)
+            if entry is None:
+                entry = self._errors[fingerprint] = _ErrorEntry(fingerprint, error, location)
+
+        now = time.monotonic()
+        entry.count += 1
+        entry.new_count += 1
+        entry.last_seen = datetime.utcnow()
+        entry.last_context = context
+        if self._errors_total is not None:
+            self._errors_total.inc(fingerprint, entry.type_name)
+
+        if entry.last_logged is not None and now - entry.last_logged < self._log_interval:
+            # logged recently
+            entry.suppressed += 1
+            return False
+        if not self._take_budget(now):
+            # too many tracebacks logged overall; wait for the next interval
+            entry.suppressed += 1
+            return False
+
+        header = f"ERROR [{fingerprint}] in {context or 'unknown'}: {type(error).__name__}: {error}"
+        if entry.suppressed > 0:
+            header += f" (repeated {entry.suppressed} times since last shown)"
+        text = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+        logger.error("%s\n%s", header, text)
+        entry.last_logged = now
+        entry.suppressed = 0
+        return True
+
+    def digest(self):
+        '''
+        Summarizes the errors seen since the last digest, most frequent
+        first, and starts counting again
+        Return: str, representing the summary, or None if there were no errors
+        '''
+        new_errors = sorted((entry for entry in self._errors.values() if entry.new_count > 0),
+                            key=lambda entry: entry.new_count, reverse=True)
+        if not new_errors:
+            return None
+        lines = []
+        for entry in new_errors[:10]:
+            lines.append(f"`{entry.fingerprint}` x{entry.new_count} (total {entry.count}): "
+                         f"{entry.type_name}: {entry.message[:100]}")
+            lines.append(f"    at {entry.location}, last in {entry.last_context}")
+            entry.new_count = 0
+        if len(new_errors) > 10:
+            lines.append(f"... and {len(new_errors) - 10} more")
+            for entry in new_errors[10:]:
+                entry.new_count = 0
+        return "\n".join(lines)
+
+    def get_errors(self):
+        '''
+        Gets every error seen so far
+        Return: list of _ErrorEntry, most frequent first
+        '''
+        return sorted(self._errors.values(), key=lambda entry: entry.count, reverse=True)
+
+    @staticmethod
+    def fingerprint(error):
+        '''
+        Fingerprints an error by its type and the functions it was raised
+        through (not line numbers, so small edits keep the same fingerprint)
+        error: Exception to fingerprint
+        Return: tuple of (str, str), representing the fingerprint and the
+        innermost location it was raised at
+        '''
+        parts = [type(error).__module__, type(error).__qualname__]
+        location = "unknown"
+        for frame, line in traceback.walk_tb(error.__traceback__):
+            code = frame.f_code
+            filename = os.path.basename(code.co_filename)
+            parts.append(f"{filename}:{code.co_name}")
+            location = f"{filename}:{line} in {code.co_name}"
+        return hashlib.sha1("|".join(parts).encode()).hexdigest()[:10], location
+
+    def _take_budget(self, now):
+        '''
+        Uses up one logged traceback, if the overall limit allows it
+        '''
+        per_second = self.TRACEBACKS_PER_MINUTE / 60
+        self._budget = min(self.TRACEBACKS_PER_MINUTE,
+                           self._budget + (now - self._budget_updated) * per_second)
+        self._budget_updated = now
+        if self._budget < 1:
+            return False
+        self._budget -= 1
+        return True
+
+
+class _ErrorEntry:
+    '''
+    Everything known about one fingerprinted error
+    '''
+    __slots__ = ('fingerprint', 'type_name', 'message', 'location', 'count', 'new_count',
+                 'first_seen', 'last_seen', 'last_context', 'last_logged', 'suppressed')
+
+    def __init__(self, fingerprint, error, location):
+        self.fingerprint = fingerprint
+        self.type_name = type(error).__name__
+        self.message = str(error)
+        self.location = location
+        self.count = 0            # times seen in total
+        self.new_count = 0        # times seen since the last digest
+        self.first_seen = datetime.utcnow()
+        self.last_seen = self.first_seen
+        self.last_context = None
+        self.last_logged = None   # monotonic time the traceback was last logged
+        self.suppressed = 0       # times seen since the traceback was last logged
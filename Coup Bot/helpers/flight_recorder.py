@@ -0,0 +1,139 @@
+'''
+File: flight_recorder.py
+Author: Gavin Vogt
+This program defines the FlightRecorder class, which remembers the last
+things that happened in a game so errors can be diagnosed afterwards
+'''
+
+# dependencies
+from datetime import datetime
+import json
+import os
+import time
+import traceback
+
+
+CRASH_DIRECTORY = 'crash_dumps'   # where crash dumps are written
+
+
+class FlightRecorder:
+    '''
+    This class keeps the last few events of a game (commands and state
+    changes) in a fixed-size ring buffer. The buffer is allocated up front,
+    so recording only fills in a slot. What each event happened to is saved
+    as its repr() when it is recorded, so a dump shows it as it was at the
+    time, not as it is when the dump is written. That repr() is most of the
+    cost of recording (about a microsecond for an Action or Player, against
+    a fraction of that for an event without one); a command records a few
+    events, which is still small next to its round trip to Discord
+
+    Useful methods:
+        - record(version, kind, subject, info)
+        - entries()
+        - format()
+    '''
+    __slots__ = ('_size', '_times', '_versions', '_kinds', '_subjects', '_infos', '_next', '_count')
+
+    def __init__(self, size):
+        '''
+        Constructs an empty recorder
+        size: int, representing the number of events to keep
+        '''
+        self._size = size
+        self._times = [0.0] * size
+        self._versions = [0] * size
+        self._kinds = [None] * size
+        self._subjects = [None] * size
+        self._infos = [None] * size
+        self._next = 0     # slot the next event goes in
+        self._count = 0    # number of slots filled
+
+    def __len__(self):
+        return self._count
+
+    def record(self, version, kind, subject=None, info=None):
+        '''
+        Records an event, replacing the oldest one if the buffer is full
+        version: int, representing the game version when it happened
+        kind: str, representing what happened (such as "command" or "action")
+        subject: what it happened to (saved as its repr())
+        info: anything else about the event (saved as its repr())
+        '''
+        i = self._next
+        self._times[i] = time.time()
+        self._versions[i] = version
+        self._kinds[i] = kind
+        self._subjects[i] = None if subject is None else repr(subject)
+        self._infos[i] = None if info is None else repr(info)
+        self._next = (i + 1) % self._size
+        if self._count < self._size:
+            self._count += 1
+
+    def entries(self):
+        '''
+        Gets the recorded events, oldest first
+        Return: list of (float, int, str, str, str), representing the
+        time, version, kind, subject, and info of each event (the subject
+        and info as their repr() when recorded, or None)
+        '''
+        start = (self._next - self._count) % self._size
+        return [
+            (self._times[i], self._versions[i], self._kinds[i], self._subjects[i], self._infos[i])
+            for i in ((start + j) % self._size for j in range(self._count))
+        ]
+
+    def format(self):
+        '''
+        Formats the recorded events as lines of text, oldest first
+        '''
+        lines = []
+        for timestamp, version, kind, subject, info in self.entries():
+            when = datetime.utcfromtimestamp(timestamp).strftime('%H:%M:%S.%f')[:-3]
+            line = f"{when} v{version:<5} {kind:<14}"
+            if subject is not None:
+                line += f" {subject}"
+            if info is not None:
+                line += f" {info}"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+def crash_report(game, error, description):
+    '''
+    Builds the text of a crash dump for an error in a game: the traceback,
+    the game's recorded events, and a snapshot of the game state
+    game: CoupGame the error happened in
+    error: Exception that was raised
+    description: str, describing what was running (such as the command)
+    Return: str, representing the crash dump
+    '''
+    try:
+        snapshot = json.dumps(game.debug_snapshot(), indent=2, default=str)
+    except Exception as e:
+        snapshot = f"(could not take snapshot: {e!r})"
+    return "\n".join((
+        f"Crash in {description} at {datetime.utcnow().isoformat()}",
+        "",
+        "".join(traceback.format_exception(type(error), error, error.__traceback__)),
+        f"Last {len(game.flight_recorder)} events:",
+        game.flight_recorder.format(),
+        "",
+        "Game state:",
+        snapshot,
+        "",
+    ))
+
+def write_crash_dump(name, report, directory=CRASH_DIRECTORY):
+    '''
+    Writes a crash dump to a file
+    name: str, representing what to start the file name with (such as the channel ID)
+    report: str, representing the crash dump (from crash_report())
+    directory: str, representing the directory to write to
+    Return: str, representing the path of the file
+    '''
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S-%f')
+    path = os.path.join(directory, f"crash-{name}-{stamp}.txt")
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(report)
+    return path
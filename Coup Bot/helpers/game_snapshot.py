@@ -0,0 +1,170 @@
+'''
+File: game_snapshot.py
+Author: Gavin Vogt
+This program saves every game to a file and loads them back, so games
+can be handed off from one bot process to the next when it restarts (or
+moved into new versions of the game classes when the code is reloaded)
+'''
+
+# dependencies
+from discord import User, Member, ClientUser
+from contextlib import contextmanager
+from datetime import datetime
+import copyreg
+import gc
+import io
+import os
+import pickle
+
+
+SNAPSHOT_VERSION = 2                    # increases when the file format changes
+SNAPSHOT_FILE_DEFAULT = 'games_snapshot.pickle'
+
+
+class SnapshotError(Exception):
+    '''
+    Raised when a snapshot cannot be loaded
+    '''
+
+
+class GameEntry:
+    '''
+    A game in a snapshot, along with where it is played, how much time
+    was left on its timer, and whether part of it running in the background
+    (such as an Exchange counting down) was stopped and must be started again
+    '''
+    __slots__ = ('channel_id', 'shard_id', 'game', 'timer_remaining', 'tasks_interrupted')
+
+    def __init__(self, channel_id, shard_id, game, timer_remaining, tasks_interrupted=False):
+        self.channel_id = channel_id
+        self.shard_id = shard_id
+        self.game = game
+        self.timer_remaining = timer_remaining       # seconds, or None if there was no timer
+        self.tasks_interrupted = tasks_interrupted
+
+
+def write_snapshot(entries, path=SNAPSHOT_FILE_DEFAULT):
+    '''
+    Writes games to a snapshot file. The file is written next to the old
+    one and then moved over it, so a crash never leaves half a snapshot
+    entries: list of GameEntry to save
+    path: str, representing the path of the file
+    Return: int, representing the size of the file in bytes
+    '''
+    data = dump_games(entries)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+    return len(data)
+
+def read_snapshot(state, path=SNAPSHOT_FILE_DEFAULT):
+    '''
+    Loads games from a snapshot file (only load files this bot wrote, since
+    loading a pickle runs code from it)
+    state: discord ConnectionState to recreate the players' users in
+    path: str, representing the path of the file
+    Return: tuple of (datetime, list of GameEntry), representing when the
+    snapshot was taken (UTC) and the games in it
+    '''
+    with open(path, 'rb') as file:
+        data = file.read()
+    try:
+        return load_games(state, data)
+    except SnapshotError as e:
+        raise SnapshotError(f"Could not load snapshot {path}: {e}") from e
+
+def dump_games(entries):
+    '''
+    Saves games to bytes (see write_snapshot())
+    entries: list of GameEntry to save
+    Return: bytes, representing the saved games
+    '''
+    buffer = io.BytesIO()
+    pickler = _SnapshotPickler(buffer, protocol=pickle.HIGHEST_PROTOCOL)
+    with _gc_paused():
+        pickler.dump((SNAPSHOT_VERSION, datetime.utcnow(), [
+            (entry.channel_id, entry.shard_id, entry.game, entry.timer_remaining, entry.tasks_interrupted)
+            for entry in entries
+        ]))
+    return buffer.getvalue()
+
+def load_games(state, data):
+    '''
+    Loads games saved by dump_games(), as instances of whichever version
+    of the game classes is imported now
+    state: discord ConnectionState to recreate the players' users in
+    data: bytes, representing the saved games
+    Return: tuple of (datetime, list of GameEntry), representing when the
+    games were saved (UTC) and the games
+    '''
+    try:
+        with _gc_paused():
+            version, taken_at, entries = _SnapshotUnpickler(io.BytesIO(data), state).load()
+    except (pickle.UnpicklingError, AttributeError, ImportError, EOFError, ValueError) as e:
+        raise SnapshotError(repr(e)) from e
+    if version != SNAPSHOT_VERSION:
+        raise SnapshotError(f"version is {version}, expected {SNAPSHOT_VERSION}")
+    return taken_at, [GameEntry(*entry) for entry in entries]
+
+
+@contextmanager
+def _gc_paused():
+    '''
+    Pauses the garbage collector, which would otherwise scan every game
+    again and again while thousands of them are saved or loaded at once
+    '''
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def _stored_user(data):
+    '''
+    Stands in for the function that recreates a user when a snapshot is
+    loaded (the unpickler swaps in the new connection's store_user)
+    '''
+    raise SnapshotError("Users can only be recreated by read_snapshot()")
+
+def _reduce_user(user):
+    '''
+    Saves a Discord user as its plain data, since it is tied to the
+    connection of the process that is shutting down
+    '''
+    return (_stored_user, ({
+        'id': user.id,
+        'username': user.name,
+        'discriminator': user.discriminator,
+        'avatar': user.avatar,
+        'bot': user.bot,
+    },))
+
+
+class _SnapshotPickler(pickle.Pickler):
+    '''
+    Pickler that saves Discord users as their plain data. Only the user
+    types are looked up in the dispatch table, so the rest of the game is
+    pickled without calling back into Python
+    '''
+    dispatch_table = copyreg.dispatch_table.copy()
+    dispatch_table.update({user_type: _reduce_user for user_type in (User, Member, ClientUser)})
+
+
+class _SnapshotUnpickler(pickle.Unpickler):
+    '''
+    Unpickler that recreates Discord users in the new process's connection
+    (without any requests to Discord)
+    '''
+    def __init__(self, file, state):
+        super().__init__(file)
+        self._state = state
+
+    def find_class(self, module, name):
+        if module == __name__ and name == '_stored_user':
+            return self._state.store_user
+        return super().find_class(module, name)
@@ -0,0 +1,206 @@
+'''
+File: logging_utils.py
+Author: Gavin Vogt
+This program sets up the bot's logging, so log records are formatted and
+written to disk on a background thread instead of on the event loop
+'''
+
+# dependencies
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import atexit
+import gzip
+import logging
+import os
+import queue
+import shutil
+import time
+
+
+LOG_FORMAT = '%(asctime)s:%(levelname)s:%(name)s: %(message)s'
+LOG_FILE_DEFAULT = 'discord_bot_log.log'
+MAX_BYTES_DEFAULT = 5 * 1024 * 1024   # rotate once the log reaches 5 MB ...
+ROTATE_EVERY_DEFAULT = 24 * 60 * 60   # ... or is a day old
+BACKUP_COUNT_DEFAULT = 5              # number of compressed old logs to keep
+LEVELS_DEFAULT = {
+    'discord': logging.INFO,
+    'coup': logging.INFO,
+}
+
+_listener = None   # QueueListener writing records on the background thread
+_extra_listeners = []   # QueueListeners for loggers written to their own files
+
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    '''
+    File handler that starts a new log once the current one is too big or
+    too old, and compresses the old logs with gzip (log.1.gz, log.2.gz, ...)
+    '''
+    def __init__(self, filename, *, max_bytes=MAX_BYTES_DEFAULT,
+                 rotate_every=ROTATE_EVERY_DEFAULT, backup_count=BACKUP_COUNT_DEFAULT):
+        '''
+        Constructs the handler, appending to the log if it already exists
+        filename: str, representing the path of the log file
+        max_bytes: int, representing the size that causes a rotation (0 for no limit)
+        rotate_every: int, representing seconds between rotations (0 for never)
+        backup_count: int, representing the number of old logs to keep
+        '''
+        super().__init__(filename, mode='a', maxBytes=max_bytes,
+                         backupCount=backup_count, encoding='utf-8', delay=True)
+        self._rotate_every = rotate_every
+        self._rotate_at = self._next_rotation(self._opened_at())
+
+    def shouldRollover(self, record):
+        '''
+        Checks if the log needs to be rotated before writing the record
+        '''
+        if self._rotate_every and time.time() >= self._rotate_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        '''
+        Rotates the log, and schedules the next time-based rotation
+        '''
+        super().doRollover()
+        self._rotate_at = self._next_rotation(time.time())
+
+    def rotation_filename(self, default_name):
+        '''
+        Names rotated logs with a .gz extension
+        '''
+        return default_name + '.gz'
+
+    def rotate(self, source, dest):
+        '''
+        Compresses the current log into the rotated log file
+        '''
+        if not os.path.exists(source):
+            return
+        with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+    def _opened_at(self):
+        '''
+        Gets when the current log was started, so restarts do not
+        reset the time until the next rotation
+        '''
+        try:
+            return os.path.getmtime(self.baseFilename)
+        except OSError:
+            return time.time()
+
+    def _next_rotation(self, start):
+        '''
+        Gets the time of the next time-based rotation
+        '''
+        return start + self._rotate_every if self._rotate_every else float('inf')
+
+
+class _DeferredQueueHandler(QueueHandler):
+    '''
+    Queue handler that leaves formatting to the background thread
+    (the default one formats the message before queueing it)
+    '''
+    def prepare(self, record):
+        return record
+
+
+def start_logging(filename=LOG_FILE_DEFAULT, *, levels=None, max_bytes=MAX_BYTES_DEFAULT,
+                  rotate_every=ROTATE_EVERY_DEFAULT, backup_count=BACKUP_COUNT_DEFAULT):
+    '''
+    Starts the logging pipeline. Loggers only put records on a queue, and
+    a background thread formats them and writes them to the log file
+    filename: str, representing the path of the log file
+    levels: dict of logger name to level (int or str), overriding LEVELS_DEFAULT
+    max_bytes: int, representing the size that causes a rotation (0 for no limit)
+    rotate_every: int, representing seconds between rotations (0 for never)
+    backup_count: int, representing the number of old logs to keep
+    Return: QueueListener writing the records
+    '''
+    global _listener
+    if _listener is not None:
+        # already running
+        return _listener
+
+    file_handler = CompressingRotatingFileHandler(filename, max_bytes=max_bytes,
+        rotate_every=rotate_every, backup_count=backup_count)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    root.setLevel(logging.WARNING)
+    for name, level in {**LEVELS_DEFAULT, **(levels or {})}.items():
+        set_level(name, level)
+
+    _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+def add_log_file(name, filename, *, max_bytes=MAX_BYTES_DEFAULT,
+                 rotate_every=ROTATE_EVERY_DEFAULT, backup_count=BACKUP_COUNT_DEFAULT):
+    '''
+    Writes a logger's records (just the messages) to their own file instead
+    of the main log, also formatting and writing them on a background thread
+    name: str, representing the logger name
+    filename: str, representing the path of the file
+    max_bytes: int, representing the size that causes a rotation (0 for no limit)
+    rotate_every: int, representing seconds between rotations (0 for never)
+    backup_count: int, representing the number of old files to keep
+    Return: QueueListener writing the records
+    '''
+    file_handler = CompressingRotatingFileHandler(filename, max_bytes=max_bytes,
+        rotate_every=rotate_every, backup_count=backup_count)
+    file_handler.setFormatter(logging.Formatter('%(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    logger = logging.getLogger(name)
+    logger.addHandler(_DeferredQueueHandler(log_queue))
+    logger.propagate = False
+
+    listener = QueueListener(log_queue, file_handler)
+    listener.start()
+    _extra_listeners.append(listener)
+    atexit.register(stop_logging)
+    return listener
+
+def stop_logging():
+    '''
+    Writes any records still in the queues and stops the background threads
+    '''
+    global _listener
+    listeners = _extra_listeners + ([] if _listener is None else [_listener])
+    for listener in listeners:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+    _extra_listeners.clear()
+    _listener = None
+
+def set_level(name, level):
+    '''
+    Changes the level of a logger while the bot is running
+    name: str, representing the logger name ('root' for the root logger)
+    level: int or str (such as 'DEBUG'), representing the new level
+    Return: str, representing the name of the new level
+    '''
+    if isinstance(level, str):
+        level = level.upper()
+        if not isinstance(logging.getLevelName(level), int):
+            raise ValueError(f"Unknown log level {level}")
+    logger = logging.getLogger(None if name == 'root' else name)
+    logger.setLevel(level)
+    return logging.getLevelName(logger.level)
+
+def get_levels():
+    '''
+    Gets the levels of the root logger and every logger with its own level
+    Return: dict of logger name to level name
+    '''
+    levels = {'root': logging.getLevelName(logging.getLogger().level)}
+    for name, logger in sorted(logging.Logger.manager.loggerDict.items()):
+        if isinstance(logger, logging.Logger) and logger.level != logging.NOTSET:
+            levels[name] = logging.getLevelName(logger.level)
+    return levels
@@ -0,0 +1,168 @@
+'''
+File: loop_monitor.py
+Author: Gavin Vogt
+This program defines the LoopMonitor class, which measures how late the
+event loop is running and reports whatever blocks it
+'''
+
+# dependencies
+from contextlib import contextmanager
+from collections import deque
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+
+logger = logging.getLogger('coup.loop')
+
+
+class LoopMonitor:
+    '''
+    This class keeps measuring event loop lag by sleeping for a short
+    interval and timing how late it wakes up. A watchdog thread checks
+    that those wake-ups keep happening, and when the loop is blocked for
+    longer than the threshold, logs the stack of whatever is blocking it
+    along with the command and channel being run at the time.
+
+    Useful methods:
+        - start(loop)
+        - stop()
+        - attributed(name, channel_id)
+        - lag_percentiles()
+    '''
+
+    INTERVAL_DEFAULT = 0.05    # seconds between lag samples
+    THRESHOLD_DEFAULT = 0.1    # seconds the loop can be blocked before it is reported
+    WINDOW_DEFAULT = 6000      # lag samples kept for percentiles (5 minutes)
+    PERCENTILES = (0.5, 0.9, 0.99, 1.0)
+
+    def __init__(self, metrics=None, *, interval=None, threshold=None, window=None):
+        '''
+        Constructs the monitor
+        metrics: MetricsRegistry to record lag and blocks in (None for no metrics)
+        interval: float, representing seconds between lag samples
+        threshold: float, representing seconds the loop can be blocked before it is reported
+        window: int, representing how many lag samples percentiles are taken over
+        '''
+        self._interval = interval or self.INTERVAL_DEFAULT
+        self._threshold = threshold or self.THRESHOLD_DEFAULT
+        self._lags = deque(maxlen=window or self.WINDOW_DEFAULT)
+        self._attribution = {}     # maps asyncio.Task to (name, channel ID) it is running
+        self._loop = None
+        self._loop_thread_id = None
+        self._heartbeat = time.monotonic()   # last time the loop woke up on time
+        self._sampler = None       # asyncio.Task measuring lag
+        self._watchdog = None      # threading.Thread checking for blocks
+        self._stopped = threading.Event()
+
+        self._lag_histogram = None
+        self._blocks_total = None
+        if metrics is not None:
+            self._lag_histogram = metrics.histogram('coup_event_loop_lag_seconds',
+                "Seconds the event loop was late waking up a sleeping task",
+                buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+            metrics.gauge('coup_event_loop_lag_quantile_seconds',
+                "Event loop lag percentiles over the last few minutes", ('quantile',),
+                function=lambda: {(str(q),): lag for q, lag in self.lag_percentiles().items()})
+            self._blocks_total = metrics.counter('coup_event_loop_blocks_total',
+                "Times the event loop was blocked for longer than the threshold", ('name',))
+
+    def start(self, loop):
+        '''
+        Starts measuring the loop (must be called from the loop's thread)
+        loop: asyncio event loop to measure
+        '''
+        if self._sampler is not None:
+            return
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._sampler = loop.create_task(self._sample())
+        self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        '''
+        Stops measuring the loop
+        '''
+        self._stopped.set()
+        if self._sampler is not None:
+            self._sampler.cancel()
+            self._sampler = None
+        self._watchdog = None
+
+    @contextmanager
+    def attributed(self, name, channel_id=None):
+        '''
+        Marks the current task as running something (such as a command in
+        a channel), so blocks while it runs can be blamed on it
+        name: str, representing what is running (such as the command name)
+        channel_id: int, representing the channel it is running for
+        '''
+        task = asyncio.current_task()
+        self._attribution[task] = (name, channel_id)
+        try:
+            yield
+        finally:
+            self._attribution.pop(task, None)
+
+    def lag_percentiles(self):
+        '''
+        Gets percentiles of the recent lag samples
+        Return: dict of float (percentile, 1.0 being the max) to float (seconds)
+        '''
+        lags = sorted(self._lags)
+        if not lags:
+            return {}
+        return {q: lags[min(len(lags) - 1, int(q * len(lags)))] for q in self.PERCENTILES}
+
+    async def _sample(self):
+        '''
+        Measures how late the loop wakes up from each short sleep
+        '''
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self._interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(now - start - self._interval, 0.0)
+            self._lags.append(lag)
+            if self._lag_histogram is not None:
+                self._lag_histogram.observe(lag)
+
+    def _watch(self):
+        '''
+        Runs on the watchdog thread, reporting the loop once each time it
+        stops waking up for longer than the threshold
+        '''
+        reported = False
+        while not self._stopped.wait(self._threshold / 2):
+            blocked_for = time.monotonic() - self._heartbeat - self._interval
+            if blocked_for > self._threshold:
+                if not reported:
+                    reported = True
+                    self._report(blocked_for)
+            else:
+                reported = False
+
+    def _report(self, blocked_for):
+        '''
+        Logs what the loop thread is doing while it is blocked
+        blocked_for: float, representing seconds the loop has been blocked so far
+        '''
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "(no stack)\n"
+        task = asyncio.current_task(self._loop) if self._loop is not None else None
+        if task is None:
+            # not inside a task, such as a gateway or timer callback
+            name, channel_id = 'callback', None
+        else:
+            name, channel_id = self._attribution.get(task, ('unknown', None))
+        if self._blocks_total is not None:
+            self._blocks_total.inc(name)
+        logger.warning("Event loop blocked for over %.3fs by %s (channel %s):\n%s",
+                       blocked_for, name, channel_id, stack)
@@ -0,0 +1,79 @@
+'''
+File: mailbox.py
+Author: Gavin Vogt
+This program defines the ChannelMailbox class, which is used to run
+the work for each channel one at a time
+'''
+
+# dependencies
+from contextlib import asynccontextmanager
+import asyncio
+
+
+class ChannelMailbox:
+    '''
+    This class makes work for the same channel run one piece at a time,
+    in the order it arrived, while work for different channels keeps
+    running in parallel. Each channel only has a lock while something is
+    running or waiting in it, so idle channels take no memory.
+
+    Useful methods:
+        - serialized(channel_id)
+        - is_busy(channel_id)
+        - waiting_count(channel_id)
+        - busy_count()
+        - total_count()
+    '''
+    def __init__(self):
+        '''
+        Constructs an empty mailbox
+        '''
+        self._slots = {}   # maps channel ID to [asyncio.Lock, number of holders / waiters]
+
+    @asynccontextmanager
+    async def serialized(self, channel_id):
+        '''
+        Waits until nothing else is running for the channel, then holds
+        the channel until the `async with` block is exited
+        channel_id: int, representing the ID of the channel
+        '''
+        slot = self._slots.get(channel_id)
+        if slot is None:
+            slot = self._slots[channel_id] = [asyncio.Lock(), 0]
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                # nothing left running or waiting in the channel
+                del self._slots[channel_id]
+
+    def is_busy(self, channel_id):
+        '''
+        Checks if something is currently running for the channel
+        channel_id: int, representing the ID of the channel
+        '''
+        return (channel_id in self._slots)
+
+    def waiting_count(self, channel_id):
+        '''
+        Gets the number of things waiting to run for the channel
+        (not including the one currently running)
+        channel_id: int, representing the ID of the channel
+        '''
+        slot = self._slots.get(channel_id)
+        return 0 if slot is None else slot[1] - 1
+
+    def busy_count(self):
+        '''
+        Gets the number of channels with something running or waiting
+        '''
+        return len(self._slots)
+
+    def total_count(self):
+        '''
+        Gets the number of things running or waiting, in every channel
+        '''
+        return sum(slot[1] for slot in self._slots.values())
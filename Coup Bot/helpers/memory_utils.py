@@ -0,0 +1,105 @@
+'''
+File: memory_utils.py
+Author: Gavin Vogt
+This program provides helpful functions for measuring memory use
+'''
+
+# dependencies
+from collections import Counter
+import asyncio
+import gc
+import os
+import resource
+import sys
+import tracemalloc
+
+
+def deep_sizeof(obj, seen=None):
+    '''
+    Approximates the number of bytes used by an object and everything it
+    owns. Objects from discord.py (users, channels, the client) and asyncio
+    tasks are shared with the rest of the bot, so they are not counted
+    obj: object to measure
+    seen: set of IDs of objects that were already counted
+    Return: int, representing the approximate size in bytes
+    '''
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or _is_shared(obj):
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float, bool)) or obj is None:
+        # nothing else owned
+        return size
+
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_sizeof(key, seen) + deep_sizeof(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += deep_sizeof(item, seen)
+
+    if hasattr(obj, '__dict__'):
+        size += deep_sizeof(vars(obj), seen)
+    for slot in getattr(type(obj), '__slots__', ()):
+        if hasattr(obj, slot):
+            size += deep_sizeof(getattr(obj, slot), seen)
+    return size
+
+def _is_shared(obj):
+    '''
+    Checks if the object is shared with the rest of the bot rather than
+    owned by whatever is being measured
+    '''
+    if isinstance(obj, (type, asyncio.Future)):
+        return True
+    module = type(obj).__module__
+    return module == 'discord' or module.startswith('discord.')
+
+def rss_bytes():
+    '''
+    Gets the memory the process is using (resident set size)
+    Return: int, representing the number of bytes
+    '''
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        # not Linux; peak usage is the best available (KB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+def count_objects(bases):
+    '''
+    Counts the live objects that are instances of the given classes
+    (including their subclasses), grouped by their actual class
+    bases: tuple of classes to count
+    Return: collections.Counter of class name to number of objects
+    '''
+    counts = Counter()
+    for obj in gc.get_objects():
+        if isinstance(obj, bases):
+            counts[type(obj).__name__] += 1
+    return counts
+
+def top_allocations(limit=10):
+    '''
+    Gets the lines of code that allocated the most memory that is still
+    in use, if tracemalloc is tracing
+    limit: int, representing the number of lines to get
+    Return: list of (str, int, int), representing the file:line, bytes, and
+    number of blocks, or None if tracemalloc is not tracing
+    '''
+    if not tracemalloc.is_tracing():
+        return None
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    top = []
+    for stat in snapshot.statistics('lineno')[:limit]:
+        frame = stat.traceback[0]
+        top.append((f"{os.path.basename(frame.filename)}:{frame.lineno}", stat.size, stat.count))
+    return top
@@ -0,0 +1,275 @@
+'''
+File: metrics.py
+Author: Gavin Vogt
+This program defines counters, gauges, and histograms for keeping track
+of what the bot is doing, and a small HTTP server that exposes them in
+the Prometheus text format
+'''
+
+# dependencies
+from aiohttp import web
+import bisect
+import math
+
+
+class Metric:
+    '''
+    Base class for a metric, which has one value per combination of labels.
+    The values can be kept by the metric, or read from a function whenever
+    the metric is scraped (for things the bot already keeps track of)
+    '''
+    TYPE = 'untyped'
+
+    def __init__(self, name, help_text, labels=(), function=None):
+        '''
+        Constructs the metric
+        name: str, representing the metric name (such as coup_commands_total)
+        help_text: str, describing what the metric measures
+        labels: tuple of str, representing the label names
+        function: function taking no arguments that returns the value (or a
+        dict of tuple of label values to value, if the metric has labels)
+        '''
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._function = function
+        self._values = {}   # maps tuple of label values to the value
+
+    def _key(self, label_values):
+        '''
+        Turns label values into the key for the value
+        '''
+        if len(label_values) != len(self.labels):
+            raise ValueError(f"{self.name} expects labels {self.labels}, got {label_values}")
+        return tuple(str(value) for value in label_values)
+
+    def samples(self):
+        '''
+        Gets every sample of the metric
+        Return: list of (str, tuple, float), representing the sample name
+        suffix, label pairs, and value
+        '''
+        if self._function is not None:
+            value = self._function()
+            if isinstance(value, dict):
+                self._values = {self._key(key): val for key, val in value.items()}
+            else:
+                self._values = {(): value}
+        return [('', tuple(zip(self.labels, key)), value)
+                for key, value in self._values.items()]
+
+    def render(self):
+        '''
+        Gets the metric in the Prometheus text format
+        Return: list of str, representing the lines
+        '''
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.TYPE}"]
+        for suffix, label_pairs, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(label_pairs)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    '''
+    A value that only goes up, such as the number of commands run
+    '''
+    TYPE = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        '''
+        Increases the counter
+        label_values: values for each of the labels, in order
+        amount: number to increase by
+        '''
+        key = self._key(label_values)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, *label_values):
+        '''
+        Gets the current value of the counter
+        '''
+        return self._values.get(self._key(label_values), 0)
+
+
+class Gauge(Metric):
+    '''
+    A value that goes up and down, such as the number of games
+    '''
+    TYPE = 'gauge'
+
+    def set(self, value, *label_values):
+        '''
+        Sets the value of the gauge
+        value: number to set the gauge to
+        label_values: values for each of the labels, in order
+        '''
+        self._values[self._key(label_values)] = value
+
+
+class Histogram(Metric):
+    '''
+    Counts of how many observations fell in each bucket, such as how
+    long commands took to run
+    '''
+    TYPE = 'histogram'
+    BUCKETS_DEFAULT = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, help_text, labels=(), buckets=BUCKETS_DEFAULT):
+        '''
+        Constructs the histogram
+        buckets: tuple of float, representing the upper bounds of the buckets
+        '''
+        super().__init__(name, help_text, labels)
+        self._buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *label_values):
+        '''
+        Records an observation
+        value: number that was observed
+        label_values: values for each of the labels, in order
+        '''
+        key = self._key(label_values)
+        entry = self._values.get(key)
+        if entry is None:
+            # [count per bucket (and +Inf), sum]
+            entry = self._values[key] = [[0] * (len(self._buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self._buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self):
+        samples = []
+        for key, (counts, total) in self._values.items():
+            label_pairs = tuple(zip(self.labels, key))
+            running = 0
+            for bound, count in zip(self._buckets + (math.inf,), counts):
+                running += count
+                samples.append(('_bucket', label_pairs + (('le', _format_value(bound)),), running))
+            samples.append(('_sum', label_pairs, total))
+            samples.append(('_count', label_pairs, running))
+        return samples
+
+
+class MetricsRegistry:
+    '''
+    This class holds every metric the bot keeps track of
+
+    Useful methods:
+        - counter(name, help_text, labels, function)
+        - gauge(name, help_text, labels, function)
+        - histogram(name, help_text, labels, buckets)
+        - get(name)
+        - render()
+    '''
+    def __init__(self):
+        '''
+        Constructs an empty registry
+        '''
+        self._metrics = {}   # maps metric name to Metric
+
+    def counter(self, name, help_text, labels=(), function=None):
+        '''
+        Creates a Counter (or gets it, if it already exists)
+        '''
+        return self._add(Counter, name, help_text, labels, function=function)
+
+    def gauge(self, name, help_text, labels=(), function=None):
+        '''
+        Creates a Gauge (or gets it, if it already exists)
+        '''
+        return self._add(Gauge, name, help_text, labels, function=function)
+
+    def histogram(self, name, help_text, labels=(), buckets=Histogram.BUCKETS_DEFAULT):
+        '''
+        Creates a Histogram (or gets it, if it already exists)
+        '''
+        return self._add(Histogram, name, help_text, labels, buckets=buckets)
+
+    def get(self, name):
+        '''
+        Gets a metric by name
+        Return: Metric with the name, or None if there is none
+        '''
+        return self._metrics.get(name)
+
+    def render(self):
+        '''
+        Gets every metric in the Prometheus text format
+        Return: str, representing the metrics page
+        '''
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _add(self, cls, name, help_text, labels, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, help_text, labels, **kwargs)
+        elif not isinstance(metric, cls) or metric.labels != tuple(labels):
+            raise ValueError(f"Metric {name} already exists with a different type or labels")
+        return metric
+
+
+class MetricsServer:
+    '''
+    This class serves the metrics in a registry over HTTP at /metrics
+    '''
+    def __init__(self, registry, host='127.0.0.1', port=9108):
+        '''
+        Constructs the server
+        registry: MetricsRegistry to serve
+        host: str, representing the address to listen on (local only by default)
+        port: int, representing the port to listen on
+        '''
+        self._registry = registry
+        self._host = host
+        self._port = port
+        self._runner = None
+
+    async def start(self):
+        '''
+        Starts listening for requests
+        '''
+        if self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self._host, self._port)
+        await site.start()
+
+    async def stop(self):
+        '''
+        Stops listening for requests
+        '''
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_metrics(self, request):
+        return web.Response(text=self._registry.render(),
+                            content_type='text/plain', charset='utf-8')
+
+
+def _format_labels(label_pairs):
+    '''
+    Formats label pairs like {name="value",...}
+    '''
+    if not label_pairs:
+        return ''
+    escaped = (
+        (name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in label_pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+def _format_value(value):
+    '''
+    Formats a number the way Prometheus expects
+    '''
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
@@ -0,0 +1,297 @@
+'''
+File: outbound.py
+Author: Gavin Vogt
+This program defines the OutboundScheduler class, which sends the bot's
+messages in order of importance while staying under Discord's rate limits
+'''
+
+# dependencies
+from discord.abc import User
+from functools import partial
+import asyncio
+import heapq
+import itertools
+import time
+import traceback
+
+# my code
+from helpers.spans import current_span
+
+
+class OutboundScheduler:
+    '''
+    This class queues every message the bot sends, and sends them per
+    destination (channel, DM, or edits in a channel) without going over
+    the destination's rate limit. Rate limits are tracked locally with a
+    token bucket, so messages wait in the queue (where they can be
+    reordered, merged, or dropped) instead of inside discord.py.
+
+    Priorities:
+        - CRITICAL: game prompts, and DMs with cards
+        - NORMAL: results of commands
+        - INFO: summaries and other informational messages. These are not
+          waited on, are dropped if they sit in the queue for too long, and
+          replace any queued message with the same `merge_key`
+
+    Useful methods:
+        - send(destination, content, *, embed, priority, merge_key)
+        - edit(message, *, content, embed, priority, merge_key)
+        - queued_count()
+        - set_rate(rate, per)
+    '''
+
+    CRITICAL = 0
+    NORMAL = 1
+    INFO = 2
+
+    RATE_DEFAULT = 5            # messages allowed per destination ...
+    PER_DEFAULT = 5.0           # ... in this many seconds
+    STALE_AFTER_DEFAULT = 10.0  # seconds before a queued INFO message is dropped
+
+    def __init__(self, *, rate=None, per=None, stale_after=None, on_error=None):
+        '''
+        Constructs the scheduler
+        rate: int, representing messages allowed per destination every `per` seconds
+        per: float, representing the seconds it takes for the rate to reset
+        stale_after: float, representing seconds before queued INFO messages are dropped
+        on_error: function taking the exception, called when a message nobody
+        is waiting on fails to send (prints the traceback if None)
+        '''
+        self._rate = rate or self.RATE_DEFAULT
+        self._per = per or self.PER_DEFAULT
+        self._stale_after = stale_after or self.STALE_AFTER_DEFAULT
+        self._on_error = on_error
+        self._routes = {}              # maps route key to _Route
+        self._order = itertools.count()  # tie breaker keeping equal priorities in order
+
+        # Running totals of what happened to outgoing messages
+        self.counts = {
+            'sent': 0,               # messages sent to channels
+            'dm': 0,                 # messages sent to users
+            'edited': 0,             # messages edited
+            'merged': 0,             # messages replaced by a newer one with the same merge_key
+            'dropped': 0,            # INFO messages that went stale
+            'rate_limit_waits': 0,   # times a route had to wait for its rate limit
+        }
+        self.rate_limit_wait_time = 0.0  # total seconds spent waiting on rate limits
+
+    async def send(self, destination, content=None, *, embed=None, priority=NORMAL, merge_key=None):
+        '''
+        Queues a message to be sent
+        destination: discord.abc.Messageable (channel or user) to send to
+        content: str, representing the message text
+        embed: discord.Embed to send
+        priority: int, representing the priority (CRITICAL, NORMAL, or INFO)
+        merge_key: hashable key; a queued message with the same key is replaced
+        Return: discord.Message that was sent, or None for INFO messages
+        (which are not waited on) and messages that were merged away
+        '''
+        if isinstance(destination, User):
+            key = ('dm', destination.id)
+            kind = 'dm'
+        else:
+            key = ('send', destination.id)
+            kind = 'sent'
+        perform = partial(destination.send, content, embed=embed)
+        return await self._schedule(key, kind, perform, priority, merge_key)
+
+    async def edit(self, message, *, content=None, embed=None, priority=INFO, merge_key=None):
+        '''
+        Queues an edit to a message the bot sent. Edits to the same message
+        are merged by default, since only the last one matters
+        message: discord.Message to edit
+        content: str, representing the new message text
+        embed: discord.Embed to show in the message
+        priority: int, representing the priority (CRITICAL, NORMAL, or INFO)
+        merge_key: hashable key; a queued message with the same key is replaced
+        Return: None (edits are done in the background)
+        '''
+        if merge_key is None:
+            merge_key = ('edit', message.id)
+        kwargs = {'embed': embed} if content is None else {'content': content, 'embed': embed}
+        perform = partial(message.edit, **kwargs)
+        key = ('edit', message.channel.id)
+        await self._schedule(key, 'edited', perform, priority, merge_key, wait=False)
+
+    def queued_count(self):
+        '''
+        Gets the number of messages waiting to be sent
+        '''
+        return sum(len(route.queue) for route in self._routes.values())
+
+    def set_rate(self, rate, per):
+        '''
+        Changes the rate limit of every destination, such as for a load
+        test against a fake Discord without Discord's limits
+        rate: int, representing messages allowed per destination every `per` seconds
+        per: float, representing the seconds it takes for the rate to reset
+        '''
+        self._rate = rate
+        self._per = per
+
+    async def drain(self, timeout=None):
+        '''
+        Waits until all queued messages are sent (or dropped), including
+        the ones being sent right now
+        timeout: float, representing the max seconds to wait
+        Return: bool, representing whether everything was sent
+        '''
+        loop = asyncio.get_event_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while self.queued_count() > 0 or self._is_sending():
+            if deadline is not None and loop.time() >= deadline:
+                return False
+            await asyncio.sleep(0.05)
+        return True
+
+    def _is_sending(self):
+        '''
+        Checks if any route is still working through its queue (a message
+        is taken off the queue before it is sent)
+        '''
+        return any(route.worker is not None for route in self._routes.values())
+
+    async def _schedule(self, key, kind, perform, priority, merge_key, wait=None):
+        '''
+        Adds a message to the queue for its route and starts the route's
+        worker if it is not already running
+        '''
+        route = self._routes.get(key)
+        if route is None:
+            route = self._routes[key] = _Route(self._rate)
+        if wait is None:
+            # only wait on messages that matter
+            wait = (priority != self.INFO)
+
+        item = _Outbound(kind, perform, priority, merge_key,
+                         asyncio.get_event_loop().create_future() if wait else None)
+        if merge_key is not None:
+            old_item = route.merging.pop(merge_key, None)
+            if old_item is not None:
+                # newer message replaces the one still waiting
+                old_item.finish(None)
+                self.counts['merged'] += 1
+            route.merging[merge_key] = item
+        heapq.heappush(route.queue, (priority, next(self._order), item))
+
+        if route.worker is None:
+            route.worker = asyncio.get_event_loop().create_task(self._run_route(key, route))
+        if wait:
+            return await item.future
+        return None
+
+    async def _run_route(self, key, route):
+        '''
+        Sends the queued messages for a route in priority order, waiting
+        whenever the route's rate limit is used up
+        '''
+        try:
+            while route.queue:
+                delay = route.take_delay(self._rate, self._per)
+                if delay > 0:
+                    # rate limited; wait, then check again in case the queue changed
+                    self.counts['rate_limit_waits'] += 1
+                    self.rate_limit_wait_time += delay
+                    await asyncio.sleep(delay)
+                    continue
+
+                priority, _, item = heapq.heappop(route.queue)
+                if item.done:
+                    # merged away
+                    continue
+                if item.merge_key is not None and route.merging.get(item.merge_key) is item:
+                    del route.merging[item.merge_key]
+                if priority == self.INFO and time.monotonic() - item.created > self._stale_after:
+                    self.counts['dropped'] += 1
+                    item.finish(None)
+                    continue
+
+                route.tokens -= 1
+                sent_at = time.perf_counter()
+                try:
+                    result = await item.perform()
+                except Exception as e:
+                    item.fail(e, self._on_error)
+                else:
+                    self.counts[item.kind] += 1
+                    item.finish(result)
+                if item.span is not None:
+                    # time spent queued, then on the REST call, as part of whatever sent it
+                    item.span.record('outbound_queue', item.enqueued, sent_at, kind=item.kind)
+                    item.span.record('rest', sent_at, time.perf_counter(), kind=item.kind)
+        finally:
+            route.worker = None
+            # Forget the route once its rate limit has fully reset
+            asyncio.get_event_loop().call_later(self._per, self._forget_route, key, route)
+
+    def _forget_route(self, key, route):
+        '''
+        Removes an idle route so idle destinations take no memory
+        '''
+        if route.worker is None and not route.queue and self._routes.get(key) is route:
+            del self._routes[key]
+
+
+class _Route:
+    '''
+    Queue and rate limit bucket for one destination
+    '''
+    def __init__(self, rate):
+        self.queue = []          # heap of (priority, order, _Outbound)
+        self.merging = {}        # maps merge_key to the queued _Outbound
+        self.worker = None       # asyncio.Task sending the queue
+        self.tokens = rate       # messages that can be sent right now
+        self.updated = time.monotonic()
+
+    def take_delay(self, rate, per):
+        '''
+        Refills the bucket for the time passed, and gets how many seconds
+        to wait before a message can be sent (0 if one can be sent now)
+        '''
+        now = time.monotonic()
+        self.tokens = min(rate, self.tokens + (now - self.updated) * rate / per)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) * per / rate
+
+
+class _Outbound:
+    '''
+    A message waiting to be sent
+    '''
+    def __init__(self, kind, perform, priority, merge_key, future):
+        self.kind = kind
+        self.perform = perform
+        self.priority = priority
+        self.merge_key = merge_key
+        self.future = future
+        self.created = time.monotonic()
+        self.done = False
+        self.span = current_span()   # span of whatever sent the message, if it is traced
+        self.enqueued = time.perf_counter()
+
+    def finish(self, result):
+        '''
+        Marks the message as done, giving the result to anyone waiting on it
+        '''
+        self.done = True
+        if self.future is not None and not self.future.done():
+            self.future.set_result(result)
+
+    def fail(self, error, on_error=None):
+        '''
+        Marks the message as failed, giving the error to anyone waiting on it
+        (or reporting it if nobody is waiting)
+        error: Exception raised sending the message
+        on_error: function taking the exception (prints the traceback if None)
+        '''
+        self.done = True
+        if self.future is not None:
+            if not self.future.done():
+                self.future.set_exception(error)
+        elif on_error is not None:
+            on_error(error)
+        else:
+            print("ERROR sending message in the background:")
+            traceback.print_exception(type(error), error, error.__traceback__)
@@ -0,0 +1,152 @@
+'''
+File: presence.py
+Author: Gavin Vogt
+This program defines the PresenceManager class, which keeps the bot's
+status ("playing N games") up to date without flooding the gateway
+'''
+
+# dependencies
+from discord import Game
+import asyncio
+import logging
+import time
+
+
+logger = logging.getLogger('coup.presence')
+
+
+class PresenceManager:
+    '''
+    This class updates the bot's presence only when the text it would show
+    changes. Changes are debounced, so a burst of games starting or ending
+    becomes a single update with the final count, and updates are kept
+    under the gateway's presence rate limit. Each shard has its own
+    presence and rate limit (use shard ID None for a bot without shards).
+
+    Useful methods:
+        - changed(shard_id)
+        - invalidate(shard_id)
+        - stop()
+    '''
+
+    DEBOUNCE_DEFAULT = 5.0   # seconds to wait for more changes before updating
+    RATE_DEFAULT = 5         # presence updates allowed per shard ...
+    PER_DEFAULT = 60.0       # ... in this many seconds
+
+    def __init__(self, bot, describe, *, debounce=None, rate=None, per=None):
+        '''
+        Constructs the manager
+        bot: discord.Client whose presence is updated
+        describe: function taking the shard ID, returning the str to show as
+        the game being played (read when the update is sent)
+        debounce: float, representing seconds to wait for more changes before updating
+        rate: int, representing presence updates allowed per shard every `per` seconds
+        per: float, representing the seconds it takes for the rate to reset
+        '''
+        self._bot = bot
+        self._describe = describe
+        self._debounce = self.DEBOUNCE_DEFAULT if debounce is None else debounce
+        self._rate = rate or self.RATE_DEFAULT
+        self._per = per or self.PER_DEFAULT
+        self._shards = {}   # maps shard ID to _ShardPresence
+
+        # Running totals of presence updates
+        self.counts = {
+            'requested': 0,   # times a change was reported
+            'sent': 0,        # presence updates sent to the gateway
+            'unchanged': 0,   # debounced updates skipped since the text was already shown
+            'failed': 0,      # updates that could not be sent (such as while disconnected)
+        }
+
+    def changed(self, shard_id=None):
+        '''
+        Reports that what the shard shows may have changed, so it is
+        updated once the debounce time passes (if the text is different)
+        shard_id: int, representing the shard (None for a bot without shards)
+        '''
+        self.counts['requested'] += 1
+        shard = self._shards.get(shard_id)
+        if shard is None:
+            shard = self._shards[shard_id] = _ShardPresence(self._rate)
+        shard.dirty = True
+        if shard.worker is None:
+            shard.worker = asyncio.get_event_loop().create_task(self._run_shard(shard_id, shard))
+
+    def invalidate(self, shard_id=None):
+        '''
+        Forgets what the shard is showing, such as after it connects with a
+        new session (which clears the presence), and updates it again
+        shard_id: int, representing the shard (None for a bot without shards)
+        '''
+        shard = self._shards.get(shard_id)
+        if shard is not None:
+            shard.shown = None
+        self.changed(shard_id)
+
+    def stop(self):
+        '''
+        Cancels any updates that are waiting to be sent
+        '''
+        for shard in self._shards.values():
+            if shard.worker is not None:
+                shard.worker.cancel()
+                shard.worker = None
+
+    async def _run_shard(self, shard_id, shard):
+        '''
+        Waits out the debounce time and the rate limit, then sends the
+        shard's presence if it is different from what is shown, until
+        there are no more changes
+        '''
+        try:
+            while shard.dirty:
+                await asyncio.sleep(self._debounce)
+                delay = shard.take_delay(self._rate, self._per)
+                while delay > 0:
+                    await asyncio.sleep(delay)
+                    delay = shard.take_delay(self._rate, self._per)
+
+                # changes from here on need another update
+                shard.dirty = False
+                text = self._describe(shard_id)
+                if text == shard.shown:
+                    # changes cancelled out, or were already shown
+                    self.counts['unchanged'] += 1
+                    continue
+                shard.tokens -= 1
+                kwargs = {} if shard_id is None else {'shard_id': shard_id}
+                try:
+                    await self._bot.change_presence(activity=Game(name=text), **kwargs)
+                except Exception as e:
+                    # not connected; the presence is sent again once the shard is ready
+                    self.counts['failed'] += 1
+                    logger.info("Could not update presence of shard %s: %r", shard_id, e)
+                    continue
+                shard.shown = text
+                self.counts['sent'] += 1
+        finally:
+            shard.worker = None
+
+
+class _ShardPresence:
+    '''
+    What one shard is showing, and its rate limit bucket
+    '''
+    def __init__(self, rate):
+        self.shown = None        # text the shard is showing (None if unknown)
+        self.dirty = False       # whether the text may have changed since it was last read
+        self.worker = None       # asyncio.Task waiting to send an update
+        self.tokens = rate       # updates that can be sent right now
+        self.updated = time.monotonic()
+
+    def take_delay(self, rate, per):
+        '''
+        Refills the bucket for the time passed, and gets how many seconds
+        to wait before an update can be sent (0 if one can be sent now)
+        '''
+        now = time.monotonic()
+        self.tokens = min(rate, self.tokens + (now - self.updated) * rate / per)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) * per / rate
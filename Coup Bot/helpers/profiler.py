@@ -0,0 +1,217 @@
+'''
+File: profiler.py
+Author: Gavin Vogt
+This program defines profilers that can be turned on while the bot is
+running, to find out where the event loop spends its time
+'''
+
+# dependencies
+from collections import Counter
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+
+
+# functions the loop is in while it waits for something to do
+IDLE_FUNCTIONS = {('selectors.py', 'select'), ('selectors.py', 'poll')}
+IDLE_BUILTINS = ('select.epoll', 'select.poll', 'select.kqueue', 'select.devpoll', 'built-in method select.select')
+
+
+class Profiler:
+    '''
+    Base class for a profiler of the event loop thread. Profilers must be
+    started and stopped from the loop's thread
+
+    Useful methods:
+        - start()
+        - stop()
+        - report(limit)
+        - save(directory)
+    '''
+    KIND = 'profile'
+    EXTENSION = '.txt'
+
+    def __init__(self):
+        self._started_at = None
+        self._stopped_at = None
+
+    def start(self):
+        '''
+        Starts profiling
+        '''
+        self._started_at = time.time()
+
+    def stop(self):
+        '''
+        Stops profiling
+        '''
+        self._stopped_at = time.time()
+
+    def duration(self):
+        '''
+        Gets how many seconds were profiled
+        '''
+        end = time.time() if self._stopped_at is None else self._stopped_at
+        return 0.0 if self._started_at is None else end - self._started_at
+
+    def report(self, limit=15):
+        '''
+        Gets the functions that took the most time
+        limit: int, representing the number of functions to include
+        Return: str, representing the ranked report
+        '''
+        raise NotImplementedError
+
+    def save(self, directory):
+        '''
+        Writes the raw profile to a file in the directory
+        directory: str, representing the directory to write to
+        Return: str, representing the path of the file
+        '''
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self._started_at))
+        path = os.path.join(directory, f"{self.KIND}-{stamp}{self.EXTENSION}")
+        self._write(path)
+        return path
+
+    def _write(self, path):
+        raise NotImplementedError
+
+
+class DeterministicProfiler(Profiler):
+    '''
+    Profiles every function call with cProfile. Gives exact call counts
+    and times, but slows the bot down while it runs
+    '''
+    KIND = 'deterministic'
+    EXTENSION = '.prof'
+
+    def __init__(self):
+        super().__init__()
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        super().start()
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+        super().stop()
+
+    def report(self, limit=15):
+        stats = pstats.Stats(self._profile).stats
+        idle = sum(entry[2] for func, entry in stats.items() if _is_idle(*func))
+        busy = [item for item in stats.items() if not _is_idle(*item[0])]
+        ranked = sorted(busy, key=lambda item: item[1][2], reverse=True)[:limit]
+        lines = [f"Loop idle {idle:.3f} of {self.duration():.3f} seconds",
+                 f"{'own s':>8} {'total s':>8} {'calls':>8}  function"]
+        for (filename, line, func), (_, calls, own, total, _) in ranked:
+            lines.append(f"{own:8.3f} {total:8.3f} {calls:8d}  {_function_name(filename, line, func)}")
+        return "\n".join(lines)
+
+    def _write(self, path):
+        self._profile.dump_stats(path)
+
+
+class SamplingProfiler(Profiler):
+    '''
+    Profiles by looking at the event loop thread's stack on a background
+    thread every few milliseconds. Barely slows the bot down, so it is
+    safe to leave on under real traffic
+    '''
+    KIND = 'sampling'
+    EXTENSION = '.folded'
+    INTERVAL_DEFAULT = 0.005   # seconds between samples
+    MAX_DEPTH = 64             # deepest stack frames kept per sample
+
+    def __init__(self, interval=None):
+        '''
+        Constructs the profiler
+        interval: float, representing seconds between samples
+        '''
+        super().__init__()
+        self._interval = interval or self.INTERVAL_DEFAULT
+        self._stacks = Counter()   # maps tuple of (filename, line, function), outermost first, to samples
+        self._idle = 0             # samples where the loop was waiting for something to do
+        self._thread_id = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        super().start()
+        self._thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._sample, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        super().stop()
+
+    def report(self, limit=15):
+        busy = sum(self._stacks.values())
+        total_samples = busy + self._idle
+        if busy == 0:
+            return f"No busy samples ({self._idle} idle)"
+
+        own = Counter()
+        total = Counter()
+        for stack, count in self._stacks.items():
+            own[stack[-1]] += count
+            for func in set(stack):
+                total[func] += count
+
+        lines = [f"{busy} busy samples, loop idle {100 * self._idle / total_samples:.1f}% of the time",
+                 f"{'own %':>7} {'total %':>7}  function"]
+        for func, count in own.most_common(limit):
+            lines.append(f"{100 * count / busy:7.1f} {100 * total[func] / busy:7.1f}  {_function_name(*func)}")
+        return "\n".join(lines)
+
+    def _write(self, path):
+        # collapsed stacks, as used by flame graph tools
+        with open(path, 'w', encoding='utf-8') as file:
+            for stack, count in self._stacks.items():
+                file.write(";".join(_function_name(*func) for func in stack) + f" {count}\n")
+
+    def _sample(self):
+        '''
+        Runs on the sampling thread, recording the loop thread's stack
+        '''
+        while not self._stopped.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is None:
+                continue
+            code = frame.f_code
+            if _is_idle(code.co_filename, code.co_firstlineno, code.co_name):
+                self._idle += 1
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.MAX_DEPTH:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            self._stacks[tuple(reversed(stack))] += 1
+
+
+def _is_idle(filename, line, func):
+    '''
+    Checks if a function is the loop waiting for something to do
+    '''
+    if filename == '~':
+        return any(name in func for name in IDLE_BUILTINS)
+    return (os.path.basename(filename), func) in IDLE_FUNCTIONS
+
+def _function_name(filename, line, func):
+    '''
+    Formats a function as name (file:line), without the directories
+    '''
+    if filename == '~':
+        # built-in function
+        return func
+    return f"{func} ({os.path.basename(filename)}:{line})"
@@ -0,0 +1,230 @@
+'''
+File: spans.py
+Author: Gavin Vogt
+This program defines timing spans, which break down how long each part
+of a command took (waiting for the channel, checks, the handler, and
+each message sent) so slow commands can be explained
+'''
+
+# dependencies
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+import itertools
+import json
+import logging
+import random
+import time
+
+
+logger = logging.getLogger('coup.spans')
+
+SAMPLE_RATE_DEFAULT = 0.01   # fraction of traces that are written out ...
+SLOW_DEFAULT = 0.5           # ... plus every trace taking at least this many seconds
+
+_current = ContextVar('current_span', default=None)
+_trace_ids = itertools.count(1)
+_sample_rate = SAMPLE_RATE_DEFAULT
+_slow = SLOW_DEFAULT
+
+
+class Span:
+    '''
+    This class represents one timed part of a trace. Spans only exist
+    under a root span (such as one command), and the whole trace is
+    written out when the root finishes, if it is sampled or slow
+    '''
+    __slots__ = ('name', 'attrs', 'parent', 'root', 'children', 'start', 'end', 'trace_id')
+
+    def __init__(self, name, parent, attrs, start=None):
+        '''
+        Constructs a running span
+        name: str, representing what the span is timing
+        parent: Span that this is part of (None for a root span)
+        attrs: dict of extra values describing the span
+        start: float, representing the perf_counter() start time (now if None)
+        '''
+        self.name = name
+        self.attrs = attrs
+        self.parent = parent
+        self.root = self if parent is None else parent.root
+        self.children = []
+        self.start = time.perf_counter() if start is None else start
+        self.end = None
+        self.trace_id = next(_trace_ids) if parent is None else parent.trace_id
+        if parent is not None:
+            parent.children.append(self)
+
+    @property
+    def duration(self):
+        '''
+        Seconds the span took (so far, if it is still running)
+        '''
+        return (time.perf_counter() if self.end is None else self.end) - self.start
+
+    def is_recording(self):
+        '''
+        Checks if spans can still be added to this span's trace
+        '''
+        return self.root.end is None
+
+    def record(self, name, start, end, **attrs):
+        '''
+        Adds a child span that was timed separately
+        name: str, representing what the span timed
+        start: float, representing the perf_counter() start time
+        end: float, representing the perf_counter() end time
+        Return: Span that was added, or None if the trace already finished
+        '''
+        if not self.is_recording():
+            return None
+        child = Span(name, self, attrs, start)
+        child.end = end
+        return child
+
+    def finish(self):
+        '''
+        Ends the span, and writes out the trace if this was the root
+        '''
+        if self.end is not None:
+            return
+        self.end = time.perf_counter()
+        if _current.get() is self:
+            _current.set(self.parent)
+        if self.parent is None:
+            _export(self)
+
+    def to_dict(self, trace_start):
+        '''
+        Gets the span and its children as plain values
+        trace_start: float, representing the perf_counter() start of the trace
+        '''
+        span_dict = {
+            'name': self.name,
+            'offset_ms': round((self.start - trace_start) * 1000, 3),
+            'duration_ms': round(self.duration * 1000, 3),
+        }
+        if self.end is None:
+            span_dict['unfinished'] = True
+        if self.attrs:
+            span_dict['attrs'] = self.attrs
+        if self.children:
+            span_dict['children'] = [child.to_dict(trace_start) for child in self.children]
+        return span_dict
+
+
+def configure(*, sample_rate=None, slow=None):
+    '''
+    Sets which traces are written out
+    sample_rate: float, representing the fraction of traces to write out
+    slow: float, representing seconds that make a trace always written out
+    '''
+    global _sample_rate, _slow
+    if sample_rate is not None:
+        _sample_rate = sample_rate
+    if slow is not None:
+        _slow = slow
+
+def current_span():
+    '''
+    Gets the span currently running in this task
+    Return: Span, or None if nothing is being traced
+    '''
+    span = _current.get()
+    if span is not None and not span.is_recording():
+        # left over from a trace that already finished
+        return None
+    return span
+
+@contextmanager
+def root(name, **attrs):
+    '''
+    Starts a new trace, timing the code in the `with` block
+    name: str, representing what is being traced (such as "command")
+    attrs: extra values describing the trace
+    '''
+    span = Span(name, None, attrs)
+    token = _current.set(span)
+    try:
+        yield span
+    finally:
+        _current.reset(token)
+        span.finish()
+
+@contextmanager
+def span(name, **attrs):
+    '''
+    Times the code in the `with` block as part of the current trace
+    (does nothing if there is no trace)
+    name: str, representing what is being timed
+    attrs: extra values describing the span
+    '''
+    parent = current_span()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent, attrs)
+    token = _current.set(child)
+    try:
+        yield child
+    finally:
+        _current.reset(token)
+        child.end = time.perf_counter()
+
+def start_span(name, **attrs):
+    '''
+    Starts timing a span that is finished later with its finish() method,
+    for spans that start and end in different functions. Spans started
+    after this one are part of it until it finishes
+    name: str, representing what is being timed
+    attrs: extra values describing the span
+    Return: Span, or None if there is no trace
+    '''
+    parent = current_span()
+    if parent is None:
+        return None
+    child = Span(name, parent, attrs)
+    _current.set(child)
+    return child
+
+def traced(name):
+    '''
+    Decorator that times every call of an async function as a span
+    name: str, representing what is being timed
+    '''
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def _export(root_span):
+    '''
+    Writes out a finished trace if it was sampled or slow
+    '''
+    duration = root_span.duration
+    if duration < _slow and random.random() >= _sample_rate:
+        return
+    trace = {
+        'trace_id': root_span.trace_id,
+        'time': time.time() - duration,
+        'slow': duration >= _slow,
+        **root_span.to_dict(root_span.start),
+    }
+    logger.info("%s", _JsonTrace(trace))
+
+
+class _JsonTrace:
+    '''
+    Log message argument that is only turned into JSON when the
+    logging thread formats the record
+    '''
+    __slots__ = ('_trace',)
+
+    def __init__(self, trace):
+        self._trace = trace
+
+    def __str__(self):
+        return json.dumps(self._trace, default=str)
@@ -0,0 +1,114 @@
+'''
+File: tracing.py
+Author: Gavin Vogt
+This program defines the Tracer class, which records what happens in
+a game for debugging, only in the channels it is turned on for
+'''
+
+# dependencies
+from datetime import datetime
+import json
+import logging
+
+
+logger = logging.getLogger('coup.trace')
+
+
+class Tracer:
+    '''
+    This class records trace events (such as the game state before and
+    after each command) and writes them to the log as JSON. Tracing is
+    off unless it is turned on for a channel, and when it is off, a trace
+    call does nothing: game snapshots are passed in as functions and only
+    built when the event is actually recorded, and the JSON is only
+    written out by the logging thread.
+
+    Useful methods:
+        - enable(channel_id=None)
+        - disable(channel_id=None)
+        - is_enabled(channel_id)
+        - event(channel_id, name, snapshot=None, *, force=False, **fields)
+    '''
+    def __init__(self):
+        '''
+        Constructs a tracer with tracing turned off everywhere
+        '''
+        self._channels = set()   # IDs of channels being traced
+        self._all = False        # whether every channel is being traced
+
+    def enable(self, channel_id=None):
+        '''
+        Turns on tracing
+        channel_id: int, representing the channel to trace (None for every channel)
+        '''
+        if channel_id is None:
+            self._all = True
+        else:
+            self._channels.add(channel_id)
+
+    def disable(self, channel_id=None):
+        '''
+        Turns off tracing
+        channel_id: int, representing the channel to stop tracing (None for every channel)
+        '''
+        if channel_id is None:
+            self._all = False
+            self._channels.clear()
+        else:
+            self._channels.discard(channel_id)
+
+    def is_enabled(self, channel_id):
+        '''
+        Checks if tracing is on for the channel
+        channel_id: int, representing the ID of the channel
+        '''
+        return self._all or channel_id in self._channels
+
+    def traced_channels(self):
+        '''
+        Gets the IDs of the channels being traced
+        Return: set of channel IDs, or None if every channel is traced
+        '''
+        return None if self._all else set(self._channels)
+
+    def event(self, channel_id, name, snapshot=None, *, force=False, **fields):
+        '''
+        Records a trace event if tracing is on for the channel
+        channel_id: int, representing the ID of the channel
+        name: str, representing what happened
+        snapshot: function taking no arguments that returns a dict describing
+        the state (only called if the event is recorded)
+        force: bool, representing whether to record the event even if tracing is off
+        fields: extra values to record with the event
+        Return: bool, representing whether the event was recorded
+        '''
+        if not (force or self._all or channel_id in self._channels):
+            return False
+        if not logger.isEnabledFor(logging.INFO):
+            return False
+
+        record = {
+            'time': datetime.utcnow().isoformat(),
+            'event': name,
+            'channel': channel_id,
+            **fields,
+        }
+        if snapshot is not None:
+            # built now, since the game keeps changing after this
+            record['state'] = snapshot()
+        logger.info("%s", _JsonMessage(record))
+        return True
+
+
+class _JsonMessage:
+    '''
+    Log message argument that is only turned into JSON when the
+    logging thread formats the record
+    '''
+    __slots__ = ('_record',)
+
+    def __init__(self, record):
+        self._record = record
+
+    def __str__(self):
+        return json.dumps(self._record, default=str)
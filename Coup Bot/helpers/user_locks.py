@@ -0,0 +1,313 @@
+'''
+File: user_locks.py
+Author: Gavin Vogt
+This program defines the user lock backends, which enforce that a user can
+only be in one game at a time, even when games are spread across processes
+'''
+
+# dependencies
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import time
+
+
+logger = logging.getLogger('coup.user_locks')
+
+
+class UserLocksUnavailable(Exception):
+    '''
+    Raised when a user cannot be locked because the shared backend cannot
+    be reached, so it is unknown whether they are in a game elsewhere
+    '''
+
+
+class UserLocks:
+    '''
+    Base class for a user lock backend. A user is locked while they are
+    in a game, and only one process can hold a user's lock at a time.
+
+    The users this process holds are cached locally, so checking them never
+    leaves the process; only acquiring and releasing go to the backend.
+    Shared backends hold each lock as a lease that is renewed while the
+    process is running, so locks held by a process that dies or hangs
+    expire on their own. If a shared backend cannot be reached, acquiring
+    raises UserLocksUnavailable rather than risk letting a user into a
+    second game; users already held keep playing.
+
+    Useful methods:
+        - start()
+        - acquire(user_id)
+        - release(user_id)
+        - is_held(user_id)
+        - held_count()
+        - close()
+    '''
+
+    LEASE_DEFAULT = 60.0   # seconds a lock lasts without being renewed
+
+    def __init__(self, *, lease=None):
+        '''
+        Constructs the locks
+        lease: float, representing seconds a lock lasts without being renewed
+        '''
+        self._lease = lease or self.LEASE_DEFAULT
+        self._held = set()        # user IDs this process holds
+        self._acquiring = set()   # user IDs being acquired right now
+        self._renewer = None      # asyncio.Task renewing the leases
+
+    async def start(self):
+        '''
+        Connects to the backend, and starts renewing the held leases
+        '''
+        self._renewer = asyncio.get_event_loop().create_task(self._renew_forever())
+
+    async def close(self):
+        '''
+        Stops renewing the leases and disconnects from the backend
+        '''
+        if self._renewer is not None:
+            self._renewer.cancel()
+            self._renewer = None
+
+    async def acquire(self, user_id):
+        '''
+        Locks a user for a game, unless they are already in one
+        user_id: int, representing the user ID
+        Return: bool, representing whether the lock was acquired (False if
+        the user is already in a game, on this process or another one)
+        Raises UserLocksUnavailable if the backend cannot be reached
+        '''
+        if user_id in self._held or user_id in self._acquiring:
+            return False
+        self._acquiring.add(user_id)
+        try:
+            acquired = await self._acquire(user_id)
+        finally:
+            self._acquiring.discard(user_id)
+        if acquired:
+            self._held.add(user_id)
+        return acquired
+
+    def release(self, user_id):
+        '''
+        Unlocks a user once they leave their game. Shared backends release
+        in the background; a later acquire (from any process) sees it
+        user_id: int, representing the user ID
+        '''
+        if user_id in self._held:
+            self._held.discard(user_id)
+            self._release(user_id)
+
+    def hold(self, user_id):
+        '''
+        Marks a user as held by this process without checking the backend
+        user_id: int, representing the user ID
+        '''
+        self._held.add(user_id)
+
+    def is_held(self, user_id):
+        '''
+        Checks if this process holds a user's lock (does not check other processes)
+        user_id: int, representing the user ID
+        '''
+        return (user_id in self._held)
+
+    def held_count(self):
+        '''
+        Gets the number of users this process holds
+        '''
+        return len(self._held)
+
+    async def _acquire(self, user_id):
+        '''
+        Acquires the lock from the backend
+        Return: bool, representing whether it was acquired
+        '''
+        raise NotImplementedError
+
+    def _release(self, user_id):
+        '''
+        Releases the lock in the backend
+        '''
+        raise NotImplementedError
+
+    async def _renew(self):
+        '''
+        Extends the leases of every held user
+        '''
+
+    async def _renew_forever(self):
+        '''
+        Renews the leases a few times per lease, so one missed renewal
+        does not lose them
+        '''
+        while True:
+            await asyncio.sleep(self._lease / 3)
+            try:
+                await self._renew()
+            except Exception as e:
+                logger.warning("Could not renew user locks: %r", e)
+
+
+class LocalUserLocks(UserLocks):
+    '''
+    Locks kept in this process only, for a bot running as a single process
+    '''
+    async def start(self):
+        # nothing to renew
+        pass
+
+    async def _acquire(self, user_id):
+        return True
+
+    def _release(self, user_id):
+        pass
+
+
+class SqliteUserLocks(UserLocks):
+    '''
+    Locks kept in an SQLite database shared by every process on the
+    machine. Each acquire is a single atomic upsert, which only takes the
+    row if it is free or its lease has expired. Queries run on a
+    background thread so a busy database never blocks the event loop
+    '''
+    BUSY_TIMEOUT = 5.0   # seconds to wait for another process's write to finish
+
+    def __init__(self, path, owner=None, *, lease=None):
+        '''
+        Constructs the locks (call start() to open the database)
+        path: str, representing the path of the database file
+        owner: str, representing a name for this process that stays the same
+        when it restarts (such as the worker number), so locks it held
+        before restarting are released
+        lease: float, representing seconds a lock lasts without being renewed
+        '''
+        super().__init__(lease=lease)
+        self.path = path
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='user-locks')
+        self._db = None
+
+    async def start(self):
+        await self._run(self._open)
+        await super().start()
+
+    async def close(self):
+        await super().close()
+        if self._db is not None:
+            await self._run(self._release_all)
+            await self._run(self._db.close)
+            self._db = None
+        self._executor.shutdown(wait=False)
+
+    async def _acquire(self, user_id):
+        try:
+            return await self._run(self._try_acquire, user_id)
+        except sqlite3.Error as e:
+            logger.warning("Could not acquire user %s from %s: %r", user_id, self.path, e)
+            raise UserLocksUnavailable(f"user lock database {self.path} is unavailable") from e
+
+    def _release(self, user_id):
+        future = asyncio.get_event_loop().run_in_executor(self._executor, self._delete, user_id)
+        future.add_done_callback(_log_failure)
+
+    async def _renew(self):
+        lost = await self._run(self._extend, set(self._held))
+        for user_id in lost:
+            logger.warning("Lease on user %s expired and was taken by another process", user_id)
+
+    async def _run(self, function, *args):
+        '''
+        Runs a database function on the background thread
+        '''
+        return await asyncio.get_event_loop().run_in_executor(self._executor, function, *args)
+
+    # the functions below run on the background thread
+
+    def _open(self):
+        self._db = sqlite3.connect(self.path, timeout=self.BUSY_TIMEOUT,
+                                   isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS user_locks (
+            user_id INTEGER PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires REAL NOT NULL
+        )""")
+        # locks from before this process restarted
+        self._release_all()
+
+    def _try_acquire(self, user_id):
+        now = time.time()
+        cursor = self._db.execute("""
+            INSERT INTO user_locks (user_id, owner, expires) VALUES (?, ?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET owner = excluded.owner, expires = excluded.expires
+            WHERE user_locks.expires < ?""", (user_id, self.owner, now + self._lease, now))
+        return (cursor.rowcount == 1)
+
+    def _delete(self, user_id):
+        self._db.execute("DELETE FROM user_locks WHERE user_id = ? AND owner = ?", (user_id, self.owner))
+
+    def _release_all(self):
+        self._db.execute("DELETE FROM user_locks WHERE owner = ?", (self.owner,))
+
+    def _extend(self, held):
+        '''
+        Extends the leases of this process
+        held: set of int, representing the user IDs held
+        Return: set of int, representing held users whose lease was lost
+        '''
+        self._db.execute("UPDATE user_locks SET expires = ? WHERE owner = ?",
+                         (time.time() + self._lease, self.owner))
+        owned = {row[0] for row in self._db.execute("SELECT user_id FROM user_locks WHERE owner = ?",
+                                                    (self.owner,))}
+        return held - owned
+
+
+class ClusterUserLocks(UserLocks):
+    '''
+    Locks kept by the cluster supervisor (see cluster.py), which every
+    worker of the cluster is connected to
+    '''
+    def __init__(self, client, *, lease=None):
+        '''
+        Constructs the locks (call start() to connect to the supervisor)
+        client: ClusterClient connecting this worker to the supervisor
+        lease: float, representing seconds a lock lasts without being renewed
+        '''
+        super().__init__(lease=lease)
+        self.client = client
+
+    async def start(self):
+        # the supervisor is told which users are held whenever the worker (re)connects
+        await self.client.connect(hello=lambda: {'users': list(self._held), 'lease': self._lease})
+        await super().start()
+
+    async def close(self):
+        await super().close()
+        await self.client.close()
+
+    async def _acquire(self, user_id):
+        try:
+            reply = await self.client.request('claim', user=user_id, lease=self._lease)
+        except (ConnectionError, asyncio.TimeoutError) as e:
+            logger.warning("Could not reach the supervisor to claim user %s: %r", user_id, e)
+            raise UserLocksUnavailable("cluster supervisor is unreachable") from e
+        return reply['ok']
+
+    def _release(self, user_id):
+        self.client.send('release', user=user_id)
+
+    async def _renew(self):
+        self.client.send('renew', users=list(self._held), lease=self._lease)
+
+
+def _log_failure(future):
+    '''
+    Logs the error of a background database query, if it failed
+    '''
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning("User lock query failed: %r", future.exception())
@@ -7,19 +7,14 @@ This program launches the Coup Bot
 # dependencies
 import discord
 import os
+import sys
 from dotenv import load_dotenv
-import logging
 
 # my code
 from coup_bot import CoupBot
-
-
-# Set up logging
-logger = logging.getLogger('discord')
-logger.setLevel(logging.DEBUG)
-handler = logging.FileHandler(filename='discord_bot_log.log', encoding='utf-8', mode='w')
-handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
-logger.addHandler(handler)
+from helpers.logging_utils import start_logging, add_log_file, stop_logging
+from helpers.cluster_client import ClusterClient
+from helpers.user_locks import LocalUserLocks, SqliteUserLocks, ClusterUserLocks
 
 
 # Get the bot token
@@ -27,6 +22,36 @@ load_dotenv()
 TOKEN = os.getenv("DISCORD_TOKEN")
 
 
+# Set up logging (LOG_LEVELS is optional, such as "discord=DEBUG,coup=INFO")
+log_levels = dict(
+    entry.split('=', 1) for entry in os.getenv("LOG_LEVELS", "").split(',') if '=' in entry
+)
+# When run as a worker of a cluster (see cluster.py), each worker logs to its own files
+CLUSTER_SOCKET = os.getenv("CLUSTER_SOCKET")
+CLUSTER_WORKER = int(os.getenv("CLUSTER_WORKER", 0))
+log_suffix = f".{CLUSTER_WORKER}" if CLUSTER_SOCKET else ""
+start_logging(f'discord_bot_log{log_suffix}.log', levels=log_levels)
+add_log_file('coup.spans', f'command_spans{log_suffix}.jsonl')
+
+
+# Sharding (both optional): SHARD_COUNT is the total number of shards (Discord's
+# recommended count if not set), and SHARD_IDS the ones this process runs, such as "0,1"
+shard_count = int(os.environ["SHARD_COUNT"]) if os.getenv("SHARD_COUNT") else None
+shard_ids = [int(shard_id) for shard_id in os.getenv("SHARD_IDS", "").split(',') if shard_id.strip()] or None
+
+
+# Where users are locked while in a game (USER_LOCKS is optional): "local" for a
+# single process, "sqlite:PATH" for a database shared by every process on the
+# machine, or "cluster" for the cluster supervisor (the default for a worker)
+USER_LOCKS = os.getenv("USER_LOCKS", "cluster" if CLUSTER_SOCKET else "local")
+if USER_LOCKS == "cluster":
+    user_locks = ClusterUserLocks(ClusterClient(CLUSTER_SOCKET, CLUSTER_WORKER))
+elif USER_LOCKS.startswith("sqlite:"):
+    user_locks = SqliteUserLocks(USER_LOCKS[len("sqlite:"):], owner=f"worker-{CLUSTER_WORKER}" if CLUSTER_SOCKET else None)
+else:
+    user_locks = LocalUserLocks()
+
+
 # Set up the bot
 BOT_DESCRIPTION = f'''Discord Coup Bot {CoupBot.VERSION}
 Developed by Gavin Vogt
@@ -36,17 +61,20 @@ bot = CoupBot(
     command_prefix = PREFIX,
     #owner_id = YOUR_DISCORD_ID,
     description = BOT_DESCRIPTION,
+    metrics_port = int(os.getenv("METRICS_PORT", CoupBot.METRICS_PORT_DEFAULT)),
+    shard_count = shard_count,
+    shard_ids = shard_ids,
+    user_locks = user_locks,
+    snapshot_path = f'games_snapshot{log_suffix}.pickle',
+    resume = ("--resume" in sys.argv[1:]),
 )
 
 
-############################## INITIATING BOT LOG ON #################################
-
-@bot.event
-async def on_ready():
-    print(f"{bot.user} has successfully connected to Discord!")
-
-
 
 if __name__ == "__main__":
     # Run the bot
     bot.run(TOKEN, reconnect=True)
+    stop_logging()
+    if bot.restart_requested:
+        # Replace this process with the new version, which resumes the games
+        os.execv(sys.executable, [sys.executable, os.path.abspath(__file__), "--resume"])
@@ -0,0 +1,344 @@
+'''
+File: fake_discord.py
+Author: Gavin Vogt
+This program defines stand-ins for the Discord objects the bot uses (users,
+guilds, channels, messages, and command contexts), so the cogs can be
+driven offline at full speed by tests, benchmarks, and load generators
+'''
+
+# dependencies
+from discord.abc import User
+from discord.ext import commands
+import asyncio
+import itertools
+import re
+import weakref
+
+
+MENTION_PATTERN = re.compile(r'<@!?(\d+)>')
+
+_hubs = weakref.WeakValueDictionary()   # maps hub ID to FakeDiscord, for unpickling users
+_hub_ids = itertools.count(1)
+
+
+class FakeDiscord:
+    '''
+    This class is a stand-in for Discord. It creates fake guilds, channels,
+    and users, and keeps a log of every message the bot sends or edits.
+    Attaching it to a bot makes the bot look up channels and users here
+    instead of in its (empty) cache, so commands can be run through the
+    real command handling without connecting to anything.
+
+    Useful methods:
+        - add_guild(name, shard_id)
+        - add_channel(guild, name)
+        - add_user(name)
+        - attach(bot)
+        - make_message(author, channel, content)
+        - run_command(bot, author, channel, content)
+        - messages_to(destination)
+        - clear_log()
+    '''
+
+    FIRST_ID = 10 ** 17   # IDs look like Discord snowflakes, counting up from here
+
+    def __init__(self, *, owner_name="owner", send_delay=0.0, keep_log=True):
+        '''
+        Constructs an empty Discord
+        owner_name: str, representing the name of the user who owns the bot
+        send_delay: float, representing seconds every send or edit takes, to
+        stand in for the API's latency (0 to run at full speed)
+        keep_log: bool, representing whether to keep every message in the log
+        (they are counted either way; turn off for long load tests)
+        '''
+        self.send_delay = send_delay
+        self.keep_log = keep_log
+        self._ids = itertools.count(self.FIRST_ID)
+        self._hub_id = next(_hub_ids)
+        _hubs[self._hub_id] = self
+
+        self.guilds = {}     # maps guild ID to FakeGuild
+        self.channels = {}   # maps channel ID to FakeTextChannel or FakeDMChannel
+        self.users = {}      # maps user ID to FakeUser
+        self.log = []        # (kind, destination, FakeMessage) for every send and edit, in order
+        self.counts = {'sent': 0, 'dm': 0, 'edited': 0}
+
+        self.bot_user = self.add_user("Coup Bot", bot=True)
+        self.owner = self.add_user(owner_name)
+
+    def next_id(self):
+        '''
+        Gets a new unique ID
+        '''
+        return next(self._ids)
+
+    def add_guild(self, name="guild", shard_id=0):
+        '''
+        Creates a guild
+        name: str, representing the name of the guild
+        shard_id: int, representing the shard the guild is on
+        Return: FakeGuild that was created
+        '''
+        guild = FakeGuild(self, self.next_id(), name, shard_id)
+        self.guilds[guild.id] = guild
+        return guild
+
+    def add_channel(self, guild, name="coup"):
+        '''
+        Creates a text channel in a guild
+        guild: FakeGuild to create the channel in
+        name: str, representing the name of the channel
+        Return: FakeTextChannel that was created
+        '''
+        channel = FakeTextChannel(self, self.next_id(), name, guild)
+        guild.channels.append(channel)
+        self.channels[channel.id] = channel
+        return channel
+
+    def add_user(self, name="user", *, bot=False):
+        '''
+        Creates a user
+        name: str, representing the username
+        bot: bool, representing whether the user is a bot
+        Return: FakeUser that was created
+        '''
+        user = FakeUser(self, self.next_id(), name, bot=bot)
+        self.users[user.id] = user
+        return user
+
+    def attach(self, bot):
+        '''
+        Makes a bot use this Discord: it is logged in as `bot_user`, is owned
+        by `owner`, and finds the channels, users, and guilds created here
+        bot: commands.Bot to attach to
+        '''
+        bot._connection.user = self.bot_user
+        bot.owner_id = self.owner.id
+        bot.get_channel = self.channels.get
+        bot.get_user = self.users.get
+        bot.get_guild = self.guilds.get
+
+    def make_message(self, author, channel, content):
+        '''
+        Creates a message as if a user sent it (users mentioned in the
+        content are in its mentions)
+        author: FakeUser sending the message
+        channel: FakeTextChannel or FakeDMChannel the message is sent in
+        content: str, representing the message text
+        Return: FakeMessage
+        '''
+        mentions = []
+        for user_id in MENTION_PATTERN.findall(content):
+            user = self.users.get(int(user_id))
+            if user is not None and user not in mentions:
+                mentions.append(user)
+        return FakeMessage(self, self.next_id(), channel, author, content, mentions=mentions)
+
+    async def run_command(self, bot, author, channel, content):
+        '''
+        Sends a message to the bot and runs the command in it the way the
+        bot would (checks, the channel's queue, errors, and all)
+        bot: commands.Bot to run the command on (attached to this Discord)
+        author: FakeUser sending the command
+        channel: FakeTextChannel or FakeDMChannel the command is sent in
+        content: str, representing the message text, such as "c!join"
+        Return: FakeContext the command ran with
+        '''
+        message = self.make_message(author, channel, content)
+        ctx = await bot.get_context(message, cls=FakeContext)
+        await bot.invoke(ctx)
+        return ctx
+
+    def messages_to(self, destination):
+        '''
+        Gets the messages sent to a channel or user
+        destination: FakeTextChannel, FakeDMChannel, or FakeUser
+        Return: list of FakeMessage, oldest first
+        '''
+        if isinstance(destination, FakeUser):
+            destination = destination.dm_channel
+        return [message for kind, to, message in self.log if kind != 'edit' and to is destination]
+
+    def clear_log(self):
+        '''
+        Forgets the messages in the log (the counts are kept)
+        '''
+        self.log.clear()
+
+    async def _record(self, kind, destination, message):
+        '''
+        Records a message the bot sent or edited
+        kind: str, representing 'sent', 'dm', or 'edit'
+        destination: channel the message is in
+        message: FakeMessage that was sent or edited
+        '''
+        if self.send_delay:
+            await asyncio.sleep(self.send_delay)
+        self.counts['edited' if kind == 'edit' else kind] += 1
+        if self.keep_log:
+            self.log.append((kind, destination, message))
+
+
+class FakeUser(User):
+    '''
+    Stand-in for a discord.User. Messages sent to it go to its DM channel
+    '''
+    def __init__(self, hub, user_id, name, *, bot=False):
+        self._hub = hub
+        self.id = user_id
+        self.name = name
+        self.discriminator = f"{user_id % 10000:04}"
+        self.avatar = None
+        self.bot = bot
+        self.dm_channel = FakeDMChannel(hub, hub.next_id(), self)
+        hub.channels[self.dm_channel.id] = self.dm_channel
+
+    def __str__(self):
+        return f"{self.name}#{self.discriminator}"
+
+    def __repr__(self):
+        return f"<FakeUser id={self.id} name={self.name!r}>"
+
+    def __eq__(self, other):
+        return isinstance(other, User) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __reduce__(self):
+        # pickled as a reference, such as when games are handed off
+        return (_find_user, (self._hub._hub_id, self.id))
+
+    @property
+    def display_name(self):
+        return self.name
+
+    @property
+    def mention(self):
+        return f"<@{self.id}>"
+
+    @property
+    def avatar_url(self):
+        return f"https://cdn.discordapp.com/embed/avatars/{int(self.discriminator) % 5}.png"
+
+    async def create_dm(self):
+        return self.dm_channel
+
+    async def send(self, content=None, *, embed=None, **kwargs):
+        return await self.dm_channel.send(content, embed=embed, **kwargs)
+
+
+class FakeGuild:
+    '''
+    Stand-in for a discord.Guild
+    '''
+    def __init__(self, hub, guild_id, name, shard_id):
+        self._hub = hub
+        self.id = guild_id
+        self.name = name
+        self.shard_id = shard_id
+        self.channels = []   # FakeTextChannel in the guild
+
+    def __repr__(self):
+        return f"<FakeGuild id={self.id} name={self.name!r} shard_id={self.shard_id}>"
+
+    @property
+    def me(self):
+        return self._hub.bot_user
+
+
+class FakeTextChannel:
+    '''
+    Stand-in for a discord.TextChannel in a guild
+    '''
+    def __init__(self, hub, channel_id, name, guild):
+        self._hub = hub
+        self.id = channel_id
+        self.name = name
+        self.guild = guild
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f"<FakeTextChannel id={self.id} name={self.name!r}>"
+
+    @property
+    def mention(self):
+        return f"<#{self.id}>"
+
+    async def send(self, content=None, *, embed=None, **kwargs):
+        message = FakeMessage(self._hub, self._hub.next_id(), self, self._hub.bot_user,
+                              content, embed=embed)
+        await self._hub._record('sent', self, message)
+        return message
+
+
+class FakeDMChannel(FakeTextChannel):
+    '''
+    Stand-in for a discord.DMChannel with a user
+    '''
+    def __init__(self, hub, channel_id, recipient):
+        super().__init__(hub, channel_id, f"dm-{recipient.name}", None)
+        self.recipient = recipient
+
+    def __repr__(self):
+        return f"<FakeDMChannel id={self.id} recipient={self.recipient!r}>"
+
+    async def send(self, content=None, *, embed=None, **kwargs):
+        message = FakeMessage(self._hub, self._hub.next_id(), self, self._hub.bot_user,
+                              content, embed=embed)
+        await self._hub._record('dm', self, message)
+        return message
+
+
+class FakeMessage:
+    '''
+    Stand-in for a discord.Message. Edits change it in place, and the
+    earlier versions are kept in `history`
+    '''
+    _state = None   # commands.Context reads this, but nothing uses it
+
+    def __init__(self, hub, message_id, channel, author, content, *, embed=None, mentions=()):
+        self._hub = hub
+        self.id = message_id
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.content = content
+        self.embeds = [] if embed is None else [embed]
+        self.mentions = list(mentions)
+        self.history = []   # (content, embeds) before each edit
+
+    def __repr__(self):
+        return f"<FakeMessage id={self.id} author={self.author!r} content={self.content!r}>"
+
+    @property
+    def embed(self):
+        '''
+        Gives access to the message's embed (None if it has none)
+        '''
+        return self.embeds[0] if self.embeds else None
+
+    async def edit(self, *, content=None, embed=None, **kwargs):
+        self.history.append((self.content, self.embeds))
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embeds = [embed]
+        await self._hub._record('edit', self.channel, self)
+
+
+class FakeContext(commands.Context):
+    '''
+    Command context whose replies go to the fake channel
+    '''
+    async def send(self, content=None, *, embed=None, **kwargs):
+        return await self.channel.send(content, embed=embed, **kwargs)
+
+
+def _find_user(hub_id, user_id):
+    '''
+    Finds a fake user when it is unpickled
+    '''
+    return _hubs[hub_id].users[user_id]
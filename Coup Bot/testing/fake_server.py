@@ -0,0 +1,692 @@
+'''
+File: fake_server.py
+Author: Gavin Vogt
+This program defines a local stand-in for Discord's gateway and REST API,
+so the real bot (discord.py's HTTP client, rate limit handling, and all)
+can be load tested end to end on one machine. Run from the `Coup Bot`
+folder with `python -m testing.fake_server --guilds 1000 --shards 4`
+'''
+
+# dependencies
+from aiohttp import web, WSMsgType
+from datetime import datetime, timezone
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import random
+import time
+import uuid
+import zlib
+import discord
+
+
+# Gateway opcodes
+DISPATCH = 0
+HEARTBEAT = 1
+IDENTIFY = 2
+RESUME = 6
+INVALID_SESSION = 9
+HELLO = 10
+HEARTBEAT_ACK = 11
+
+ALL_PERMISSIONS = (1 << 31) - 1
+ID_KINDS = ('user', 'guild', 'channel', 'message')   # kinds of IDs, which count separately
+
+
+class FakeDiscordServer:
+    '''
+    This class serves a fake Discord: the gateway (as a websocket, with the
+    zlib-stream compression discord.py asks for) and the REST endpoints the
+    bot uses, for a bot logged in with any token. It holds thousands of
+    guilds, channels, and users, sends each shard its guilds when it
+    identifies, and can inject messages from users at a controlled rate.
+
+    Routes are rate limited the way Discord does it (a bucket per route and
+    channel, reported in the X-RateLimit headers, with 429s for requests
+    over the limit, and optionally a global limit), and every response can
+    be delayed to stand in for the API's latency. Every request the bot
+    makes is counted, and kept in `log` if `keep_log` is set.
+
+    The server runs on the event loop it is started on, so when the bot is
+    run on the same loop (as main() does), the server's work is counted in
+    the latency and the bot's loop lag too.
+
+    Useful methods:
+        - start()
+        - stop()
+        - use()
+        - connect(bot)
+        - wait_for_shards(shard_count)
+        - inject_message(channel_id, user_id, content)
+        - run_load(commands, rate, seconds)
+        - reset_counts()
+    '''
+
+    HEARTBEAT_INTERVAL = 41.25   # seconds between heartbeats the gateway asks for
+    RATE_LIMIT_DEFAULT = (5, 5.0)   # requests allowed per route and channel, per seconds
+    REPLY_TIMEOUT_DEFAULT = 10.0    # seconds to wait for the bot to reply to an injected message
+    FIRST_TIMESTAMP = 2 * 10 ** 11  # IDs are snowflakes from about 2021
+
+    def __init__(self, *, guilds=1, channels_per_guild=1, users=100, latency=0.0,
+                 rate_limit=RATE_LIMIT_DEFAULT, global_rate=None, recommended_shards=1,
+                 keep_log=False, host='127.0.0.1', port=0):
+        '''
+        Constructs the server (call start() to start serving)
+        guilds: int, representing the number of guilds the bot is in
+        channels_per_guild: int, representing the number of text channels in each guild
+        users: int, representing the number of users (besides the bot), who
+        are members of every guild
+        latency: float, representing seconds every REST response is delayed
+        rate_limit: tuple of (int, float), representing the requests allowed
+        per route and channel every so many seconds (None for no limit)
+        global_rate: int, representing the requests allowed per second across
+        every route (None for no limit; Discord allows 50)
+        recommended_shards: int, representing the shard count /gateway/bot recommends
+        keep_log: bool, representing whether to keep every request in `log`
+        host: str, representing the address to listen on
+        port: int, representing the port to listen on (0 for any free port)
+        '''
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.global_rate = global_rate
+        self.recommended_shards = recommended_shards
+        self.keep_log = keep_log
+        self.host = host
+        self.port = port
+        self._runner = None
+        self._id_counts = collections.defaultdict(itertools.count)
+
+        self.guilds = {}       # maps guild ID to its data, as sent in GUILD_CREATE
+        self.channels = {}     # maps channel ID to the ID of its guild (None for DM channels)
+        self.users = {}        # maps user ID to its data
+        self.dm_channels = {}  # maps user ID to the ID of the bot's DM channel with them
+        self.messages = {}     # maps message ID to the data of a message the bot sent
+
+        self.bot_user = self._add_user("Coup Bot", bot=True)
+        self.owner = self._add_user("owner")
+        self.user_ids = [self._add_user(f"user{i}")['id'] for i in range(users)]
+        for guild_num in range(guilds):
+            self._add_guild(f"guild{guild_num}", channels_per_guild)
+        self.channel_ids = [channel_id for channel_id, guild_id in self.channels.items() if guild_id is not None]
+
+        self._shards = {}           # maps shard ID to the _GatewayConnection that identified as it
+        self._shard_count = None    # shard count the bot identified with
+        self._shards_changed = asyncio.Event()
+        self._buckets = {}          # maps (method, route, channel ID) to [requests left, reset time]
+        self._global_window = [0, 0.0]   # [requests, start time] of the current global second
+        self._waiters = collections.defaultdict(collections.deque)  # maps channel ID to (start time, Future)
+        self.log = []               # (time, method, path, status, JSON body) of every request, if keep_log
+        self.gateway_log = []       # (time, shard ID, op, data) of every gateway message besides heartbeats
+        self.counts = collections.Counter()
+
+    async def start(self):
+        '''
+        Starts serving the gateway and REST API
+        Return: str, representing the base URL of the server
+        '''
+        app = web.Application(middlewares=[self._rest_middleware])
+        app.router.add_get('/gateway', self._handle_gateway_socket)
+        api = '/api/v7'
+        app.router.add_get(api + '/gateway', self._handle_get_gateway)
+        app.router.add_get(api + '/gateway/bot', self._handle_get_gateway)
+        app.router.add_get(api + '/users/@me', self._handle_get_me)
+        app.router.add_post(api + '/users/@me/channels', self._handle_create_dm)
+        app.router.add_get(api + '/oauth2/applications/@me', self._handle_application_info)
+        app.router.add_post(api + '/channels/{channel_id}/messages', self._handle_send_message)
+        app.router.add_patch(api + '/channels/{channel_id}/messages/{message_id}', self._handle_edit_message)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        return self.url
+
+    async def stop(self):
+        '''
+        Closes every gateway connection and stops serving
+        '''
+        for connection in list(self._shards.values()):
+            await connection.socket.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @property
+    def url(self):
+        '''
+        Gives access to the base URL of the server
+        '''
+        return f"http://{self.host}:{self.port}"
+
+    def use(self):
+        '''
+        Points discord.py at this server instead of Discord (for every
+        client in the process)
+        '''
+        discord.http.Route.BASE = self.url + '/api/v7'
+
+    def connect(self, bot):
+        '''
+        Sets up a bot to connect to this server: points discord.py at it,
+        and lets every shard identify at once (Discord makes them wait 5
+        seconds each)
+        bot: discord.Client to set up (start it with any token)
+        '''
+        async def identify_now(shard_id, *, initial=False):
+            pass
+        self.use()
+        bot.before_identify_hook = identify_now
+
+    async def wait_for_shards(self, shard_count, timeout=None):
+        '''
+        Waits for shards to connect and be sent their guilds (the bot still
+        waits a moment for more guilds before it is ready)
+        shard_count: int, representing how many shards to wait for
+        timeout: float, representing seconds to wait (forever if None)
+        '''
+        async def wait():
+            while len(self._shards) < shard_count:
+                self._shards_changed.clear()
+                await self._shards_changed.wait()
+        await asyncio.wait_for(wait(), timeout)
+
+    def shard_of(self, guild_id):
+        '''
+        Gets the shard a guild is on
+        guild_id: int, representing the guild ID
+        Return: int, representing the shard ID
+        '''
+        return (guild_id >> 22) % (self._shard_count or 1)
+
+    def inject_message(self, channel_id, user_id, content):
+        '''
+        Sends a message from a user to the bot, as if they typed it in a channel
+        channel_id: int, representing the ID of a guild channel
+        user_id: int, representing the ID of the user sending it
+        content: str, representing the message text, such as "c!rules"
+        Return: asyncio.Future resolved with the seconds it took the bot to
+        send its next message to the channel
+        '''
+        guild_id = self.channels[channel_id]
+        connection = self._shards.get(self.shard_of(guild_id))
+        if connection is None:
+            raise ConnectionError(f"shard of guild {guild_id} is not connected")
+        future = asyncio.get_event_loop().create_future()
+        self._waiters[channel_id].append((time.perf_counter(), future))
+        user = self.users[user_id]
+        connection.dispatch('MESSAGE_CREATE', {
+            'id': str(self._next_id('message')),
+            'channel_id': str(channel_id),
+            'guild_id': str(guild_id),
+            'author': user,
+            'member': _member_data(None),
+            'content': content,
+            'timestamp': _now(),
+            'edited_timestamp': None,
+            'tts': False,
+            'mention_everyone': False,
+            'mentions': [self.users[int(mention_id)] for mention_id in _mention_ids(content)
+                         if int(mention_id) in self.users],
+            'mention_roles': [],
+            'attachments': [],
+            'embeds': [],
+            'pinned': False,
+            'type': 0,
+        })
+        self.counts['injected'] += 1
+        return future
+
+    async def run_load(self, commands, rate, seconds, *, timeout=REPLY_TIMEOUT_DEFAULT):
+        '''
+        Injects commands at a steady rate, spread over the channels and
+        users, and measures how long the bot takes to reply to each one
+        commands: list of str, representing the commands to send (in turn)
+        rate: float, representing commands sent per second
+        seconds: float, representing how long to send commands for
+        timeout: float, representing seconds before a command with no reply
+        counts as unanswered
+        Return: LoadReport
+        '''
+        self.reset_counts()
+        total = max(1, int(rate * seconds))
+        channels = itertools.cycle(self.channel_ids)
+        contents = itertools.cycle(commands)
+        futures = []
+        start = time.perf_counter()
+        for i in range(total):
+            # send on schedule, so slow sends do not lower the rate
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            futures.append(self.inject_message(next(channels), random.choice(self.user_ids), next(contents)))
+        sent_for = time.perf_counter() - start
+
+        done, pending = await asyncio.wait(futures, timeout=timeout) if futures else (set(), set())
+        elapsed = time.perf_counter() - start
+        for future in pending:
+            future.cancel()
+        return LoadReport(total, sent_for, elapsed, sorted(future.result() for future in done),
+                          dict(self.counts))
+
+    def reset_counts(self):
+        '''
+        Starts counting requests again, and forgets the log
+        '''
+        self.counts.clear()
+        self.log.clear()
+        self.gateway_log.clear()
+
+    def _next_id(self, kind):
+        '''
+        Gets a new snowflake ID. Each kind of object counts separately, so
+        guilds are spread evenly over the shards
+        '''
+        return (self.FIRST_TIMESTAMP + next(self._id_counts[kind])) << 22 | ID_KINDS.index(kind) << 12
+
+    def _add_user(self, name, *, bot=False):
+        user = {
+            'id': self._next_id('user'),
+            'username': name,
+            'discriminator': f"{len(self.users) % 10000:04}",
+            'avatar': None,
+            'bot': bot,
+        }
+        self.users[user['id']] = user
+        return user
+
+    def _add_guild(self, name, num_channels):
+        guild_id = self._next_id('guild')
+        channels = []
+        for position in range(num_channels):
+            channel_id = self._next_id('channel')
+            self.channels[channel_id] = guild_id
+            channels.append({'id': str(channel_id), 'type': 0, 'name': f"coup-{position}",
+                             'position': position, 'permission_overwrites': []})
+        self.guilds[guild_id] = {
+            'id': str(guild_id),
+            'name': name,
+            'unavailable': False,
+            'owner_id': str(self.owner['id']),
+            'member_count': len(self.users),
+            'large': len(self.users) >= 250,
+            'roles': [{'id': str(guild_id), 'name': '@everyone', 'permissions': str(ALL_PERMISSIONS),
+                       'position': 0, 'color': 0, 'hoist': False, 'managed': False, 'mentionable': False}],
+            'channels': channels,
+            'members': [_member_data(self.bot_user)],
+            'emojis': [],
+            'features': [],
+            'presences': [],
+            'voice_states': [],
+        }
+
+    def _message_data(self, message_id, channel_id, body):
+        '''
+        Creates the data of a message the bot sent
+        '''
+        guild_id = self.channels.get(channel_id)
+        data = {
+            'id': str(message_id),
+            'channel_id': str(channel_id),
+            'author': self.bot_user,
+            'content': body.get('content') or '',
+            'timestamp': _now(),
+            'edited_timestamp': None,
+            'tts': bool(body.get('tts')),
+            'mention_everyone': False,
+            'mentions': [],
+            'mention_roles': [],
+            'attachments': [],
+            'embeds': [body['embed']] if body.get('embed') else [],
+            'pinned': False,
+            'type': 0,
+        }
+        if guild_id is not None:
+            data['guild_id'] = str(guild_id)
+        return data
+
+    # gateway
+
+    async def _handle_gateway_socket(self, request):
+        '''
+        Serves one shard's gateway connection
+        '''
+        socket = web.WebSocketResponse(max_msg_size=0)
+        await socket.prepare(request)
+        compress = (request.query.get('compress') == 'zlib-stream')
+        connection = _GatewayConnection(socket, compress)
+        connection.send({'op': HELLO, 'd': {'heartbeat_interval': self.HEARTBEAT_INTERVAL * 1000}})
+        try:
+            async for message in socket:
+                if message.type != WSMsgType.TEXT:
+                    break
+                payload = json.loads(message.data)
+                op = payload.get('op')
+                if op == HEARTBEAT:
+                    connection.send({'op': HEARTBEAT_ACK})
+                    continue
+                self.gateway_log.append((time.time(), connection.shard_id, op, payload.get('d')))
+                self.counts[f'gateway_op_{op}'] += 1
+                if op == IDENTIFY:
+                    self._identify(connection, payload['d'])
+                elif op == RESUME:
+                    # sessions are not kept; the shard identifies again
+                    connection.send({'op': INVALID_SESSION, 'd': False})
+        finally:
+            if self._shards.get(connection.shard_id) is connection:
+                del self._shards[connection.shard_id]
+                self._shards_changed.set()
+        return socket
+
+    def _identify(self, connection, data):
+        '''
+        Starts a shard's session: sends READY, then each of its guilds
+        '''
+        shard_id, shard_count = data.get('shard', (0, 1))
+        self._shard_count = shard_count
+        connection.shard_id = shard_id
+        self._shards[shard_id] = connection
+        guilds = [guild for guild_id, guild in self.guilds.items() if self.shard_of(guild_id) == shard_id]
+        connection.dispatch('READY', {
+            'v': 6,
+            'user': self.bot_user,
+            'guilds': [{'id': guild['id'], 'unavailable': True} for guild in guilds],
+            'session_id': uuid.uuid4().hex,
+            'private_channels': [],
+            'relationships': [],
+            'shard': [shard_id, shard_count],
+        })
+        for guild in guilds:
+            connection.dispatch('GUILD_CREATE', guild)
+        self._shards_changed.set()
+
+    # REST
+
+    @web.middleware
+    async def _rest_middleware(self, request, handler):
+        '''
+        Delays, rate limits, and records every REST request
+        '''
+        if not request.path.startswith('/api/'):
+            return await handler(request)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.counts['requests'] += 1
+        response, headers = self._check_rate_limits(request)
+        if response is None:
+            try:
+                response = await handler(request)
+            except web.HTTPException as e:
+                response = _json_response({'message': e.reason, 'code': 0}, status=e.status)
+            response.headers.update(headers)
+        if self.keep_log:
+            body = await request.json() if request.can_read_body else None
+            self.log.append((time.time(), request.method, request.path, response.status, body))
+        return response
+
+    def _check_rate_limits(self, request):
+        '''
+        Takes a request from the global limit and its route's bucket
+        Return: tuple of (web.Response, dict), representing the 429 response
+        if the request is over a limit (else None), and the rate limit headers
+        '''
+        now = time.time()
+        if self.global_rate is not None:
+            if now - self._global_window[1] >= 1.0:
+                self._global_window[:] = [0, now]
+            if self._global_window[0] >= self.global_rate:
+                self.counts['global_rate_limited'] += 1
+                return self._too_many_requests(self._global_window[1] + 1.0 - now, is_global=True), {}
+            self._global_window[0] += 1
+
+        if self.rate_limit is None:
+            return None, {}
+        limit, per = self.rate_limit
+        resource = request.match_info.route.resource
+        route = resource.canonical if resource is not None else request.path
+        key = (request.method, route, request.match_info.get('channel_id'))
+        bucket = self._buckets.get(key)
+        if bucket is None or now >= bucket[1]:
+            bucket = self._buckets[key] = [limit, now + per]
+        reset_after = bucket[1] - now
+        if bucket[0] <= 0:
+            self.counts['rate_limited'] += 1
+            return self._too_many_requests(reset_after, is_global=False), {}
+        bucket[0] -= 1
+        return None, {
+            'X-RateLimit-Limit': str(limit),
+            'X-RateLimit-Remaining': str(bucket[0]),
+            'X-RateLimit-Reset': f"{bucket[1]:.3f}",
+            'X-RateLimit-Reset-After': f"{reset_after:.3f}",
+            'X-RateLimit-Bucket': f"{request.method}:{route}",
+        }
+
+    def _too_many_requests(self, retry_after, *, is_global):
+        '''
+        Creates a 429 response, the way Discord sends them
+        retry_after: float, representing seconds until the request can be retried
+        '''
+        headers = {'Via': '1.1 google', 'Retry-After': str(max(1, round(retry_after)))}
+        if is_global:
+            headers['X-RateLimit-Global'] = 'true'
+        return _json_response({
+            'message': "You are being rate limited.",
+            'retry_after': max(1, int(retry_after * 1000)),
+            'global': is_global,
+        }, status=429, headers=headers)
+
+    async def _handle_get_gateway(self, request):
+        return _json_response({
+            'url': f"ws://{self.host}:{self.port}/gateway",
+            'shards': self.recommended_shards,
+            'session_start_limit': {'total': 1000, 'remaining': 1000, 'reset_after': 0, 'max_concurrency': 1},
+        })
+
+    async def _handle_get_me(self, request):
+        return _json_response(self.bot_user)
+
+    async def _handle_application_info(self, request):
+        return _json_response({
+            'id': str(self.bot_user['id']),
+            'name': self.bot_user['username'],
+            'icon': None,
+            'description': "",
+            'rpc_origins': None,
+            'bot_public': True,
+            'bot_require_code_grant': False,
+            'owner': self.owner,
+            'summary': "",
+            'verify_key': "",
+        })
+
+    async def _handle_create_dm(self, request):
+        recipient_id = int((await request.json())['recipient_id'])
+        if recipient_id not in self.users:
+            raise web.HTTPNotFound(reason="Unknown User")
+        channel_id = self.dm_channels.get(recipient_id)
+        if channel_id is None:
+            channel_id = self.dm_channels[recipient_id] = self._next_id('channel')
+            self.channels[channel_id] = None
+        return _json_response({'id': str(channel_id), 'type': 1, 'last_message_id': None,
+                                  'recipients': [self.users[recipient_id]]})
+
+    async def _handle_send_message(self, request):
+        channel_id = int(request.match_info['channel_id'])
+        if channel_id not in self.channels:
+            raise web.HTTPNotFound(reason="Unknown Channel")
+        data = self._message_data(self._next_id('message'), channel_id, await request.json())
+        self.messages[int(data['id'])] = data
+        self.counts['sent' if self.channels[channel_id] is not None else 'dm'] += 1
+
+        # the bot replied to the oldest injected message still waiting in the channel
+        waiters = self._waiters.get(channel_id)
+        while waiters:
+            start, future = waiters.popleft()
+            if not future.done():
+                future.set_result(time.perf_counter() - start)
+                break
+        return _json_response(data)
+
+    async def _handle_edit_message(self, request):
+        message = self.messages.get(int(request.match_info['message_id']))
+        if message is None or message['channel_id'] != request.match_info['channel_id']:
+            raise web.HTTPNotFound(reason="Unknown Message")
+        body = await request.json()
+        if 'content' in body:
+            message['content'] = body['content'] or ''
+        if 'embed' in body:
+            message['embeds'] = [body['embed']] if body['embed'] else []
+        message['edited_timestamp'] = _now()
+        self.counts['edited'] += 1
+        return _json_response(message)
+
+
+class _GatewayConnection:
+    '''
+    A shard's connection to the fake gateway
+    '''
+    def __init__(self, socket, compress):
+        self.socket = socket
+        self.shard_id = None
+        self.sequence = 0
+        self._zlib = zlib.compressobj() if compress else None
+
+    def dispatch(self, event, data):
+        '''
+        Sends an event to the shard
+        event: str, representing the event name, such as 'MESSAGE_CREATE'
+        data: dict, representing the event data
+        '''
+        self.sequence += 1
+        self.send({'op': DISPATCH, 't': event, 's': self.sequence, 'd': data})
+
+    def send(self, payload):
+        '''
+        Sends a payload to the shard, in order (without waiting for it to be written)
+        '''
+        text = json.dumps(payload)
+        if self._zlib is None:
+            asyncio.ensure_future(self.socket.send_str(text))
+        else:
+            # each payload ends with a sync flush, which is how the shard knows it is complete
+            data = self._zlib.compress(text.encode()) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+            asyncio.ensure_future(self.socket.send_bytes(data))
+
+
+class LoadReport:
+    '''
+    Results of a load test run by FakeDiscordServer.run_load()
+    '''
+    def __init__(self, sent, sent_for, elapsed, latencies, counts):
+        '''
+        sent: int, representing the number of commands injected
+        sent_for: float, representing seconds spent injecting them
+        elapsed: float, representing seconds until the last reply (or the timeout)
+        latencies: sorted list of float, representing the seconds each
+        answered command took to get a reply
+        counts: dict of str to int, representing the server's request counts
+        '''
+        self.sent = sent
+        self.sent_for = sent_for
+        self.elapsed = elapsed
+        self.latencies = latencies
+        self.counts = counts
+
+    def percentile(self, q):
+        '''
+        Gets a percentile of the reply latency
+        q: float, representing the percentile (1.0 being the max)
+        Return: float, representing seconds (None if nothing was answered)
+        '''
+        if not self.latencies:
+            return None
+        return self.latencies[min(len(self.latencies) - 1, int(q * len(self.latencies)))]
+
+    def __str__(self):
+        answered = len(self.latencies)
+        lines = [
+            f"{self.sent} commands sent in {self.sent_for:.1f}s ({self.sent / max(self.sent_for, 1e-9):.0f}/s)",
+            f"    answered: {answered} ({answered / max(self.elapsed, 1e-9):.0f}/s), unanswered: {self.sent - answered}",
+        ]
+        if answered:
+            lines.append("    latency: " + ", ".join(
+                f"p{int(q * 100)} {self.percentile(q) * 1000:.1f}ms" for q in (0.5, 0.9, 0.99, 1.0)))
+        lines.append("    requests: " + ", ".join(f"{kind} {count}" for kind, count in sorted(self.counts.items())))
+        return "\n".join(lines)
+
+
+def _json_response(data, *, status=200, headers=None):
+    '''
+    Creates a JSON response (discord.py only parses the body as JSON if the
+    content type is exactly application/json, with no charset)
+    '''
+    return web.Response(body=json.dumps(data).encode(), status=status,
+                        headers={**(headers or {}), 'Content-Type': 'application/json'})
+
+def _now():
+    '''
+    Gets the current time as Discord formats it
+    '''
+    return datetime.now(timezone.utc).isoformat()
+
+def _member_data(user):
+    '''
+    Creates the guild member data of a user (without the user if None,
+    as in the member of a message's author)
+    '''
+    data = {'roles': [], 'nick': None, 'joined_at': _now(), 'deaf': False, 'mute': False}
+    if user is not None:
+        data['user'] = user
+    return data
+
+def _mention_ids(content):
+    '''
+    Finds the user IDs mentioned in a message
+    '''
+    return [part.strip('<@!>') for part in content.split() if part.startswith('<@') and part.endswith('>')]
+
+
+async def main(args):
+    '''
+    Runs a load test: starts the server and the bot, waits for the bot to
+    be ready, then injects commands and prints the report
+    '''
+    # imported here so the server can be used without loading the bot
+    from coup_bot import CoupBot
+
+    server = FakeDiscordServer(guilds=args.guilds, channels_per_guild=args.channels, users=args.users,
+                               latency=args.latency / 1000, global_rate=args.global_rate,
+                               rate_limit=None if args.no_rate_limit else FakeDiscordServer.RATE_LIMIT_DEFAULT)
+    await server.start()
+    bot = CoupBot(command_prefix="c!", metrics_port=0, shard_count=args.shards,
+                  guild_ready_timeout=0.5)
+    server.connect(bot)
+    print(f"Serving {args.guilds} guilds ({len(server.channel_ids)} channels) at {server.url}")
+
+    start = time.perf_counter()
+    bot_task = asyncio.ensure_future(bot.start("fake-token"))
+    try:
+        await asyncio.wait_for(bot.wait_until_ready(), 60 + args.guilds / 100)
+        print(f"Bot ready with {args.shards} shards in {time.perf_counter() - start:.1f}s")
+        report = await server.run_load(args.command or ["c!rules"], args.rate, args.seconds)
+        print(report)
+    finally:
+        await bot.close()
+        await bot_task
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the bot against a fake Discord")
+    parser.add_argument('--guilds', type=int, default=1000)
+    parser.add_argument('--channels', type=int, default=1, help="text channels per guild")
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--shards', type=int, default=1)
+    parser.add_argument('--rate', type=float, default=100.0, help="commands injected per second")
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--latency', type=float, default=0.0, help="milliseconds every REST response is delayed")
+    parser.add_argument('--global-rate', type=int, default=None, help="global REST requests allowed per second")
+    parser.add_argument('--no-rate-limit', action='store_true', help="do not rate limit routes")
+    parser.add_argument('--command', action='append', help="command to send (repeat for several; c!rules if none)")
+    asyncio.run(main(parser.parse_args()))
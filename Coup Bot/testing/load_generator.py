@@ -0,0 +1,528 @@
+'''
+File: load_generator.py
+Author: Gavin Vogt
+This program plays thousands of complete games of Coup at once through
+the bot's real commands, with simulated players, to measure how much load
+the bot can take. Run from the `Coup Bot` folder with
+`python -m testing.load_generator --arrival-rate 20 --seconds 60`
+'''
+
+# dependencies
+from discord.ext import commands
+import argparse
+import asyncio
+import itertools
+import random
+import time
+import tracemalloc
+
+# my code
+from classes import actions
+from classes.coup_game import CoupGame
+from helpers.memory_utils import rss_bytes, top_allocations
+from testing.fake_discord import FakeDiscord, FakeContext
+
+
+class Behavior:
+    '''
+    How a simulated player plays: which actions they like to take, and how
+    likely they are to make each optional response when they can
+    '''
+    def __init__(self, actions, *, challenge=0.1, block=0.2, pass_=0.3, swap=0.5, noise=0.0):
+        '''
+        Constructs the behavior
+        actions: dict of str (action command) to float, representing how
+        often the player picks each action they can afford
+        challenge: float, representing the chance of challenging a claim
+        block: float, representing the chance of blocking an action they can block
+        pass_: float, representing the chance of passing instead of letting the
+        next player move on
+        swap: float, representing the chance of swapping a card in an Exchange
+        noise: float, representing the chance of sending a random command
+        instead, whether or not it makes sense (like a confused player)
+        '''
+        self.actions = actions
+        self.challenge = challenge
+        self.block = block
+        self.pass_ = pass_
+        self.swap = swap
+        self.noise = noise
+
+
+BEHAVIORS = {
+    'honest': Behavior({'income': 3, 'foreignaid': 3, 'tax': 1, 'steal': 1, 'exchange': 1, 'assassinate': 1, 'coup': 4},
+                       challenge=0.05, block=0.1, pass_=0.5),
+    'bluffer': Behavior({'income': 1, 'foreignaid': 1, 'tax': 4, 'steal': 3, 'exchange': 1, 'assassinate': 3, 'coup': 4},
+                        challenge=0.1, block=0.5, pass_=0.2),
+    'aggressive': Behavior({'income': 1, 'foreignaid': 2, 'tax': 2, 'steal': 4, 'assassinate': 4, 'coup': 6},
+                           challenge=0.4, block=0.4, pass_=0.1),
+    'chaotic': Behavior({action: 1 for action in CoupGame.ACTION_TYPES},
+                        challenge=0.3, block=0.3, pass_=0.3, noise=0.2),
+}
+BEHAVIOR_MIX_DEFAULT = {'honest': 3, 'bluffer': 2, 'aggressive': 2, 'chaotic': 1}
+
+# Commands a chaotic player might send at any time
+NOISE_COMMANDS = ('c!income', 'c!tax', 'c!pass', 'c!challenge', 'c!block', 'c!die 1', 'c!swap 1 1',
+                  'c!noswap', 'c!hand', 'c!coins', 'c!turn', 'c!pending', 'c!join', 'c!start')
+
+
+class LoadGenerator:
+    '''
+    This class starts new games at a steady rate (with random gaps, like
+    players arriving independently) and plays each one to the end through
+    the bot's commands, as if the players typed them. Each simulated player
+    has a Behavior drawn from the behavior mix, and decides on their moves
+    from the game they are in, the way a player reads the channel.
+
+    Every command is timed from being sent to it finishing, and the bot's
+    replies to rejected commands and its errors are counted. A line with
+    the throughput, latency, errors, and memory of the last interval is
+    printed every so often, and a summary at the end.
+
+    Useful methods:
+        - run(seconds)
+        - summary()
+    '''
+
+    GAME_TIMEOUT_DEFAULT = 30   # seconds the bot waits on a move before making the default one
+    MAX_MOVES = 400             # moves before the players give up on a game and forfeit
+    POLL_INTERVAL = 0.25        # seconds between looks at a game that is waiting on the bot
+
+    def __init__(self, bot, hub, *, arrival_rate=1.0, max_active=1000, players=(2, 6),
+                 behavior_mix=None, think_time=0.5, game_timeout=GAME_TIMEOUT_DEFAULT,
+                 guilds=10, shards=1, report_every=5.0):
+        '''
+        Constructs the generator
+        bot: CoupBot to play the games on (attached to `hub`)
+        hub: FakeDiscord the games are played in
+        arrival_rate: float, representing new games started per second
+        max_active: int, representing the most games played at once (new
+        games wait for one to end)
+        players: tuple of (int, int), representing the least and most players in a game
+        behavior_mix: dict of str (name in BEHAVIORS) to float, representing
+        how common each behavior is
+        think_time: float, representing the average seconds a player takes
+        to make a move (0 to play as fast as possible)
+        game_timeout: int, representing the seconds the bot waits on each move
+        guilds: int, representing the number of guilds the games are spread over
+        shards: int, representing the number of shards the guilds are spread over
+        report_every: float, representing seconds between progress lines (0 for none)
+        '''
+        self.bot = bot
+        self.hub = hub
+        self.arrival_rate = arrival_rate
+        self.max_active = max_active
+        self.players = players
+        mix = behavior_mix or BEHAVIOR_MIX_DEFAULT
+        self._behavior_names = list(mix)
+        self._behavior_weights = [mix[name] for name in self._behavior_names]
+        self.think_time = think_time
+        self.game_timeout = game_timeout
+        self.report_every = report_every
+
+        self._guilds = [hub.add_guild(f"guild{i}", shard_id=i % shards) for i in range(guilds)]
+        self._free_channels = []
+        self._free_users = []
+        self._guild_order = itertools.cycle(self._guilds)
+        self._active = set()          # asyncio.Task playing each game
+        self._slots = None            # asyncio.Semaphore limiting the games played at once
+
+        self.started = 0              # games started
+        self.finished = 0             # games that ended with a winner
+        self.abandoned = 0            # games the players gave up on
+        self.outcomes = {'ok': 0, 'rejected': 0, 'error': 0}
+        self.errors = {}              # maps error name to count
+        self.commands = {}            # maps command name to list of seconds each one took
+        self._interval = []           # seconds each command in the current interval took
+        self.timeline = []            # dict of stats for each interval
+        self._start_time = None
+        self._start_rss = None
+
+        bot.add_listener(self._on_command_error, 'on_command_error')
+
+    async def run(self, seconds):
+        '''
+        Starts games for some time, then waits for the games to end
+        seconds: float, representing how long to keep starting games
+        '''
+        self._slots = asyncio.Semaphore(self.max_active)
+        self._start_time = time.perf_counter()
+        self._start_rss = rss_bytes()
+        reporter = asyncio.ensure_future(self._report_forever()) if self.report_every else None
+        try:
+            stop_at = self._start_time + seconds
+            next_arrival = self._start_time
+            while True:
+                next_arrival += random.expovariate(self.arrival_rate)
+                if next_arrival >= stop_at:
+                    break
+                await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+                await self._slots.acquire()
+                task = asyncio.ensure_future(self._play_game())
+                self._active.add(task)
+                task.add_done_callback(self._game_done)
+
+            if self._active:
+                await asyncio.wait(list(self._active))
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+            self._record_interval()
+
+    def summary(self):
+        '''
+        Gets a summary of the whole run
+        Return: str, representing the summary
+        '''
+        elapsed = time.perf_counter() - self._start_time
+        latencies = sorted(itertools.chain.from_iterable(self.commands.values()))
+        total = len(latencies)
+        lines = [
+            f"{self.started} games in {elapsed:.1f}s: {self.finished} won, {self.abandoned} abandoned",
+            f"    commands: {total} ({total / max(elapsed, 1e-9):.0f}/s), "
+            f"rejected {self.outcomes['rejected']} ({self.outcomes['rejected'] / max(total, 1):.1%}), "
+            f"errors {self.outcomes['error']} ({self.outcomes['error'] / max(total, 1):.1%}), "
+            f"stale {_counter_total(self.bot._stale_total)}",
+            f"    latency: {_format_percentiles(latencies)}",
+            f"    memory: {self._start_rss / 1e6:.0f} MB -> {rss_bytes() / 1e6:.0f} MB, "
+            f"{len(self.bot.get_games())} games left",
+        ]
+        if self.errors:
+            lines.append("    errors: " + ", ".join(f"{name} {count}" for name, count in
+                                                    sorted(self.errors.items(), key=lambda item: -item[1])))
+        lines.append("    by command:")
+        for name, times in sorted(self.commands.items(), key=lambda item: -len(item[1])):
+            lines.append(f"        {name:<12} {len(times):>8}  {_format_percentiles(sorted(times))}")
+        return "\n".join(lines)
+
+    async def _play_game(self):
+        '''
+        Plays one game from `play` to the end
+        '''
+        channel = self._free_channels.pop() if self._free_channels else \
+            self.hub.add_channel(next(self._guild_order), f"coup-{len(self.hub.channels)}")
+        seats = {}   # maps user ID to (FakeUser, Behavior) of each player
+        for _ in range(random.randint(*self.players)):
+            user = self._free_users.pop() if self._free_users else self.hub.add_user(f"player{len(self.hub.users)}")
+            behavior = BEHAVIORS[random.choices(self._behavior_names, self._behavior_weights)[0]]
+            seats[user.id] = (user, behavior)
+        self.started += 1
+        try:
+            users = [user for user, _ in seats.values()]
+            await self._command(users[0], channel, f"c!play --timeout {self.game_timeout} --max {len(users)}")
+            for user in users[1:]:
+                await self._think()
+                await self._command(user, channel, "c!join")
+            await self._command(users[0], channel, "c!start")
+            game = self.bot.get_game(channel.id)
+
+            rejected = None   # (game version, moves) that were rejected, so they are not repeated
+            moves = 0
+            while game is not None and self.bot.get_game(channel.id) is game:
+                if moves >= self.MAX_MOVES:
+                    await self._give_up(game, channel, seats)
+                    return
+                await self._think()
+                chosen = self._choose_moves(game, seats)
+                if not chosen or rejected == (game.version, chosen):
+                    # waiting on the bot, such as an Exchange counting down
+                    await asyncio.sleep(self.POLL_INTERVAL)
+                    continue
+                version = game.version
+                results = await asyncio.gather(*(self._command(user, channel, content) for user, content in chosen))
+                moves += len(chosen)
+                rejected = (version, chosen) if not any(results) else None
+            if game is not None:
+                self.finished += 1
+        finally:
+            self._free_channels.append(channel)
+            self._free_users.extend(user for user, _ in seats.values())
+
+    def _game_done(self, task):
+        '''
+        Forgets a game once it is over, letting another one start
+        '''
+        self._active.discard(task)
+        self._slots.release()
+        if not task.cancelled() and task.exception() is not None:
+            error = task.exception()
+            self.errors[f"generator {type(error).__name__}"] = self.errors.get(f"generator {type(error).__name__}", 0) + 1
+
+    async def _give_up(self, game, channel, seats):
+        '''
+        Ends a game that is taking too long by having players forfeit
+        until one is left
+        '''
+        self.abandoned += 1
+        for user_id in game.get_player_ids()[1:]:
+            await self._command(seats[user_id][0], channel, "c!forfeit")
+            if self.bot.get_game(channel.id) is not game:
+                break
+
+    async def _think(self):
+        '''
+        Waits for as long as a player takes to make a move
+        '''
+        if self.think_time:
+            await asyncio.sleep(random.expovariate(1 / self.think_time))
+
+    async def _command(self, user, channel, content):
+        '''
+        Sends a command, timing it and recording how it went
+        Return: bool, representing whether the command ran without being rejected
+        '''
+        start = time.perf_counter()
+        ctx = await self.hub.run_command(self.bot, user, channel, content)
+        elapsed = time.perf_counter() - start
+        name = content.split()[0][len("c!"):]
+        self.commands.setdefault(name, []).append(elapsed)
+        self._interval.append(elapsed)
+
+        if ctx.command_failed:
+            await asyncio.sleep(0)   # let the command_error event (a task) record the error
+        error = getattr(ctx, 'load_error', None)
+        if not ctx.command_failed:
+            self.outcomes['ok'] += 1
+            return True
+        elif isinstance(error, commands.CheckFailure) or getattr(ctx, 'failed_check', None):
+            self.outcomes['rejected'] += 1
+        else:
+            self.outcomes['error'] += 1
+            error = getattr(error, 'original', error)
+            name = type(error).__name__ if error is not None else "unknown"
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return False
+
+    async def _on_command_error(self, ctx, exception):
+        '''
+        Remembers why a command failed, for _command()
+        '''
+        if isinstance(ctx, FakeContext):
+            ctx.load_error = exception
+
+    def _choose_moves(self, game, seats):
+        '''
+        Decides on the next move(s) in a game: whoever the game is waiting
+        on moves first, then any optional responses, then the next player
+        moves on by making their action. Responses are decided separately by
+        each player, so sometimes two arrive at once
+        game: CoupGame being played
+        seats: dict of user ID to (FakeUser, Behavior) of each player
+        Return: list of (FakeUser, str), representing who sends which command
+        '''
+        if not game.is_active():
+            return []
+        user, behavior = seats[game.get_turn().get_id()]
+        if random.random() < behavior.noise:
+            noisy_user, _ = seats[random.choice(game.get_player_ids())]
+            return [(noisy_user, random.choice(NOISE_COMMANDS))]
+
+        # Required moves
+        for player in game.get_pending_players():
+            user, behavior = seats[player.get_id()]
+            alive = [i + 1 for i in range(game.influences_per_player()) if player[i].alive]
+            if player.must_kill > 0:
+                cards = random.sample(alive, min(player.must_kill, len(alive)))
+                return [(user, "c!die " + " ".join(str(card) for card in cards))]
+            exchange = game.action
+            if isinstance(exchange, actions.Exchange) and exchange.time_is_up() and not exchange.has_swapped():
+                if alive and random.random() < behavior.swap:
+                    return [(user, f"c!swap {random.choice(alive)} {random.randint(1, 2)}")]
+                return [(user, "c!noswap")]
+        if game.hard_pending:
+            return []
+
+        action = game.action
+        if action is None:
+            return self._choose_action(game, game.get_turn(), seats)
+
+        # Optional responses
+        moves = []
+        stage = game.get_stage()
+        if game.soft_pending and stage != CoupGame.COMPLETE_STAGE:
+            for player in game.get_players():
+                user, behavior = seats[player.get_id()]
+                move = self._choose_response(game, action, stage, player, behavior)
+                if move is not None:
+                    moves.append((user, move))
+        if moves:
+            return moves[:2]
+        if game.turn_can_complete():
+            return self._choose_action(game, game.get_next_turn(), seats)
+        return []
+
+    def _choose_response(self, game, action, stage, player, behavior):
+        '''
+        Decides whether a player makes an optional response
+        Return: str, representing the command, or None for no response
+        '''
+        if stage == CoupGame.CHALLENGE1_STAGE:
+            if player is not action.done_by and random.random() < behavior.challenge and \
+                    not (isinstance(action, actions.Exchange) and action.time_is_up()):
+                return "c!challenge"
+        if stage in (CoupGame.CHALLENGE1_STAGE, CoupGame.RESPONSE_STAGE) and action.is_blockable():
+            may_block = (player is action.done_to) or \
+                (isinstance(action, actions.ForeignAid) and player is not action.done_by)
+            if may_block and random.random() < behavior.block:
+                if isinstance(action, actions.Steal):
+                    return f"c!block {random.choice(('captain', 'ambassador'))}"
+                return "c!block"
+            if player is action.done_to and random.random() < behavior.pass_:
+                return "c!pass"
+        if stage == CoupGame.CHALLENGE2_STAGE:
+            if player is not game.response.response_by and random.random() < behavior.challenge:
+                return "c!challenge"
+            if player is action.done_by and random.random() < behavior.pass_:
+                return "c!pass"
+        return None
+
+    def _choose_action(self, game, player, seats):
+        '''
+        Decides on the action a player takes on their turn
+        Return: list with the (FakeUser, str) of the action
+        '''
+        user, behavior = seats[player.get_id()]
+        coins = player.get_coins()
+        others = [other for other in game.get_players() if other is not player]
+        if not others:
+            return []
+        target = random.choice(others)
+        if coins >= 10:
+            return [(user, f"c!coup {target.get_user().mention}")]
+
+        choices = []
+        for name, weight in behavior.actions.items():
+            if name == 'coup' and coins < actions.LaunchCoup.cost() or \
+                    name == 'assassinate' and coins < actions.Assassinate.cost() or \
+                    name == 'steal' and target.get_coins() < 1:
+                continue
+            choices.append((name, weight))
+        name = random.choices([name for name, _ in choices], [weight for _, weight in choices])[0]
+        if name in ('coup', 'assassinate', 'steal'):
+            return [(user, f"c!{name} {target.get_user().mention}")]
+        return [(user, f"c!{name}")]
+
+    async def _report_forever(self):
+        '''
+        Prints a progress line every interval
+        '''
+        while True:
+            await asyncio.sleep(self.report_every)
+            stats = self._record_interval()
+            print(f"{stats['time']:6.0f}s  games {stats['active']:>5} active {stats['finished']:>6} done  "
+                  f"{stats['commands_per_second']:7.0f} cmd/s  p50 {stats['p50'] * 1000:6.1f}ms  "
+                  f"p99 {stats['p99'] * 1000:7.1f}ms  rejected {stats['rejected']:>6}  errors {stats['errors']:>4}  "
+                  f"lag p99 {stats['lag_p99'] * 1000:5.1f}ms  rss {stats['rss'] / 1e6:6.0f} MB")
+
+    def _record_interval(self):
+        '''
+        Records the stats of the interval since the last one
+        Return: dict of the stats
+        '''
+        now = time.perf_counter()
+        last = self.timeline[-1]['time'] if self.timeline else 0.0
+        elapsed = now - self._start_time
+        latencies = sorted(self._interval)
+        self._interval = []
+        stats = {
+            'time': elapsed,
+            'active': len(self._active),
+            'finished': self.finished + self.abandoned,
+            'commands_per_second': len(latencies) / max(elapsed - last, 1e-9),
+            'p50': _percentile(latencies, 0.5) or 0.0,
+            'p99': _percentile(latencies, 0.99) or 0.0,
+            'rejected': self.outcomes['rejected'],
+            'errors': self.outcomes['error'],
+            'lag_p99': self.bot.loop_monitor.lag_percentiles().get(0.99, 0.0),
+            'rss': rss_bytes(),
+        }
+        self.timeline.append(stats)
+        return stats
+
+
+def _percentile(values, q):
+    '''
+    Gets a percentile of sorted values (None if there are none)
+    '''
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def _format_percentiles(values):
+    '''
+    Formats the latency percentiles of sorted values
+    '''
+    if not values:
+        return "-"
+    return ", ".join(f"p{int(q * 100)} {_percentile(values, q) * 1000:.1f}ms" for q in (0.5, 0.9, 0.99, 1.0))
+
+def _counter_total(counter):
+    '''
+    Adds up a counter over every combination of labels
+    '''
+    return int(sum(value for _, _, value in counter.samples()))
+
+def _parse_mix(text):
+    '''
+    Parses a behavior mix like "honest=3,chaotic=1"
+    '''
+    mix = {}
+    for entry in text.split(','):
+        name, _, weight = entry.partition('=')
+        if name.strip() not in BEHAVIORS:
+            raise argparse.ArgumentTypeError(f"unknown behavior {name!r} (choose from {', '.join(BEHAVIORS)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+async def main(args):
+    '''
+    Runs a load test against a bot attached to a fake Discord
+    '''
+    # imported here so the generator can be used with any bot
+    from coup_bot import CoupBot
+
+    if args.trace_memory:
+        tracemalloc.start()
+    hub = FakeDiscord(send_delay=args.send_delay / 1000, keep_log=False)
+    bot = CoupBot(command_prefix="c!", metrics_port=0, shard_count=args.shards)
+    hub.attach(bot)
+    if args.no_rate_limit:
+        bot.outbound.set_rate(10 ** 6, 1.0)
+    bot.loop_monitor.start(bot.loop)
+    generator = LoadGenerator(bot, hub, arrival_rate=args.arrival_rate, max_active=args.max_active,
+                              players=(args.min_players, args.max_players), behavior_mix=args.mix,
+                              think_time=args.think, game_timeout=args.game_timeout,
+                              guilds=args.guilds, shards=args.shards, report_every=args.report_every)
+    try:
+        await generator.run(args.seconds)
+    finally:
+        print(generator.summary())
+        if args.trace_memory:
+            print("    top allocations:")
+            for location, size, count in top_allocations():
+                print(f"        {location:<40} {size / 1e6:8.2f} MB in {count} blocks")
+        bot.loop_monitor.stop()
+        await bot.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play many games of Coup at once against the bot")
+    parser.add_argument('--arrival-rate', type=float, default=10.0, help="new games started per second")
+    parser.add_argument('--seconds', type=float, default=30.0, help="seconds to keep starting games")
+    parser.add_argument('--max-active', type=int, default=5000, help="most games played at once")
+    parser.add_argument('--min-players', type=int, default=2)
+    parser.add_argument('--max-players', type=int, default=6)
+    parser.add_argument('--mix', type=_parse_mix, default=None,
+                        help=f"behavior mix, such as honest=3,chaotic=1 (from {', '.join(BEHAVIORS)})")
+    parser.add_argument('--think', type=float, default=0.5, help="average seconds a player takes per move")
+    parser.add_argument('--game-timeout', type=int, default=LoadGenerator.GAME_TIMEOUT_DEFAULT,
+                        help="seconds the bot waits on each move")
+    parser.add_argument('--send-delay', type=float, default=0.0, help="milliseconds every message send takes")
+    parser.add_argument('--no-rate-limit', action='store_true',
+                        help="do not hold messages to Discord's rate limit for each channel")
+    parser.add_argument('--guilds', type=int, default=10)
+    parser.add_argument('--shards', type=int, default=1)
+    parser.add_argument('--report-every', type=float, default=5.0, help="seconds between progress lines")
+    parser.add_argument('--trace-memory', action='store_true', help="show where memory was allocated")
+    asyncio.run(main(parser.parse_args()))
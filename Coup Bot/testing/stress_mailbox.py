@@ -0,0 +1,188 @@
+'''
+File: stress_mailbox.py
+Author: Gavin Vogt
+This program sends hundreds of commands at once to a single game through
+the bot's real command handling, and checks that the channel's mailbox
+lets exactly one of each conflicting move through. Run from the
+`Coup Bot` folder with `python -m testing.stress_mailbox [--commands N]`
+(exits with status 1 if any check fails)
+'''
+
+# dependencies
+import argparse
+import asyncio
+import sys
+
+# my code
+from testing.fake_discord import FakeDiscord
+
+
+class MailboxStress:
+    '''
+    This class runs each scenario in its own channel: a burst of commands
+    that would each change the game if they ran alone, sent all at once.
+    Afterwards, the game must show exactly one of them, and exactly one
+    must have run to completion (the rest are rejected by their checks,
+    or dropped as stale)
+
+    Useful methods:
+        - run()
+    '''
+
+    MAX_PLAYERS = 6
+
+    def __init__(self, bot, hub, num_commands, *, check_delay=0.001):
+        '''
+        Constructs the stress test
+        bot: CoupBot attached to `hub`
+        hub: FakeDiscord to send the commands through
+        num_commands: int, representing the commands in each burst
+        check_delay: float, representing seconds every command's checks take
+        '''
+        self.bot = bot
+        self.hub = hub
+        self.num_commands = num_commands
+        self.check_delay = check_delay
+        self.guild = hub.add_guild()
+        self.completed = {}   # maps (channel ID, command name) to times it ran to completion
+        bot.add_listener(self._on_command_completion, 'on_command_completion')
+        for command in bot.walk_commands():
+            # last, so it runs after the command's own checks have passed
+            command.checks.append(self._slow_check)
+
+    async def run(self):
+        '''
+        Runs every scenario, printing whether each passed
+        Return: bool, representing whether they all passed
+        '''
+        all_passed = True
+        for scenario in (self.play_race, self.join_race, self.action_race, self.block_race):
+            channel = self.hub.add_channel(self.guild, scenario.__name__)
+            passed, description = await scenario(channel)
+            print(f"    {'PASS' if passed else 'FAIL'} {scenario.__name__:<12} {description}")
+            all_passed &= passed
+        return all_passed
+
+    async def play_race(self, channel):
+        '''
+        Different users all try to create a game in the same channel
+        '''
+        users = [self.hub.add_user(f"host{i}") for i in range(self.num_commands)]
+        await self._burst(channel, ((user, "c!play") for user in users))
+        game = self.bot.get_game(channel.id)
+        claimed = sum(1 for user in users if self.bot.is_in_game(user.id))
+        players = 0 if game is None else game.player_count()
+        return (game is not None and players == 1 and claimed == 1,
+                f"{self.num_commands} x c!play -> {0 if game is None else 1} game, "
+                f"{players} player, {claimed} user claimed")
+
+    async def join_race(self, channel):
+        '''
+        Many more users than there are seats all try to join the same lobby
+        '''
+        host = self.hub.add_user("host")
+        await self.hub.run_command(self.bot, host, channel, f"c!play --max {self.MAX_PLAYERS}")
+        users = [self.hub.add_user(f"joiner{i}") for i in range(self.num_commands)]
+        await self._burst(channel, ((user, "c!join") for user in users))
+        game = self.bot.get_game(channel.id)
+        claimed = sum(1 for user in users if self.bot.is_in_game(user.id))
+        return (game.player_count() == self.MAX_PLAYERS and claimed == self.MAX_PLAYERS - 1,
+                f"{self.num_commands} x c!join -> {game.player_count()}/{self.MAX_PLAYERS} players, "
+                f"{claimed} joiners claimed")
+
+    async def action_race(self, channel):
+        '''
+        The player whose turn it is sends the same action many times at once
+        '''
+        game, users = await self._start_game(channel)
+        player = game.get_turn()
+        coins = player.get_coins()
+        await self._burst(channel, ((player.get_user(), "c!income") for _ in range(self.num_commands)))
+        applied = self.completed.get((channel.id, 'income'), 0)
+        gained = player.get_coins() - coins
+        return (applied == 1 and gained == 1,
+                f"{self.num_commands} x c!income -> {applied} applied, +{gained} coins")
+
+    async def block_race(self, channel):
+        '''
+        Every other player tries to block the same Foreign Aid at once
+        '''
+        game, users = await self._start_game(channel)
+        player = game.get_turn()
+        await self.hub.run_command(self.bot, player.get_user(), channel, "c!foreignaid")
+        others = [user for user in users if user.id != player.get_id()]
+        await self._burst(channel, ((others[i % len(others)], "c!block") for i in range(self.num_commands)))
+        applied = self.completed.get((channel.id, 'block'), 0)
+        return (applied == 1 and game.response is not None,
+                f"{self.num_commands} x c!block from {len(others)} players -> {applied} applied")
+
+    async def _start_game(self, channel):
+        '''
+        Creates and starts a full game in the channel
+        Return: tuple of (CoupGame, list of FakeUser playing)
+        '''
+        users = [self.hub.add_user(f"player{i}") for i in range(self.MAX_PLAYERS)]
+        await self.hub.run_command(self.bot, users[0], channel, f"c!play --max {self.MAX_PLAYERS}")
+        for user in users[1:]:
+            await self.hub.run_command(self.bot, user, channel, "c!join")
+        await self.hub.run_command(self.bot, users[0], channel, "c!start")
+        return self.bot.get_game(channel.id), users
+
+    async def _burst(self, channel, commands):
+        '''
+        Sends commands to a channel all at once, and waits for every one of
+        them to finish
+        channel: FakeTextChannel to send the commands in
+        commands: iterable of (FakeUser, str), representing who sends what
+        '''
+        await asyncio.gather(*(self.hub.run_command(self.bot, user, channel, content)
+                               for user, content in commands))
+        # let the command_completion events (tasks) be counted
+        await asyncio.sleep(0.1)
+
+    async def _slow_check(self, ctx):
+        '''
+        Makes every command wait between its checks and its body, like
+        checks that wait on the network do, so commands that were not kept
+        apart would all pass their checks before any of them changed the game
+        '''
+        await asyncio.sleep(self.check_delay)
+        return True
+
+    async def _on_command_completion(self, ctx):
+        '''
+        Counts the commands that ran to completion, per channel
+        '''
+        key = (ctx.channel.id, ctx.command.qualified_name)
+        self.completed[key] = self.completed.get(key, 0) + 1
+
+
+async def main(args):
+    '''
+    Runs the stress test against a bot attached to a fake Discord
+    '''
+    # imported here so the test can be used with any bot
+    from coup_bot import CoupBot
+
+    hub = FakeDiscord(send_delay=args.send_delay / 1000, keep_log=False)
+    bot = CoupBot(command_prefix="c!", metrics_port=0)
+    hub.attach(bot)
+    bot.outbound.set_rate(10 ** 6, 1.0)
+    print(f"Sending {args.commands} commands at once to each game")
+    try:
+        passed = await MailboxStress(bot, hub, args.commands, check_delay=args.check_delay / 1000).run()
+    finally:
+        await bot.close()
+    if not passed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send many commands at once to one game, "
+                                                 "checking exactly one of each conflicting move runs")
+    parser.add_argument('--commands', type=int, default=300, help="commands in each burst")
+    parser.add_argument('--send-delay', type=float, default=1.0,
+                        help="milliseconds every message send takes, so commands overlap")
+    parser.add_argument('--check-delay', type=float, default=1.0,
+                        help="milliseconds every command's checks take, so commands overlap")
+    asyncio.run(main(parser.parse_args()))